@@ -0,0 +1,248 @@
+"""
+Times the build pipeline on a synthetic site of configurable size, so changes to
+scan_src, process_md_files, convert_md_to_html or cli_build can be compared across commits.
+
+The site is generated from a fixed seed (same settings = same md files) with the
+static/, templates/ and config.yaml that vai init copies, so it runs offline.
+Every measurement runs in a fresh process on a fresh copy of the site:
+
+    scan_src              scanning src_md
+    build                 a full vai run build into src_html (cold caches)
+    build (no changes)    the same build again, everything cached
+    cli_build             vai build into dist (cold caches)
+
+For each it reports the median wall time, pages/sec, peak RSS (of the process and of the
+largest render worker with -j) and the time of every stage (see vai/profiler.py).
+Results are saved as json, by default to benchmarks/results/<commit>.json, and
+--compare prints the change against a previously saved file.
+
+Usage (from the repo root):
+    python benchmarks/bench_build.py [--sections N] [--pages N] [--headings N] [--code-blocks N]
+                                     [--admonitions N] [--tables N] [--seed N] [--repeat N] [-j N]
+                                     [--output FILE] [--compare FILE]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+PACKAGE_DEFAULTS = REPO_ROOT / 'vai' / 'package_defaults'
+
+WORDS = (
+    "install config page build site theme sidebar search index render markdown static "
+    "template layout heading section deploy server cache python table code block note "
+    "warning asset image link anchor slug option value default release update feature"
+).split()
+
+CODE_SAMPLES = {
+    "python": 'def {name}(value):\n    """{words}"""\n    result = [item * 2 for item in range(value)]\n    return sum(result)\n',
+    "javascript": 'function {name}(value) {{\n  // {words}\n  const result = [...Array(value).keys()].map((item) => item * 2);\n  return result.reduce((a, b) => a + b, 0);\n}}\n',
+    "bash": '# {words}\nfor file in src_md/*/*.md; do\n  echo "{name} $file"\ndone\n',
+}
+
+ADMONITION_TYPES = ['note', 'tip', 'warning', 'danger']
+
+# runs in the measured process, cwd is the site
+MEASURE_SCRIPT = '''
+import contextlib, io, json, resource, sys, time
+from vai.profiler import build_profiler
+import vai.main as vai_main
+
+command, jobs, result_path = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+build_profiler.enable()
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    if command == 'scan_src':
+        vai_main.scan_src(src_dir_path='src_md')
+    elif command == 'build':
+        vai_main.build(jobs=jobs)
+    elif command == 'cli_build':
+        vai_main.cli_build(jobs=jobs)
+seconds = time.perf_counter() - start
+
+rss_unit = 1 if sys.platform == 'darwin' else 1024  # ru_maxrss is in bytes on macOS, KiB on Linux
+with open(result_path, 'w', encoding='utf-8') as f:
+    f.write(json.dumps({
+        "seconds": seconds,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_unit / 2**20,
+        "workers_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * rss_unit / 2**20,
+        "stages": {name: stage["total"] for name, stage in build_profiler.get_stage_summary().items()},
+    }))
+'''
+
+
+def make_sentence(rng, length=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(length)).capitalize() + '.'
+
+
+def make_page(rng, title, settings):
+    parts = []
+    if rng.random() < 0.5:
+        parts.append(f"+++\ntitle: {title}\ndate: 1st January 2025\n+++\n")
+    parts.append(f"# {title}\n\n{make_sentence(rng, 30)}\n")
+
+    headings = max(1, settings.headings)
+    # code blocks, admonitions and tables are spread over the headings of the page
+    blocks = ['code'] * settings.code_blocks + ['admonition'] * settings.admonitions + ['table'] * settings.tables
+    rng.shuffle(blocks)
+    for h in range(headings):
+        level = 2 if h % 3 == 0 else 3
+        parts.append(f"{'#' * level} {make_sentence(rng, 3)[:-1]}\n\n{make_sentence(rng, 40)} `{rng.choice(WORDS)}` "
+                     f"[{rng.choice(WORDS)}](#{rng.choice(WORDS)})\n\n- {make_sentence(rng, 6)}\n- {make_sentence(rng, 6)}\n")
+        for block in blocks[h::headings]:
+            if block == 'code':
+                language = rng.choice(sorted(CODE_SAMPLES))
+                code = CODE_SAMPLES[language].format(name=f"{rng.choice(WORDS)}_{rng.randrange(1000)}", words=make_sentence(rng, 8))
+                parts.append(f"```{language}\n{code}```\n")
+            elif block == 'admonition':
+                parts.append(f":::{rng.choice(ADMONITION_TYPES)}\n{make_sentence(rng, 20)}\n:::\n")
+            else:
+                columns = rng.randrange(3, 6)
+                rows = [' | '.join(rng.choice(WORDS) for _ in range(columns)) for _ in range(rng.randrange(3, 10))]
+                parts.append('\n'.join([rows[0], ' | '.join(['---'] * columns)] + rows[1:]) + '\n')
+    return '\n'.join(parts)
+
+
+def generate_site(site_dir, settings):
+    """writes a synthetic site to site_dir and returns its number of pages"""
+    rng = random.Random(settings.seed)
+    shutil.copytree(PACKAGE_DEFAULTS / 'static', site_dir / 'static')
+    shutil.copytree(PACKAGE_DEFAULTS / 'templates', site_dir / 'templates')
+    shutil.copy(PACKAGE_DEFAULTS / 'config.yaml', site_dir / 'config.yaml')
+    (site_dir / 'src_html').mkdir()
+    for section in range(1, settings.sections + 1):
+        section_dir = site_dir / 'src_md' / f"{section}-Section {section}"
+        section_dir.mkdir(parents=True)
+        for page in range(1, settings.pages + 1):
+            page_text = make_page(rng, f"Page {section}.{page}", settings)
+            (section_dir / f"{page}-Page {page}.md").write_text(page_text, encoding='utf-8')
+    return settings.sections * settings.pages
+
+
+def measure(site_dir, command, jobs):
+    env = dict(os.environ, PYTHONPATH=str(REPO_ROOT))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        result_path = Path(tmp_dir) / 'result.json'
+        result = subprocess.run(
+            [sys.executable, '-c', MEASURE_SCRIPT, command, str(jobs), str(result_path)],
+            cwd=site_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        if result.returncode != 0:
+            print(result.stderr[-2000:])
+            sys.exit(1)
+        return json.loads(result_path.read_text(encoding='utf-8'))
+
+
+def run_benchmark(name, site_dir, commands, jobs, repeat, page_count):
+    """runs commands (the last one is measured) on a fresh copy of the site, repeat times"""
+    runs = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            site_copy = Path(tmp_dir) / 'site'
+            shutil.copytree(site_dir, site_copy)
+            for command in commands:
+                run = measure(site_copy, command, jobs)
+            runs.append(run)
+    median_run = sorted(runs, key=lambda run: run["seconds"])[len(runs) // 2]
+    seconds = statistics.median(run["seconds"] for run in runs)
+    result = {
+        "seconds": seconds,
+        "pages_per_sec": page_count / seconds if seconds else None,
+        "peak_rss_mb": max(run["peak_rss_mb"] for run in runs),
+        "workers_peak_rss_mb": max(run["workers_peak_rss_mb"] for run in runs),
+        "stages": median_run["stages"],
+    }
+    print(
+        f"{name:<20}{seconds * 1000:>10.1f} ms{result['pages_per_sec'] or 0:>12.1f} pages/s"
+        f"{result['peak_rss_mb']:>10.1f} MB" + (f" (workers {result['workers_peak_rss_mb']:.1f} MB)" if jobs > 1 else "")
+    )
+    return result
+
+
+def get_commit():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_comparison(results, baseline):
+    if baseline["settings"] != results["settings"]:
+        print("Warning: the baseline was run with other settings, the numbers are not comparable.")
+    print(f"\ncompared with {baseline['commit']} (median wall time)")
+    for name, result in results["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if not base:
+            continue
+        change = (result["seconds"] - base["seconds"]) / base["seconds"] * 100 if base["seconds"] else 0.0
+        print(f"{name:<20}{base['seconds'] * 1000:>10.1f} ms -> {result['seconds'] * 1000:>10.1f} ms  {change:+6.1f}%")
+        for stage, seconds in result["stages"].items():
+            base_seconds = base["stages"].get(stage)
+            if base_seconds and seconds > 0.01 * result["seconds"]:
+                print(f"    {stage:<22}{base_seconds * 1000:>10.1f} ms -> {seconds * 1000:>10.1f} ms  {(seconds - base_seconds) / base_seconds * 100:+6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sections', type=int, default=10)
+    parser.add_argument('--pages', type=int, default=20, help="pages per section")
+    parser.add_argument('--headings', type=int, default=8, help="headings per page")
+    parser.add_argument('--code-blocks', type=int, default=3, help="code blocks per page")
+    parser.add_argument('--admonitions', type=int, default=2, help="admonitions per page")
+    parser.add_argument('--tables', type=int, default=1, help="tables per page")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('--output', help="where to save the results (default: benchmarks/results/<commit>.json)")
+    parser.add_argument('--compare', help="results saved by an earlier run to compare with")
+    args = parser.parse_args()
+
+    settings = {key: getattr(args, key) for key in ('sections', 'pages', 'headings', 'code_blocks', 'admonitions', 'tables', 'seed', 'jobs')}
+    results = {
+        "commit": get_commit(),
+        "date": datetime.datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": settings,
+        "benchmarks": {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        site_dir = Path(tmp_dir) / 'site'
+        site_dir.mkdir()
+        page_count = generate_site(site_dir, args)
+        print(f"{page_count} pages ({args.sections} sections), median of {args.repeat} runs, commit {results['commit']}")
+        benchmarks = {
+            'scan_src': ['scan_src'],
+            'build': ['build'],
+            'build (no changes)': ['build', 'build'],
+            'cli_build': ['cli_build'],
+        }
+        for name, commands in benchmarks.items():
+            results["benchmarks"][name] = run_benchmark(name, site_dir, commands, args.jobs, args.repeat, page_count)
+
+    output_path = Path(args.output) if args.output else REPO_ROOT / 'benchmarks' / 'results' / f"{results['commit']}.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(results, indent=2), encoding='utf-8')
+    print(f"Results saved to '{output_path}'.")
+
+    if args.compare:
+        print_comparison(results, json.loads(Path(args.compare).read_text(encoding='utf-8')))
+
+
+if __name__ == "__main__":
+    main()
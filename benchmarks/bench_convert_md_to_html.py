@@ -0,0 +1,68 @@
+"""
+Compares the per page cost of converting md to html with a fresh Markdown
+instance per page (how vai used to do it) against the shared converter
+used by convert_md_to_html. Both go through the same highlight cache, it is
+cleared before each timed run so only building the converter differs.
+
+Usage (from the repo root):
+    python benchmarks/bench_convert_md_to_html.py [src_md dir] [--repeat N]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from vai.main import parse_metadata_and_body_from_string
+from vai.markdown_converter import convert_md_to_html, create_markdown_converter, highlight_cache
+
+
+def convert_with_fresh_converter(md_body_text):
+    return create_markdown_converter().convert(md_body_text)
+
+
+def convert_with_shared_converter(md_body_text):
+    return convert_md_to_html(md_body_text)[0]
+
+
+def time_per_page(convert, md_bodies, repeat):
+    highlight_cache.clear()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for md_body in md_bodies:
+            convert(md_body)
+    return (time.perf_counter() - start) / (repeat * len(md_bodies))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('src_md', nargs='?', default='docs/src_md')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    md_bodies = []
+    for md_path in sorted(Path(args.src_md).glob('*/*.md')):
+        _, md_body = parse_metadata_and_body_from_string(md_path.read_text(encoding='utf-8'))
+        md_bodies.append(md_body)
+    if not md_bodies:
+        print(f"No md files found in '{args.src_md}'.")
+        return
+
+    # the shared converter must give exactly the same html as a fresh one
+    for md_body in md_bodies:
+        if convert_with_shared_converter(md_body) != convert_with_fresh_converter(md_body):
+            print("Error: shared converter output differs from a fresh converter.")
+            sys.exit(1)
+
+    fresh = time_per_page(convert_with_fresh_converter, md_bodies, args.repeat)
+    shared = time_per_page(convert_with_shared_converter, md_bodies, args.repeat)
+
+    print(f"pages: {len(md_bodies)}, repeat: {args.repeat}")
+    print(f"fresh converter per page:  {fresh * 1000:.3f} ms/page")
+    print(f"shared converter (reset):  {shared * 1000:.3f} ms/page")
+    print(f"speedup: {fresh / shared:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
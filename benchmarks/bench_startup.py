@@ -0,0 +1,82 @@
+"""
+Measures how long each vai subcommand takes from process start, and which of the
+heavy third party packages it imported on the way.
+
+`init` runs in an empty temporary dir and `build` on a temporary copy of a site.
+`run` serves forever, so for it only the imports it needs before serving are timed.
+
+Usage (from the repo root):
+    python benchmarks/bench_startup.py [site dir] [--repeat N]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+HEAVY_PACKAGES = ['markdown', 'pygments', 'jinja2', 'yaml', 'livereload', 'tornado', 'minify_html', 'rcssmin', 'rjsmin']
+
+RUN_IMPORTS = 'import vai.main, vai.markdown_converter, jinja2, livereload'
+
+
+def run_command(args, cwd):
+    """runs python with args and returns (seconds, heavy packages imported)"""
+    env = dict(os.environ, PYTHONPATH=str(REPO_ROOT))
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', *args],
+        cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        sys.exit(1)
+
+    imported = set()
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:'):
+            imported.add(line.rsplit('|', 1)[-1].strip().split('.')[0])
+    return elapsed, [package for package in HEAVY_PACKAGES if package in imported]
+
+
+def time_command(name, args, prepare_dir, repeat):
+    timings = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cwd = prepare_dir(Path(tmp_dir))
+            elapsed, imported = run_command(args, cwd)
+            timings.append(elapsed)
+    print(f"{name:<8} {statistics.median(timings) * 1000:8.1f} ms   imports: {', '.join(imported) or '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('site', nargs='?', default='docs')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    site = Path(args.site).resolve()
+
+    def empty_dir(tmp_dir):
+        return tmp_dir
+
+    def site_copy(tmp_dir):
+        site_dir = tmp_dir / 'site'
+        shutil.copytree(site, site_dir, ignore=shutil.ignore_patterns('dist', '.vai_cache'))
+        (site_dir / 'src_html').mkdir(exist_ok=True)
+        return site_dir
+
+    print(f"median of {args.repeat} runs, process start to exit")
+    time_command('--help', ['-m', 'vai.main', '--help'], empty_dir, args.repeat)
+    time_command('init', ['-m', 'vai.main', 'init'], empty_dir, args.repeat)
+    time_command('build', ['-m', 'vai.main', 'build'], site_copy, args.repeat)
+    time_command('run', ['-c', RUN_IMPORTS], empty_dir, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
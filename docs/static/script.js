@@ -1,32 +1,36 @@
     // --- Code Block Highlighting (Highlight.js) ---
-if (typeof hljs !== 'undefined') {
-    const codeHiliteDivs = document.querySelectorAll('div.codehilite');
-    codeHiliteDivs.forEach(div => {
-        const preElement = div.querySelector('pre');
-        const codeElement = preElement ? preElement.querySelector('code') : null;
-
-        if (codeElement) {
-            let fullText = codeElement.textContent || codeElement.innerText || "";
-            fullText = fullText.trim();
-            const match = fullText.match(/^```(\S+)\s*\n([\s\S]*?)\n?```$/);
-
-            if (match) {
-                const language = match[1].toLowerCase();
-                let actualCode = match[2];
-                if (actualCode.endsWith('\n')) {
-                    actualCode = actualCode.slice(0, -1);
+// run again for every page swapped in by client navigation (section 9)
+function highlightCodeBlocks() {
+    if (typeof hljs !== 'undefined') {
+        const codeHiliteDivs = document.querySelectorAll('div.codehilite');
+        codeHiliteDivs.forEach(div => {
+            const preElement = div.querySelector('pre');
+            const codeElement = preElement ? preElement.querySelector('code') : null;
+
+            if (codeElement) {
+                let fullText = codeElement.textContent || codeElement.innerText || "";
+                fullText = fullText.trim();
+                const match = fullText.match(/^```(\S+)\s*\n([\s\S]*?)\n?```$/);
+
+                if (match) {
+                    const language = match[1].toLowerCase();
+                    let actualCode = match[2];
+                    if (actualCode.endsWith('\n')) {
+                        actualCode = actualCode.slice(0, -1);
+                    }
+                    codeElement.textContent = actualCode;
+                    codeElement.className = `language-${language}`; // Set class for hljs
+                    hljs.highlightElement(codeElement); // Apply highlighting markup
+                } else {
+                    console.warn("Code block format not matched...");
                 }
-                codeElement.textContent = actualCode;
-                codeElement.className = `language-${language}`; // Set class for hljs
-                hljs.highlightElement(codeElement); // Apply highlighting markup
-            } else {
-                console.warn("Code block format not matched...");
             }
-        }
-    });
-} else {
-    console.warn('Highlight.js library (hljs) not loaded.');
+        });
+    } else {
+        console.warn('Highlight.js library (hljs) not loaded.');
+    }
 }
+highlightCodeBlocks();
 
 // --- Highlight.js Theme Management ---
 const highlightJsThemeLink = document.getElementById('highlight-js-theme');
@@ -72,7 +76,7 @@ function activateSidebarLink(linkToActivate) {
     }
 }
 
-(function initializeActiveSidebarLink() {
+function initializeActiveSidebarLink() {
     const currentPath = window.location.pathname;
     const sidebarLinks = document.querySelectorAll('.sidebar-nav-links li a');
     let linkToActivate = null;
@@ -118,22 +122,25 @@ function activateSidebarLink(linkToActivate) {
             activateSidebarLink(linkToActivate);
         }
     }
-})();
+}
 
 
-    const navButtons = document.querySelectorAll('.page-navigation-boxes .nav-box');
-    navButtons.forEach(buttonElement => {
-        if (buttonElement.tagName === 'BUTTON') {
-            const linkElement = buttonElement.querySelector('a.nav-box-link');
-            if (linkElement && linkElement.href) {
-                buttonElement.addEventListener('click', (event) => {
-                    if (!event.target.closest('a.nav-box-link')) {
-                        window.location.href = linkElement.href;
-                    }
-                });
+    function initializeNavButtons() {
+        const navButtons = document.querySelectorAll('.page-navigation-boxes .nav-box');
+        navButtons.forEach(buttonElement => {
+            if (buttonElement.tagName === 'BUTTON') {
+                const linkElement = buttonElement.querySelector('a.nav-box-link');
+                if (linkElement && linkElement.href) {
+                    buttonElement.addEventListener('click', (event) => {
+                        if (!event.target.closest('a.nav-box-link')) {
+                            goToPage(linkElement.href);
+                        }
+                    });
+                }
             }
-        }
-    });
+        });
+    }
+    initializeNavButtons();
 
     // --- Element References ---
     const htmlElement = document.documentElement;
@@ -141,7 +148,7 @@ function activateSidebarLink(linkToActivate) {
     const themeToggleButton = document.getElementById('themeToggle');
     const tocContainerElement = document.getElementById('toc-container');
     const tocLinksContainer = document.getElementById('toc-links');
-    const tocActiveMarker = document.getElementById('toc-active-marker');
+    let tocActiveMarker = document.getElementById('toc-active-marker');
     let tocLinks = tocLinksContainer ? Array.from(tocLinksContainer.getElementsByTagName('a')) : [];
     const searchTriggerButton = document.getElementById('searchTrigger');
     const searchOverlayEl = document.getElementById('searchOverlay');
@@ -179,7 +186,12 @@ function activateSidebarLink(linkToActivate) {
     const MAX_HISTORY_ITEMS = 5;
     let searchHistory = JSON.parse(localStorage.getItem(SEARCH_HISTORY_KEY)) || [];
     let currentKeyboardFocusedIndex = -1;
-    let searchIndexData = []; 
+    let searchWorker = null; // loads the search index and matches queries, see static/search_worker.js
+    let searchWorkerReady = false;
+    const pendingSearches = new Map(); // search id -> resolve of the promise of its results
+    let searchDebounceTimer = null;
+    let latestSearchId = 0; // results of older (stale) searches are dropped
+    const clientNavigationEnabled = !!document.querySelector('meta[name="vai-client-navigation"]') && 'fetch' in window && !!history.pushState; // see section 9
 
     // --- Configuration for Scroll Spy & Click Navigation ---
     const APP_HEADER_ELEMENT = document.querySelector('.app-header');
@@ -247,90 +259,128 @@ function activateSidebarLink(linkToActivate) {
     applyTheme(getInitialTheme());
 
     // --- 2. Table of Contents (Scroll Spy & Active Marker) ---
-    if (tocLinks.length > 0) {
+    // Scrolling never reads the layout of the page: the positions of the sections and the toc links
+    // are measured up front (DMAN_measureToc, again after a resize or when the content changes size,
+    // e.g. an image loaded) and a scroll only compares scrollTop with them. The active link and the
+    // marker are written at most once per animation frame, and only when the active section changed.
+    let tocSectionIds = []; // in page order
+    const tocLinksById = new Map(); // section id -> its toc link
+    let tocSectionScrollTops = []; // scrollTop at which the text of each section sits below the header
+    const tocLinkPositions = new Map(); // section id -> {top, height} of its toc link
+    let tocMaxScrollTop = 0;
+    let tocContainerScrollable = false;
+    let tocLayoutStale = true;
+    let activeTocSectionId = null;
+    let scrollSpyFrame = null;
+
+    function getTocSectionId(link) {
+        // data-toc-id is written by generate_heading_links in vai/main.py, pages built before it only have the href
+        if (link.dataset.tocId) return link.dataset.tocId;
+        const href = link.getAttribute('href');
+        return href?.startsWith('#') ? href.substring(1) : null;
+    }
+
+    function DMAN_initializeToc() {
+        // the toc (and its marker) are replaced when client navigation swaps in another page
+        tocActiveMarker = document.getElementById('toc-active-marker');
+        tocLinks = tocLinksContainer ? Array.from(tocLinksContainer.getElementsByTagName('a')) : [];
+        Object.keys(tocSections).forEach(sectionId => delete tocSections[sectionId]);
+        tocSectionIds = [];
+        tocLinksById.clear();
         tocLinks.forEach(link => {
-            const href = link.getAttribute('href');
-            if (href?.startsWith('#')) {
-                const sectionId = href.substring(1);
-                const sectionElement = document.getElementById(sectionId);
-                if (sectionElement) {
-                    const paddingTop = parseFloat(getComputedStyle(sectionElement).paddingTop) || 0;
-                    tocSections[sectionId] = { element: sectionElement, paddingTop: paddingTop };
-                }
+            const sectionId = getTocSectionId(link);
+            const sectionElement = sectionId ? document.getElementById(sectionId) : null;
+            if (sectionElement && !tocSections[sectionId]) {
+                const paddingTop = parseFloat(getComputedStyle(sectionElement).paddingTop) || 0;
+                tocSections[sectionId] = { element: sectionElement, paddingTop: paddingTop };
+                tocSectionIds.push(sectionId);
+                tocLinksById.set(sectionId, link);
             }
         });
+        activeTocSectionId = null;
+        tocLayoutStale = true;
+    }
+    DMAN_initializeToc();
+
+    function DMAN_measureToc() {
+        // reads only, done in the frame before its writes
+        tocSectionScrollTops = tocSectionIds.map(sectionId => {
+            const sectionData = tocSections[sectionId];
+            sectionData.paddingTop = parseFloat(getComputedStyle(sectionData.element).paddingTop) || 0;
+            const textVisibleStartingPoint = sectionData.element.offsetTop + sectionData.paddingTop;
+            return textVisibleStartingPoint - DYNAMIC_HEADER_OFFSET - DESIRED_TEXT_GAP_BELOW_HEADER;
+        });
+        tocLinkPositions.clear();
+        tocLinksById.forEach((link, sectionId) => {
+            tocLinkPositions.set(sectionId, { top: link.offsetTop, height: link.offsetHeight });
+        });
+        tocMaxScrollTop = mainScroller ? mainScroller.scrollHeight - mainScroller.clientHeight : 0;
+        tocContainerScrollable = !!tocContainerElement && tocContainerElement.scrollHeight > tocContainerElement.clientHeight;
+        tocLayoutStale = false;
+    }
+
+    // measures again in the next frame, for changes that move the sections or the toc links
+    function DMAN_refreshToc() {
+        tocLayoutStale = true;
+        updateActiveLinkAndMarker();
     }
 
     function updateActiveLinkAndMarker() {
-        if (!mainScroller || !tocLinksContainer || !tocActiveMarker || tocLinks.length === 0) {
-            if (tocActiveMarker) tocActiveMarker.style.opacity = '0';
-            if (tocLinks) tocLinks.forEach(link => link.classList.remove('active'));
-            return;
-        }
-        const sectionIds = Object.keys(tocSections);
-        if (sectionIds.length === 0) {
+        if (scrollSpyFrame === null) scrollSpyFrame = requestAnimationFrame(applyActiveLinkAndMarker);
+    }
+
+    function applyActiveLinkAndMarker() {
+        scrollSpyFrame = null;
+        if (!mainScroller || !tocLinksContainer || !tocActiveMarker || tocSectionIds.length === 0) {
             if (tocActiveMarker) tocActiveMarker.style.opacity = '0';
             tocLinks.forEach(link => link.classList.remove('active'));
+            activeTocSectionId = null;
             return;
         }
+        const remeasured = tocLayoutStale;
+        if (remeasured) DMAN_measureToc();
+
+        // the last section whose text has reached the header (the first one before that), or
+        // the last one once the page is scrolled to the bottom
         const contentScrollTop = mainScroller.scrollTop;
-        let currentSectionId = null;
-        for (let i = sectionIds.length - 1; i >= 0; i--) {
-            const id = sectionIds[i];
-            const sectionData = tocSections[id];
-            if (sectionData?.element) {
-                const textVisibleStartingPoint = sectionData.element.offsetTop + sectionData.paddingTop;
-                const targetScrollTopForSectionText = textVisibleStartingPoint - DYNAMIC_HEADER_OFFSET - DESIRED_TEXT_GAP_BELOW_HEADER;
-                if (targetScrollTopForSectionText - SCROLL_SPY_ACTIVATION_LEEWAY <= contentScrollTop) {
-                    currentSectionId = id;
-                    break;
-                }
+        let currentIndex = 0;
+        for (let i = tocSectionScrollTops.length - 1; i >= 0; i--) {
+            if (tocSectionScrollTops[i] - SCROLL_SPY_ACTIVATION_LEEWAY <= contentScrollTop) {
+                currentIndex = i;
+                break;
             }
         }
-        if (currentSectionId === null && sectionIds.length > 0) {
-            const firstSectionData = tocSections[sectionIds[0]];
-            if (firstSectionData?.element) {
-               const textVisibleStartingPoint = firstSectionData.element.offsetTop + firstSectionData.paddingTop;
-               const targetScrollTopForFirstSectionText = textVisibleStartingPoint - DYNAMIC_HEADER_OFFSET - DESIRED_TEXT_GAP_BELOW_HEADER;
-               if (contentScrollTop < targetScrollTopForFirstSectionText + SCROLL_SPY_ACTIVATION_LEEWAY) {
-                    currentSectionId = sectionIds[0];
-               }
-            }
-            if (currentSectionId === null && contentScrollTop < (tocSections[sectionIds[0]]?.element.offsetTop || 0) ) { 
-                currentSectionId = sectionIds[0]; 
-            }
-       }
         const epsilon = 5; 
-        if ((mainScroller.scrollTop + mainScroller.clientHeight >= mainScroller.scrollHeight - epsilon) && sectionIds.length > 0) {
-            currentSectionId = sectionIds[sectionIds.length - 1];
+        if (contentScrollTop >= tocMaxScrollTop - epsilon) {
+            currentIndex = tocSectionIds.length - 1;
         }
-        let activeLinkElement = null;
-        tocLinks.forEach(link => {
-            link.classList.remove('active');
-            if (link.getAttribute('href') === `#${currentSectionId}`) {
-                link.classList.add('active');
-                activeLinkElement = link;
-            }
-        });
-        if (activeLinkElement && tocContainerElement.scrollHeight > tocContainerElement.clientHeight) {
-            const linkTopInToc = activeLinkElement.offsetTop;
-            const linkHeight = activeLinkElement.offsetHeight;
-            const linkBottomInToc = linkTopInToc + linkHeight;
+        const currentSectionId = tocSectionIds[currentIndex];
+        if (currentSectionId === activeTocSectionId && !remeasured) return;
+
+        const activeLinkElement = tocLinksById.get(currentSectionId);
+        const linkPosition = tocLinkPositions.get(currentSectionId);
+        let tocScrollTarget = null;
+        if (tocContainerScrollable) {
+            const linkBottomInToc = linkPosition.top + linkPosition.height;
             const tocScrollTop = tocContainerElement.scrollTop;
             const tocClientHeight = tocContainerElement.clientHeight;
             const scrollPadding = 30;
-            if (linkTopInToc < tocScrollTop + scrollPadding) {
-                tocContainerElement.scrollTo({ top: Math.max(0, linkTopInToc - scrollPadding), behavior: 'smooth' });
+            if (linkPosition.top < tocScrollTop + scrollPadding) {
+                tocScrollTarget = Math.max(0, linkPosition.top - scrollPadding);
             } else if (linkBottomInToc > tocScrollTop + tocClientHeight - scrollPadding) {
-                tocContainerElement.scrollTo({ top: Math.min(linkBottomInToc - tocClientHeight + scrollPadding, tocContainerElement.scrollHeight - tocClientHeight), behavior: 'smooth' });
+                tocScrollTarget = Math.min(linkBottomInToc - tocClientHeight + scrollPadding, tocContainerElement.scrollHeight - tocClientHeight);
             }
         }
-        if (activeLinkElement) {
-            tocActiveMarker.style.top = `${activeLinkElement.offsetTop}px`;
-            tocActiveMarker.style.height = `${activeLinkElement.offsetHeight}px`;
-            tocActiveMarker.style.opacity = '1';
-        } else {
-            tocActiveMarker.style.opacity = '0';
+
+        // writes
+        tocLinksById.get(activeTocSectionId)?.classList.remove('active');
+        activeLinkElement.classList.add('active');
+        activeTocSectionId = currentSectionId;
+        tocActiveMarker.style.top = `${linkPosition.top}px`;
+        tocActiveMarker.style.height = `${linkPosition.height}px`;
+        tocActiveMarker.style.opacity = '1';
+        if (tocScrollTarget !== null) {
+            tocContainerElement.scrollTo({ top: tocScrollTarget, behavior: 'smooth' });
         }
     }
     if (tocLinksContainer) {
@@ -357,9 +407,14 @@ function activateSidebarLink(linkToActivate) {
             }
         });
     }
-    if (mainScroller && tocLinks.length > 0) {
-        mainScroller.addEventListener('scroll', updateActiveLinkAndMarker);
-        window.addEventListener('resize', updateActiveLinkAndMarker);
+    if (mainScroller && (tocLinks.length > 0 || clientNavigationEnabled)) {
+        mainScroller.addEventListener('scroll', updateActiveLinkAndMarker, { passive: true });
+        window.addEventListener('resize', DMAN_refreshToc);
+        // images, fonts and swapped in pages move the sections without a resize of the window
+        const contentAreaElement = document.getElementById('content-area');
+        if (contentAreaElement && 'ResizeObserver' in window) {
+            new ResizeObserver(DMAN_refreshToc).observe(contentAreaElement);
+        }
     }    
 // --- 3. Search Functionality ---
     function DMAN_saveSearchHistory(query) {
@@ -383,6 +438,7 @@ function activateSidebarLink(linkToActivate) {
     }
 
     function DMAN_displaySearchHistory() {
+        DMAN_cancelPendingSearch();
         currentKeyboardFocusedIndex = -1;
         searchHistoryContainer.innerHTML = ''; 
         searchResultsContainer.innerHTML = '';
@@ -441,6 +497,7 @@ function activateSidebarLink(linkToActivate) {
     function DMAN_closeSearchModal() {
         if (!isSearchModalActive || !searchOverlayEl) return;
         isSearchModalActive = false; 
+        DMAN_cancelPendingSearch();
         if (searchOverlayEl) searchOverlayEl.classList.remove('active');
         if (searchInput) {
             searchInput.value = ''; 
@@ -454,173 +511,105 @@ function activateSidebarLink(linkToActivate) {
         updateBodyScrollAndOverlay();
     }
     
-    async function DMAN_fetchSearchIndex() {
+    // --- Search (in a Web Worker, see static/search_worker.js) ---
+    // The worker fetches and parses the sharded search index (see build_search_index in vai/main.py)
+    // and matches the queries, this thread only renders the results. The worker sits next to this
+    // script, so the url stays right with a base path. With content hashed names (vai build --hash-assets)
+    // the script tag names the hashed copy of the worker in data-search-worker.
+    const SEARCH_INDEX_URL = '/search_index/';
+    const SEARCH_WORKER_URL = document.currentScript
+        ? new URL(document.currentScript.dataset.searchWorker || 'search_worker.js', document.currentScript.src)
+        : '/static/search_worker.js';
+    const SEARCH_DEBOUNCE_MS = 80; // typing faster than this only searches for the last query
+    const MAX_SEARCH_RESULTS = 15;
+
+    function DMAN_startSearchWorker() {
         try {
-            const response = await fetch('/search_index.json');
-            if (!response.ok) {
-                console.error('Failed to load search index:', response.statusText);
-                DMAN_clearSearchResultsDisplay("Search is currently unavailable.");
-                return;
-            }
-            searchIndexData = await response.json();
-            if (!searchInput || !searchInput.value.trim()) {
-                 DMAN_clearSearchResultsDisplay("Start typing to see results.");
-            }
+            searchWorker = new Worker(SEARCH_WORKER_URL);
         } catch (error) {
-            console.error('Error fetching or parsing search index:', error);
-            DMAN_clearSearchResultsDisplay("Error loading search. Please try again later.");
+            console.error('Error starting the search worker:', error);
+            DMAN_clearSearchResultsDisplay("Search is currently unavailable.");
+            return;
         }
+        searchWorker.addEventListener('message', (event) => {
+            const message = event.data;
+            if (message.type === 'ready') {
+                searchWorkerReady = true;
+                if (!searchInput || !searchInput.value.trim()) {
+                     DMAN_clearSearchResultsDisplay("Start typing to see results.");
+                }
+            } else if (message.type === 'error') {
+                console.error(message.message);
+                DMAN_clearSearchResultsDisplay("Error loading search. Please try again later.");
+            } else if (message.type === 'results') {
+                const resolve = pendingSearches.get(message.id);
+                pendingSearches.delete(message.id);
+                if (resolve) resolve(message.results === null ? null : message);
+            }
+        });
+        searchWorker.addEventListener('error', (error) => {
+            console.error('Error in the search worker:', error.message || error);
+            searchWorkerReady = false;
+            DMAN_clearSearchResultsDisplay("Search is currently unavailable.");
+            pendingSearches.forEach(resolve => resolve(null));
+            pendingSearches.clear();
+        });
+        // sections of the sidebar are offered as results of their own
+        const sections = sidebarData
+            .filter(section => section.files && section.files.length > 0)
+            .map(section => ({ title: section.title, url: `/${section.output_folder_name}/${section.files[0].slug}/` }));
+        searchWorker.postMessage({ type: 'init', indexUrl: new URL(SEARCH_INDEX_URL, window.location.origin).href, sections });
     }
-    
-    function highlightText(text, query) {
-        if (!text || !query || query.trim().length < 1) return String(text || ""); // Ensure text is string
-
-        const trimmedQuery = query.trim();
-        const originalText = String(text); // Work with original casing for output
-        const lowerText = originalText.toLowerCase();
-        const lowerQuery = trimmedQuery.toLowerCase();
-        
-        if (lowerQuery.length === 0) return originalText;
-
-        const startIndex = lowerText.indexOf(lowerQuery);
-
-        if (startIndex === -1) {
-            return originalText; 
-        }
 
-        let resultHTML = originalText.substring(0, startIndex) +
-                         "<mark>" + originalText.substring(startIndex, startIndex + trimmedQuery.length) + "</mark>" +
-                         originalText.substring(startIndex + trimmedQuery.length);
-        
-        return resultHTML;
+    // promise of {results (the first MAX_SEARCH_RESULTS), total} for a query, null if a newer search dropped it
+    function DMAN_requestSearchResults(searchId, query) {
+        return new Promise(resolve => {
+            pendingSearches.set(searchId, resolve);
+            searchWorker.postMessage({ type: 'search', id: searchId, query, limit: MAX_SEARCH_RESULTS });
+        });
     }
 
-    function generateSimpleSnippet(fullText, lowerQuery, originalQuery, maxLength = 150) {
-        if (!fullText || !originalQuery) return "Preview not available.";
-        const S_fullText = String(fullText); // Ensure it's a string
-        const S_lowerQuery = String(lowerQuery || "").toLowerCase();
-
-        if (S_lowerQuery.length === 0) {
-             return highlightText(S_fullText.substring(0, maxLength) + (S_fullText.length > maxLength ? "..." : ""), originalQuery);
-        }
-
-        const lowerFullText = S_fullText.toLowerCase();
-        let matchStartIndex = lowerFullText.indexOf(S_lowerQuery);
-
-        if (matchStartIndex === -1) { 
-            return highlightText(S_fullText.substring(0, maxLength) + (S_fullText.length > maxLength ? "..." : ""), originalQuery);
-        }
-        
-        const queryActualLength = S_lowerQuery.length; // Use length of lowerQuery for calculations
-        const snippetRadius = Math.floor((maxLength - queryActualLength) / 2);
-        let snippetStart = Math.max(0, matchStartIndex - snippetRadius);
-        let snippetEnd = Math.min(S_fullText.length, matchStartIndex + queryActualLength + snippetRadius);
-
-        if (snippetStart > 0) {
-            const spaceBefore = lowerFullText.lastIndexOf(" ", snippetStart -1);
-            if (spaceBefore !== -1 && spaceBefore > snippetStart - 30) snippetStart = spaceBefore + 1;
-        }
-        if (snippetEnd < S_fullText.length) {
-            const spaceAfter = lowerFullText.indexOf(" ", snippetEnd); 
-            if (spaceAfter !== -1 && spaceAfter < snippetEnd + 30) snippetEnd = spaceAfter;
-        }
-        
-        let snippetText = S_fullText.substring(snippetStart, snippetEnd);
-        // Highlight using originalQuery to preserve its casing in the mark tag
-        let highlightedSnippet = highlightText(snippetText, originalQuery); 
+    // drops the debounced query and the results of a search that is still running
+    function DMAN_cancelPendingSearch() {
+        clearTimeout(searchDebounceTimer);
+        latestSearchId++;
+        if (searchWorker) searchWorker.postMessage({ type: 'cancel', id: latestSearchId });
+    }
 
-        return (snippetStart > 0 ? "..." : "") + highlightedSnippet + (snippetEnd < S_fullText.length ? "..." : "");
+    function DMAN_debounceSearch(query) {
+        clearTimeout(searchDebounceTimer);
+        searchDebounceTimer = setTimeout(() => DMAN_performSearch(query), SEARCH_DEBOUNCE_MS);
     }
 
-    function DMAN_performSearch(query) {
+    // renders the results of a query. Resolves to {results, total} once they are shown, null if they were dropped
+    async function DMAN_performSearch(query) {
+        clearTimeout(searchDebounceTimer);
+        const searchId = ++latestSearchId;
         currentKeyboardFocusedIndex = -1;
         searchHistoryContainer.style.display = 'none';
     
-        if (!searchIndexData || searchIndexData.length === 0 || !searchResultsContainer) {
+        if (!searchWorkerReady || !searchResultsContainer) {
             DMAN_clearSearchResultsDisplay("Search not ready or no data.");
-            return;
+            return null;
         }
         const trimmedQuery = query.trim();
-        const lowerQuery = trimmedQuery.toLowerCase();
     
         if (trimmedQuery.length === 0) {
             DMAN_displaySearchHistory();
-            return;
+            return null;
         }
     
-        let potentialResults = {}; 
-    
-        if (sidebarData && lowerQuery.length > 0) {
-            sidebarData.forEach(section => {
-                if (section.title.toLowerCase().startsWith(lowerQuery) && section.files && section.files.length > 0) {
-                    const firstFile = section.files[0];
-                    const url = `/${section.output_folder_name}/${firstFile.slug}/`;
-                    if (!potentialResults[url] || 0.0001 < (potentialResults[url].score || 1)) {
-                        potentialResults[url] = {
-                            type: 'section', 
-                            displayTitle: `Go to section: ${section.title}`,
-                            url: url,
-                            breadcrumbs: `Section: ${section.title}`,
-                            snippet: `Access all content within the '${section.title}' section.`,
-                            score: 0.0001,
-                        };
-                    }
-                }
-            });
-        }
-    
-        searchIndexData.forEach(item => {
-            if (item.searchable_text && item.searchable_text.includes(lowerQuery)) {
-                let score;
-                let isStartsWithMatch = false;
-    
-                if (item.type === 'heading') {
-                    isStartsWithMatch = item.heading_text && String(item.heading_text).toLowerCase().startsWith(lowerQuery);
-                    score = isStartsWithMatch ? 0.002 : 0.012; 
-                } else if (item.type === 'page') {
-                    isStartsWithMatch = item.page_title && String(item.page_title).toLowerCase().startsWith(lowerQuery);
-                    if (isStartsWithMatch) {
-                        score = 0.003;
-                    } else {
-                        isStartsWithMatch = item.breadcrumbs && String(item.breadcrumbs).toLowerCase().startsWith(lowerQuery);
-                        score = isStartsWithMatch ? 0.004 : 0.014;
-                    }
-                } else {
-                    score = 0.05; 
-                }
-                
-                if (!potentialResults[item.url] || score < (potentialResults[item.url].score || 1)) {
-                    let snippetSource = item.displayTitle; 
-                    if (item.type === 'heading' && item.heading_text && String(item.heading_text).toLowerCase().includes(lowerQuery)) {
-                        snippetSource = item.heading_text;
-                    } else if (item.type === 'page' && item.page_title && String(item.page_title).toLowerCase().includes(lowerQuery)) {
-                        snippetSource = item.page_title;
-                    } else if (item.breadcrumbs && String(item.breadcrumbs).toLowerCase().includes(lowerQuery)) {
-                         snippetSource = item.breadcrumbs;
-                    }
-    
-                    potentialResults[item.url] = {
-                        type: item.type,
-                        displayTitle: item.displayTitle,
-                        url: item.url,
-                        breadcrumbs: item.breadcrumbs, // Store the raw breadcrumbs
-                        snippet: generateSimpleSnippet(snippetSource, lowerQuery, trimmedQuery),
-                        score: score,
-                    };
-                }
-            }
-        });
-    
-        let allDisplayItems = Object.values(potentialResults);
-        allDisplayItems.sort((a, b) => (a.score || 1) - (b.score || 1));
+        const search = await DMAN_requestSearchResults(searchId, trimmedQuery);
+        // a newer query was typed (or the modal closed) while this one was running
+        if (!search || searchId !== latestSearchId) return null;
                 
-        const resultsToDisplay = allDisplayItems.slice(0, 15);
+        const resultsToDisplay = search.results;
         searchResultsContainer.innerHTML = '';
     
         if (resultsToDisplay.length === 0) {
             searchResultsContainer.innerHTML = `<p class="search-results-placeholder">No results found for "<strong></strong>"</p>`;
             searchResultsContainer.querySelector('strong').textContent = query;
-            return;
+            return search;
         }
     
         const ul = document.createElement('ul');
@@ -675,25 +664,26 @@ function activateSidebarLink(linkToActivate) {
                     // This is for a different page, so just navigate normally.
                     // The new page's load logic (from Change #2) will handle the scrolling.
                     DMAN_saveSearchHistory(trimmedQuery);
-                    window.location.href = targetHref;
+                    DMAN_closeSearchModal();
+                    goToPage(targetHref);
                 }
             });
 
             const titleDiv = document.createElement('div');
             titleDiv.className = 'search-result-title';
-            titleDiv.innerHTML = highlightText(result.displayTitle, trimmedQuery); 
+            titleDiv.innerHTML = result.titleHtml; 
     
             const breadcrumbsDiv = document.createElement('div');
             breadcrumbsDiv.className = 'search-result-breadcrumbs';
             if (result.type === 'section') {
-                breadcrumbsDiv.innerHTML = highlightText(result.breadcrumbs, trimmedQuery);
+                breadcrumbsDiv.innerHTML = result.breadcrumbsHtml;
             } else {
                 breadcrumbsDiv.textContent = result.breadcrumbs || ""; 
             }
             
             const snippetDiv = document.createElement('div');
             snippetDiv.className = 'search-result-snippet';
-            snippetDiv.innerHTML = result.snippet; 
+            snippetDiv.innerHTML = result.snippetHtml; 
     
             a.appendChild(titleDiv);
             a.appendChild(breadcrumbsDiv);
@@ -703,6 +693,7 @@ function activateSidebarLink(linkToActivate) {
         });
     
         searchResultsContainer.appendChild(ul);
+        return search;
     } 
     
     function DMAN_clearSearchResultsDisplay(message = "Start typing to see results.") {
@@ -730,7 +721,7 @@ function activateSidebarLink(linkToActivate) {
         searchInput.addEventListener('input', (e) => {
             const query = e.target.value;
             if (query.trim().length > 0) {
-                DMAN_performSearch(query);
+                DMAN_debounceSearch(query);
             } else {
                 DMAN_displaySearchHistory();
             }
@@ -788,64 +779,23 @@ function activateSidebarLink(linkToActivate) {
                 } else {
                     const currentQuery = searchInput.value.trim();
                     if (currentQuery.length > 0) {
-                        let tempPotentialResultsForEnter = {}; 
-                        const lowerQueryForEnter = currentQuery.toLowerCase();
-                        if (sidebarData && lowerQueryForEnter.length > 0) {
-                            sidebarData.forEach(section => {
-                                if (section.title.toLowerCase().startsWith(lowerQueryForEnter) && section.files && section.files.length > 0) {
-                                    const url = `/${section.output_folder_name}/${section.files[0].slug}/`;
-                                    if(!tempPotentialResultsForEnter[url] || 0.0001 < (tempPotentialResultsForEnter[url].score ||1)) {
-                                        tempPotentialResultsForEnter[url] = { url: url, score: 0.0001 };
-                                    }
-                                }
-                            });
-                        }
-                        searchIndexData.forEach(item => {
-                            if (item.searchable_text && item.searchable_text.includes(lowerQueryForEnter)) { 
-                                let score;
-                                let itemUrl = item.url;
-                                let isStartsWithMatch = false;
-
-                                if (item.type === 'heading') {
-                                    isStartsWithMatch = item.heading_text && String(item.heading_text).toLowerCase().startsWith(lowerQueryForEnter);
-                                    score = isStartsWithMatch ? 0.002 : 0.012;
-                                } else if (item.type === 'page') {
-                                    isStartsWithMatch = item.page_title && String(item.page_title).toLowerCase().startsWith(lowerQueryForEnter);
-                                    if (isStartsWithMatch) {
-                                        score = 0.003;
-                                    } else {
-                                        isStartsWithMatch = item.breadcrumbs && String(item.breadcrumbs).toLowerCase().startsWith(lowerQueryForEnter);
-                                        score = isStartsWithMatch ? 0.004 : 0.014;
-                                    }
-                                } else {
-                                    score = 0.05; 
-                                }
-                                
-                                if(!tempPotentialResultsForEnter[itemUrl] || score < (tempPotentialResultsForEnter[itemUrl].score || 1)) {
-                                    tempPotentialResultsForEnter[itemUrl] = { url: itemUrl, score: score };
+                        DMAN_saveSearchHistory(currentQuery);
+                        DMAN_performSearch(currentQuery).then((search) => {
+                            if (!search) return;
+                            if (search.total === 1) {
+                                const singleResultToNavigate = search.results[0];
+                                window.location.href = singleResultToNavigate.url;
+                                DMAN_closeSearchModal();
+                                if (searchInput) searchInput.value = '';
+                            } else {
+                                const firstDisplayedItem = searchResultsContainer.querySelector('li[data-index="0"]');
+                                if (firstDisplayedItem) {
+                                     const displayedListItems = Array.from(searchResultsContainer.querySelectorAll('li[data-index]'));
+                                    currentKeyboardFocusedIndex = 0;
+                                    DMAN_updateKeyboardFocus(displayedListItems, searchResultsContainer);
                                 }
                             }
                         });
-                        
-                        let tempResultsArrayForEnter = Object.values(tempPotentialResultsForEnter);
-                        tempResultsArrayForEnter.sort((a, b) => (a.score || 1) - (b.score || 1));
-                        
-                        if (tempResultsArrayForEnter.length === 1) {
-                            const singleResultToNavigate = tempResultsArrayForEnter[0];
-                            DMAN_saveSearchHistory(currentQuery);
-                            window.location.href = singleResultToNavigate.url;
-                            DMAN_closeSearchModal();
-                            if (searchInput) searchInput.value = '';
-                        } else {
-                            DMAN_saveSearchHistory(currentQuery);
-                            DMAN_performSearch(currentQuery); 
-                            const firstDisplayedItem = searchResultsContainer.querySelector('li[data-index="0"]');
-                            if (firstDisplayedItem && tempResultsArrayForEnter.length > 0) { // Check tempResultsArrayForEnter as well
-                                 const displayedListItems = Array.from(searchResultsContainer.querySelectorAll('li[data-index]'));
-                                currentKeyboardFocusedIndex = 0;
-                                DMAN_updateKeyboardFocus(displayedListItems, searchResultsContainer);
-                            }
-                        }
                     }
                 }
             }
@@ -853,7 +803,7 @@ function activateSidebarLink(linkToActivate) {
     } else {
         console.error('Search input element (#searchInput) not found!');
     }
-     DMAN_fetchSearchIndex(); 
+     DMAN_startSearchWorker(); 
 
     function DMAN_updateKeyboardFocus(items, listContainer) {
         items.forEach((item, index) => {
@@ -873,42 +823,64 @@ function activateSidebarLink(linkToActivate) {
     }
 
     // --- 4. Sidebar Accordion ---
-    document.querySelectorAll('.sidebar-nav .sidebar-nav-section').forEach(section => {
-        const toggleButton = section.querySelector('.sidebar-section-toggle');
-        const content = section.querySelector('.sidebar-section-content');
-        if (toggleButton && content) {
-            // If section is already open on load (e.g. hardcoded class or set by initial setup)
-            // and its height hasn't been calculated and stored yet.
-            if (section.classList.contains('is-open')) {
-                if (!content.dataset.calculatedMaxHeight) { // Check if not already set
-                    const calculatedHeight = content.scrollHeight + "px";
-                    content.style.maxHeight = calculatedHeight;
-                    content.dataset.calculatedMaxHeight = calculatedHeight; // Store it
-                } else {
-                    content.style.maxHeight = content.dataset.calculatedMaxHeight;
+    function DMAN_initializeSidebarAccordion() {
+        document.querySelectorAll('.sidebar-nav .sidebar-nav-section').forEach(section => {
+            const toggleButton = section.querySelector('.sidebar-section-toggle');
+            const content = section.querySelector('.sidebar-section-content');
+            if (toggleButton && content) {
+                // If section is already open on load (e.g. hardcoded class or set by initial setup)
+                // and its height hasn't been calculated and stored yet.
+                if (section.classList.contains('is-open')) {
+                    if (!content.dataset.calculatedMaxHeight) { // Check if not already set
+                        const calculatedHeight = content.scrollHeight + "px";
+                        content.style.maxHeight = calculatedHeight;
+                        content.dataset.calculatedMaxHeight = calculatedHeight; // Store it
+                    } else {
+                        content.style.maxHeight = content.dataset.calculatedMaxHeight;
+                    }
                 }
-            }
     
-            toggleButton.addEventListener('click', () => {
-                const isOpen = section.classList.toggle('is-open');
-                toggleButton.setAttribute('aria-expanded', isOpen.toString());
+                toggleButton.addEventListener('click', () => {
+                    const isOpen = section.classList.toggle('is-open');
+                    toggleButton.setAttribute('aria-expanded', isOpen.toString());
     
-                if (isOpen) {
-                    // If opening, check if we have a stored height
-                    if (content.dataset.calculatedMaxHeight) {
-                        content.style.maxHeight = content.dataset.calculatedMaxHeight; // Use stored height
+                    if (isOpen) {
+                        // If opening, check if we have a stored height
+                        if (content.dataset.calculatedMaxHeight) {
+                            content.style.maxHeight = content.dataset.calculatedMaxHeight; // Use stored height
+                        } else {
+                            // If no stored height (first time opening this section via click)
+                            const calculatedHeight = content.scrollHeight + "px";
+                            content.style.maxHeight = calculatedHeight;
+                            content.dataset.calculatedMaxHeight = calculatedHeight; // Calculate and store
+                        }
                     } else {
-                        // If no stored height (first time opening this section via click)
-                        const calculatedHeight = content.scrollHeight + "px";
-                        content.style.maxHeight = calculatedHeight;
-                        content.dataset.calculatedMaxHeight = calculatedHeight; // Calculate and store
+                        content.style.maxHeight = "0px";
                     }
-                } else {
-                    content.style.maxHeight = "0px";
-                }
-            });
-        }
-    });
+                });
+            }
+        });
+    }
+
+    function DMAN_initializeSidebar() {
+        initializeActiveSidebarLink();
+        DMAN_initializeSidebarAccordion();
+    }
+
+    // Pages built with `vai build --sidebar-fragment` link to the sidebar instead of containing it.
+    // It is one file with a content hashed name, so the browser fetches it once for the whole site.
+    const sidebarFragmentLink = document.querySelector('a[data-vai-sidebar]');
+    if (sidebarFragmentLink) {
+        fetch(sidebarFragmentLink.href)
+            .then(response => response.ok ? response.text() : Promise.reject(new Error(`HTTP ${response.status}`)))
+            .then(fragmentHtml => {
+                sidebarFragmentLink.outerHTML = fragmentHtml;
+                DMAN_initializeSidebar();
+            })
+            .catch(error => console.error('Could not load the sidebar:', error));
+    } else {
+        DMAN_initializeSidebar();
+    }
 
     // --- 5. Mobile Navigation (Main Sidebar) ---
     function DMAN_openMobileSidebar() {
@@ -945,7 +917,7 @@ function activateSidebarLink(linkToActivate) {
         document.body.classList.add('mobile-toc-open');
         mobileTocToggle.setAttribute('aria-expanded', 'true');
         tocContainerElement.scrollTo(0, 0);
-        updateActiveLinkAndMarker(); 
+        DMAN_refreshToc(); 
         updateBodyScrollAndOverlay();
     }
     function DMAN_closeMobileToc() {
@@ -990,49 +962,80 @@ function activateSidebarLink(linkToActivate) {
     });
 
     // --- Code Block Copy Button ---
-    const codeBlocks = document.querySelectorAll('.codehilite');
     const copyIconSVG = `<svg aria-hidden="true" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24"><path d="M16 1H4c-1.1 0-2 .9-2 2v14h2V3h12V1zm3 4H8c-1.1 0-2 .9-2 2v14c0 1.1.9 2 2 2h11c1.1 0 2-.9 2-2V7c0-1.1-.9-2-2-2zm0 16H8V7h11v14z"/></svg>`;
     const copiedIconSVG = `<svg aria-hidden="true" xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24"><path d="M9 16.17L4.83 12l-1.42 1.41L9 19 21 7l-1.41-1.41L9 16.17z"/></svg>`;
 
-    codeBlocks.forEach(codeBlockContainer => {
-        const preElement = codeBlockContainer.querySelector('pre');
-        if (!preElement) return;
-        const codeElement = preElement.querySelector('code');
-        if (!codeElement) return;
-
-        const copyButton = document.createElement('button');
-        copyButton.className = 'copy-code-button';
-        copyButton.innerHTML = copyIconSVG;
-        copyButton.setAttribute('aria-label', 'Copy code to clipboard');
-        copyButton.setAttribute('title', 'Copy code');
-        codeBlockContainer.insertBefore(copyButton, preElement);
-
-        copyButton.addEventListener('click', async () => {
-            const codeToCopy = codeElement.innerText;
-            try {
-                await navigator.clipboard.writeText(codeToCopy);
-                copyButton.innerHTML = copiedIconSVG;
-                copyButton.setAttribute('title', 'Copied!');
-                setTimeout(() => {
-                    copyButton.innerHTML = copyIconSVG;
-                    copyButton.setAttribute('title', 'Copy code');
-                }, 2000);
-            } catch (err) {
-                console.error('Failed to copy code: ', err);
-                copyButton.setAttribute('title', 'Error copying');
-                 setTimeout(() => {
-                    copyButton.innerHTML = copyIconSVG;
-                    copyButton.setAttribute('title', 'Copy code');
-                }, 2000);
-            }
+    function DMAN_addCopyButtons() {
+        const codeBlocks = document.querySelectorAll('.codehilite');
+        codeBlocks.forEach(codeBlockContainer => {
+            const preElement = codeBlockContainer.querySelector('pre');
+            if (!preElement) return;
+            const codeElement = preElement.querySelector('code');
+            if (!codeElement) return;
+
+            const copyButton = document.createElement('button');
+            copyButton.className = 'copy-code-button';
+            copyButton.innerHTML = copyIconSVG;
+            copyButton.setAttribute('aria-label', 'Copy code to clipboard');
+            copyButton.setAttribute('title', 'Copy code');
+            codeBlockContainer.insertBefore(copyButton, preElement);
+
+            copyButton.addEventListener('click', async () => {
+                const codeToCopy = codeElement.innerText;
+                try {
+                    await navigator.clipboard.writeText(codeToCopy);
+                    copyButton.innerHTML = copiedIconSVG;
+                    copyButton.setAttribute('title', 'Copied!');
+                    setTimeout(() => {
+                        copyButton.innerHTML = copyIconSVG;
+                        copyButton.setAttribute('title', 'Copy code');
+                    }, 2000);
+                } catch (err) {
+                    console.error('Failed to copy code: ', err);
+                    copyButton.setAttribute('title', 'Error copying');
+                     setTimeout(() => {
+                        copyButton.innerHTML = copyIconSVG;
+                        copyButton.setAttribute('title', 'Copy code');
+                    }, 2000);
+                }
+            });
         });
-    });
+    }
+    DMAN_addCopyButtons();
 
 
 
 
 // --- 8. Page Initialization, Scroll Restoration, and Link Handling ---
 
+function scrollToHash(hash) {
+    if (!hash || !mainScroller) {
+        return false;
+    }
+
+    setTimeout(() => {
+        try {
+            const targetId = decodeURIComponent(hash.substring(1));
+            const targetElement = document.getElementById(targetId);
+
+            if (targetElement) {
+                const paddingTop = parseFloat(getComputedStyle(targetElement).paddingTop) || 0;
+                const textVisibleStartingPoint = targetElement.offsetTop + paddingTop;
+                const scrollToPosition = textVisibleStartingPoint - DYNAMIC_HEADER_OFFSET - DESIRED_TEXT_GAP_BELOW_HEADER;
+
+                mainScroller.scrollTo({
+                    top: Math.max(0, scrollToPosition),
+                    behavior: 'instant' 
+                });
+            }
+        } catch (e) {
+            console.error("Vai: Error handling hash scroll:", e);
+        }
+    }, 50); 
+
+    return true;
+}
+
 (function() {
     if ('scrollRestoration' in history) {
         history.scrollRestoration = 'manual';
@@ -1049,34 +1052,6 @@ function activateSidebarLink(linkToActivate) {
         }
     });
 
-    function scrollToHash(hash) {
-        if (!hash || !mainScroller) {
-            return false;
-        }
-
-        setTimeout(() => {
-            try {
-                const targetId = decodeURIComponent(hash.substring(1));
-                const targetElement = document.getElementById(targetId);
-
-                if (targetElement) {
-                    const paddingTop = parseFloat(getComputedStyle(targetElement).paddingTop) || 0;
-                    const textVisibleStartingPoint = targetElement.offsetTop + paddingTop;
-                    const scrollToPosition = textVisibleStartingPoint - DYNAMIC_HEADER_OFFSET - DESIRED_TEXT_GAP_BELOW_HEADER;
-
-                    mainScroller.scrollTo({
-                        top: Math.max(0, scrollToPosition),
-                        behavior: 'instant' 
-                    });
-                }
-            } catch (e) {
-                console.error("Vai: Error handling hash scroll:", e);
-            }
-        }, 50); 
-
-        return true;
-    }
-    
     function restoreScrollOnRefresh() {
         if (!mainScroller) return false;
         try {
@@ -1135,4 +1110,147 @@ function activateSidebarLink(linkToActivate) {
         }
     });
 
-})();
\ No newline at end of file
+})();
+
+// --- 9. Client Navigation (vai build --client-navigation) ---
+// Pages built with --client-navigation have a content.json next to them with their title and the inner
+// html of #content-area and #toc-links. Links to other pages of the site swap those in instead of loading
+// the whole document, so the sidebar, the theme and the search index shards loaded so far all stay.
+// A page's content is prefetched when a link to it is hovered, focused or scrolled into view.
+const CLIENT_NAVIGATION_REGIONS = ['content-area', 'toc-links'];
+const pageContentRequests = new Map(); // pathname -> promise of the page's content.json
+let shownPathname = window.location.pathname;
+let latestNavigationId = 0; // a navigation is dropped if another one started while it was loading
+
+function getSitePageUrl(href) {
+    // the url of href if it is a page of this site, null otherwise
+    const url = new URL(href, window.location.href);
+    return url.origin === window.location.origin && url.pathname.endsWith('/') ? url : null;
+}
+
+function getClientNavigationUrl(link) {
+    // the page a link opens, null if the browser should follow it as usual
+    if (!link?.href || (link.target && link.target !== '_self') || link.hasAttribute('download')) return null;
+    return getSitePageUrl(link.href);
+}
+
+function loadPageContent(url) {
+    let request = pageContentRequests.get(url.pathname);
+    if (!request) {
+        request = fetch(new URL('content.json', url.origin + url.pathname))
+            .then(response => response.ok ? response.json() : Promise.reject(new Error(`HTTP ${response.status}`)));
+        request.catch(() => pageContentRequests.delete(url.pathname)); // tried again next time
+        pageContentRequests.set(url.pathname, request);
+    }
+    return request;
+}
+
+function prefetchPageContent(link) {
+    const url = getClientNavigationUrl(link);
+    if (url && url.pathname !== shownPathname && !navigator.connection?.saveData) {
+        loadPageContent(url).catch(() => {});
+    }
+}
+
+const prefetchObserver = clientNavigationEnabled && 'IntersectionObserver' in window
+    ? new IntersectionObserver(entries => entries.forEach(entry => {
+        if (entry.isIntersecting) {
+            prefetchObserver.unobserve(entry.target);
+            prefetchPageContent(entry.target);
+        }
+    }))
+    : null;
+
+function observeLinksForPrefetch() {
+    if (!prefetchObserver) return;
+    document.querySelectorAll('#content-area a[href]').forEach(link => {
+        if (getClientNavigationUrl(link)) prefetchObserver.observe(link);
+    });
+}
+
+function initializePageContent() {
+    // everything that is set up on the content of a page, done again for every page swapped in
+    highlightCodeBlocks();
+    DMAN_addCopyButtons();
+    initializeNavButtons();
+    DMAN_initializeToc();
+    initializeActiveSidebarLink();
+    observeLinksForPrefetch();
+}
+
+async function navigateToPage(url, pushState = true) {
+    const navigationId = ++latestNavigationId;
+    let content;
+    try {
+        content = await loadPageContent(url);
+    } catch (error) {
+        window.location.href = url.href; // e.g. a redirect index or a page built without --client-navigation
+        return;
+    }
+    if (navigationId !== latestNavigationId) return;
+
+    const regions = CLIENT_NAVIGATION_REGIONS.map(regionId => document.getElementById(regionId));
+    if (regions.includes(null) || CLIENT_NAVIGATION_REGIONS.some(regionId => typeof content.regions?.[regionId] !== 'string')) {
+        window.location.href = url.href;
+        return;
+    }
+    if (pushState) history.pushState(null, '', url.href);
+    shownPathname = url.pathname;
+    document.title = content.title;
+    regions.forEach((region, index) => { region.innerHTML = content.regions[CLIENT_NAVIGATION_REGIONS[index]]; });
+    initializePageContent();
+
+    if (document.body.classList.contains('mobile-sidebar-open')) DMAN_closeMobileSidebar();
+    if (url.hash) {
+        scrollToHash(url.hash);
+    } else if (mainScroller) {
+        mainScroller.scrollTo({ top: 0, behavior: 'instant' });
+    }
+    updateActiveLinkAndMarker();
+}
+
+function goToPage(href) {
+    // opens a page of the site, without reloading if client navigation is on
+    const url = clientNavigationEnabled ? getSitePageUrl(href) : null;
+    if (url && url.pathname !== shownPathname) {
+        navigateToPage(url);
+    } else {
+        window.location.href = href;
+    }
+}
+
+if (clientNavigationEnabled) {
+    document.addEventListener('click', (event) => {
+        if (event.defaultPrevented || event.button !== 0 || event.metaKey || event.ctrlKey || event.shiftKey || event.altKey) return;
+        const url = getClientNavigationUrl(event.target.closest?.('a'));
+        if (!url || url.pathname === shownPathname) return; // links within the page are scrolled to by section 8
+        event.preventDefault();
+        navigateToPage(url);
+    });
+    ['pointerover', 'focusin'].forEach(eventType => {
+        document.addEventListener(eventType, (event) => prefetchPageContent(event.target.closest?.('a')), { passive: true });
+    });
+    window.addEventListener('popstate', () => {
+        if (window.location.pathname !== shownPathname) navigateToPage(new URL(window.location.href), false);
+    });
+    observeLinksForPrefetch();
+}
+
+// --- Dev Server Reloads (vai run, see DevSite in vai/main.py) ---
+// After rebuilding a single page the dev server sends that page's url as the reload path.
+// Only the browsers showing that page reload, the others are left alone.
+class LiveReloadPluginVaiPage {
+    static identifier = 'vai-page';
+    static version = '1.0';
+
+    reload(path) {
+        if (!path.startsWith('/') || !path.endsWith('/')) return false; // not a page url, livereload handles it as usual
+        // the site root and section index pages are copies of a page, the active sidebar link tells which
+        const activeLink = document.querySelector('.sidebar-link.active');
+        const shownPath = activeLink ? new URL(activeLink.href, window.location.origin).pathname : window.location.pathname;
+        // true means "handled", i.e. this page does not reload
+        return shownPath !== path && window.location.pathname !== path;
+    }
+}
+window.LiveReloadPluginVaiPage = LiveReloadPluginVaiPage;
+if (window.LiveReload) window.LiveReload.addPlugin(LiveReloadPluginVaiPage);
@@ -7,31 +7,70 @@
 # nuitka-project: --product-name="vai Application"
 # nuitka-project: --file-version="0.1.0" 
 # nuitka-project: --product-version="0.1.0"
-# nuitka-project: --include-package=pygments.lexers
+# nuitka-project: --include-module=pygments.lexers.python
+# nuitka-project: --include-module=pygments.lexers.shell
+# nuitka-project: --include-module=pygments.lexers.javascript
+# nuitka-project: --include-module=pygments.lexers.html
+# nuitka-project: --include-module=pygments.lexers.css
+# nuitka-project: --include-module=pygments.lexers.data
+# nuitka-project: --include-module=pygments.lexers.markup
+# nuitka-project: --include-module=pygments.lexers.configs
+# nuitka-project: --include-module=pygments.lexers.templates
+# nuitka-project: --include-module=pygments.lexers.c_cpp
+# nuitka-project: --include-module=pygments.lexers.jvm
+# nuitka-project: --include-module=pygments.lexers.dotnet
+# nuitka-project: --include-module=pygments.lexers.go
+# nuitka-project: --include-module=pygments.lexers.rust
+# nuitka-project: --include-module=pygments.lexers.sql
+# nuitka-project: --include-module=pygments.lexers.diff
+# nuitka-project: --include-module=pygments.lexers.special
 from genericpath import exists
-import markdown
-from markdown.extensions import Extension
-from markdown.treeprocessors import Treeprocessor
-from xml.etree import ElementTree as etree
 import re
-from jinja2 import Environment, FileSystemLoader
-from bs4 import BeautifulSoup
-from markdown.extensions.codehilite import CodeHiliteExtension
-from markdown.blockprocessors import BlockProcessor
-from livereload import Server
 import json
+import html
+import hashlib
 import datetime
-import yaml
 import argparse
 from pathlib import Path
 import shutil
-import minify_html
-import rcssmin
-import rjsmin
+import os
+import functools
+import collections
+import math
 from importlib.resources import files, as_file
 
+from vai.profiler import build_profiler
+from vai.utils import generate_slug, hash_text
+
+# Third party packages are imported inside the functions that use them, so every
+# command only pays for what it needs (e.g. vai init never loads markdown or the minifiers).
+# The Markdown extensions live in vai/markdown_converter.py for the same reason.
+
 PACKAGE_NAME = "vai"
 PACKAGE_DATA_DIR_NAME = "package_defaults" 
+# files of package_defaults/static that the build adds to the output when the site's static folder
+# (copied by vai init from an older version) doesn't have its own, see get_static_files
+BUILT_IN_STATIC_FILES = ("search_worker.js",)
+
+BUILD_CACHE_DIR_NAME = ".vai_cache"
+BUILD_MANIFEST_FILE_NAME = "build_manifest.json"
+BUILD_MANIFEST_VERSION = 4
+HIGHLIGHT_CACHE_FILE_NAME = "highlight_cache.json"
+PAGE_DATES_CACHE_FILE_NAME = "page_dates.json"
+ASSET_HASHES_FILE_NAME = "asset_hashes.json"
+ASSET_MANIFEST_FILE_NAME = "asset_manifest.json"
+ASSET_HASH_LENGTH = 10
+DEPLOY_MANIFEST_FILE_NAME = "deploy_manifest.json"
+DEPLOY_MANIFEST_VERSION = 1
+
+SEARCH_INDEX_DIR_NAME = "search_index"
+SEARCH_INDEX_VERSION = 2
+SEARCH_INDEX_SHARD_PREFIX_LENGTH = 2
+LEGACY_SEARCH_INDEX_FILE_NAME = "search_index.json"
+# BM25F ranking of the search index: a word in the title of a page counts more than one in its body
+SEARCH_FIELD_WEIGHTS = {"title": 5.0, "heading": 3.0, "breadcrumbs": 1.5, "body": 1.0}
+SEARCH_BM25_K1 = 1.2
+SEARCH_BM25_B = 0.75
 
 
 def setup_header_in_layout_html():
@@ -40,6 +79,8 @@ def setup_header_in_layout_html():
     dropdowns, internals  and externals. after populating it will generate a html file
     called layout.html and parsing will be done trhough this html file 
     """
+    import yaml
+    from jinja2 import Environment, FileSystemLoader
 
     try:
         with open("config.yaml", "r") as f:
@@ -97,21 +138,6 @@ def setup_header_in_layout_html():
 
 
 
-def generate_slug(text_to_slugify):
-    """
-    Converts text to URL-friendly text
-
-    Example:
-        My Awesome Title!" -> "my-awesome-title"
-    """
-    text = str(text_to_slugify).lower()
-    text = re.sub(r'[^\w\s-]', '', text)
-    text = re.sub(r'\s+', '-', text)
-    text = re.sub(r'-+', '-', text)
-    text = text.strip('-')
-    return text
-
-
 # 01-Introduction.md" -> "Introduction
 def clean_display_name(name_with_potential_prefix_and_ext):
     """
@@ -171,173 +197,109 @@ def parse_metadata_and_body_from_string(markdown_content_as_string):
     return metadata, body
 
 
-class HeadingIdAdder(Treeprocessor):
-    """ Automatically add id attributes to HTML heading tags (<h1> to <h6>).
-        These IDs are used for creating anchor links (#-links).
+def generate_heading_links(headings):
+    """
+    Creates an HTML string representing a list of links to H2 and H3 headings on the current page.
+    This is used to build an on-page Table of Contents (TOC).
+    headings is the list returned by convert_md_to_html.
+    data-toc-id is the id of the heading a link belongs to, for the scroll spy in script.js.
+    """
+    links = []
+    for heading in headings:
+        if heading["level"] > 3: continue
+        link_style = ' style="padding-left:2rem"' if heading["level"] == 3 else ''
+        links.append(f'<a href="#{heading["id"]}" data-toc-id="{html.escape(heading["id"])}"{link_style}>{html.escape(heading["text"], quote=False)}</a>')
+            
+    return '\n'.join(links)
 
 
-    Args:
-        Treeprocessor:  argument operate on the XML/ElementTree representation of the Markdown document 
-                        after it has been parsed but before it's serialized to HTML
-    """ 
-    
-    def run(self, root: etree.Element):
-        self.used_slugs_on_page = set()
-        for element in root.iter():
-            if element.tag in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6'):
-                full_heading_text = "".join(element.itertext()).strip()
-                if full_heading_text:
-                    base_slug = generate_slug(full_heading_text)
-                    final_slug = base_slug
-                    counter = 1
-                    while final_slug in self.used_slugs_on_page:
-                        final_slug = f"{base_slug}-{counter}"
-                        counter += 1
-                    element.set('id', final_slug)
-                    self.used_slugs_on_page.add(final_slug)
-
-class HeadingIdExtension(Extension):
-    """register the HeadingIdAdder treeprocessor with the Markdown parser.
-    """
-    def extendMarkdown(self, md):
-        md.treeprocessors.register(HeadingIdAdder(md), 'headingidadder', 15)
-        
-class AdmonitionProcessorCorrected(BlockProcessor):
-    """ parse custom github like alert blocks, which are special highlighted boxes for notes, warnings, tips, etc.
-    The syntax looks like:
-
-    :::note warning Custom Title
-    This is the content of the note.
-    It can span multiple lines.
-    :::
-    """
-    RE_START = re.compile(r'^\s*:::\s*([a-zA-Z0-9_-]+)(?:\s*(.*))?\s*$')
-    RE_END = re.compile(r'^\s*:::\s*$')
-
-    def test(self, parent, block):
-        return bool(self.RE_START.match(block.split('\n', 1)[0]))
-
-    def run(self, parent, blocks):
-        original_block = blocks.pop(0)
-        lines = original_block.split('\n')
-        first_line_match = self.RE_START.match(lines[0])
-        if not first_line_match:
-            blocks.insert(0, original_block)
-            return False
+def link_or_copy_file(src_file, dest_file_path):
+    """hardlinks src_file to dest_file_path, or copies it where that isn't possible (e.g. another drive)"""
+    try:
+        os.link(src_file, dest_file_path)
+    except OSError:
+        shutil.copy2(src_file, dest_file_path)
 
-        if first_line_match.group(2):
-            custom_title_str = first_line_match.group(2).strip()
-        else:
-            custom_title_str = ""
 
+def sync_static_file(src_file, dest_file_path):
+    """
+    Copies src_file to dest_file_path unless a copy with the same size and modification time
+    is already there (copy2 keeps the modification time). Returns True if it had to be copied.
 
-        admon_type = first_line_match.group(1).lower()
-        if custom_title_str:
-            display_title = custom_title_str
-        elif admon_type == "details":
-            display_title = "details"
-        else:
-            display_title = admon_type.capitalize()
-                        
-        content_lines_raw = []
-        block_ended = False
-        remaining_lines_after_end_in_current_block = []
-
-        for i in range(1, len(lines)):
-            if self.RE_END.match(lines[i]):
-                block_ended = True
-                remaining_lines_after_end_in_current_block = lines[i+1:]
-                break
-            content_lines_raw.append(lines[i])
-        
-        if not block_ended:
-            while blocks:
-                next_block_chunk_from_parser = blocks.pop(0)
-                inner_lines_of_chunk = next_block_chunk_from_parser.split('\n')
-                processed_all_inner_lines = True
-                for j, line_in_chunk in enumerate(inner_lines_of_chunk):
-                    if self.RE_END.match(line_in_chunk):
-                        block_ended = True
-                        if j + 1 < len(inner_lines_of_chunk):
-                            blocks.insert(0, '\n'.join(inner_lines_of_chunk[j+1:]))
-                        processed_all_inner_lines = False
-                        break
-                    content_lines_raw.append(line_in_chunk)
-                if block_ended: break
-        
-        if not block_ended:
-            blocks.insert(0, original_block)
+    Used for src_html, which users may edit, so it is always a real copy: a hardlink to src_file
+    (as older versions made) is replaced, an edit of one would otherwise change the other.
+    """
+    src_file = Path(src_file)
+    dest_file_path = Path(dest_file_path)
+    try:
+        dest_stat = dest_file_path.stat()
+    except FileNotFoundError:
+        dest_stat = None
+    if dest_stat is not None:
+        src_stat = src_file.stat()
+        if not os.path.samestat(src_stat, dest_stat) and (
+            src_stat.st_size == dest_stat.st_size and src_stat.st_mtime_ns == dest_stat.st_mtime_ns
+        ):
             return False
+        # unlinked first so that copying never writes through a hardlink into src_file
+        dest_file_path.unlink()
+    dest_file_path.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(src_file, dest_file_path)
+    return True
 
-        parsed_content_for_md = '\n'.join(content_lines_raw)
 
-        if admon_type == "details":
-            el = etree.SubElement(parent, 'details')
-            el.set('class', f'admonition {admon_type}')
-            summary_el = etree.SubElement(el, 'summary')
-            summary_el.set('class', 'admonition-title')
-            summary_el.text = display_title
-            content_wrapper_el = etree.SubElement(el, 'div')
-        else:
-            el = etree.SubElement(parent, 'div')
-            el.set('class', f'admonition {admon_type}')
-            title_el = etree.SubElement(el, 'p')
-            title_el.set('class', 'admonition-title')
-            title_el.text = display_title
-            content_wrapper_el = etree.SubElement(el, 'div')
-        
-        if parsed_content_for_md.strip():
-            self.parser.parseBlocks(content_wrapper_el, [parsed_content_for_md])
-        
-        if remaining_lines_after_end_in_current_block:
-            blocks.insert(0, '\n'.join(remaining_lines_after_end_in_current_block))
-        return True
+def get_built_in_static_dir():
+    """package_defaults/static of the installed package"""
+    return Path(files(PACKAGE_NAME).joinpath(PACKAGE_DATA_DIR_NAME).joinpath("static"))
 
-class AdmonitionExtensionCorrected(Extension):
-    """register the AdmonitionProcessorCorrected block processor with the Markdown parser.
-    """
-    def extendMarkdown(self, md):
-        md.parser.blockprocessors.register(AdmonitionProcessorCorrected(md.parser), 'admonition_corrected', 105)
 
-def convert_md_to_html(md_body_text):
-    return markdown.markdown(md_body_text, extensions=[
-        HeadingIdExtension(), 
-        AdmonitionExtensionCorrected(),
-        'fenced_code',
-        CodeHiliteExtension(css_class='codehilite', guess_lang=False, use_pygments=True),
-        'tables'
-    ])
-
-def generate_heading_links(html_body_content):
+def get_static_files(static_src_path):
     """
-    Creates an HTML string representing a list of links to H2 and H3 headings on the current page.
-    This is used to build an on-page Table of Contents (TOC).
+    {path in static: source file} for every file of the static folder, plus the BUILT_IN_STATIC_FILES
+    it doesn't have (e.g. script.js starts the search worker from the file next to it).
     """
-    soup = BeautifulSoup(html_body_content, 'html.parser')
-    links = []
-    for tag in soup.find_all(['h1','h2', 'h3']):
-        title = tag.get_text()
-        anchor = tag.get('id')
-        if not anchor: continue
-        link_style = ' style="padding-left:2rem"' if tag.name == 'h3' else ''
-        links.append(f'<a href="#{anchor}"{link_style}>{title}</a>')
-            
-    return '\n'.join(links)
+    static_files = {f.relative_to(static_src_path): f for f in static_src_path.rglob("*") if f.is_file()}
+    built_in_static_dir = get_built_in_static_dir()
+    for name in BUILT_IN_STATIC_FILES:
+        if Path(name) not in static_files and (built_in_static_dir / name).is_file():
+            static_files[Path(name)] = built_in_static_dir / name
+    return static_files
 
 
-def copy_static_assets(static_src_dir='static', dst_dir='dist'):
+def copy_static_assets(static_src_dir='static', dst_dir='dist/static'):
     """
-    Copies an entire directory of static assets from the "static" folder to the "dist" folder
+    Makes dst_dir a copy of the "static" folder.
     It is expected for the static assets to contain style.css, script.js, favicon and logo.
     Note: the favicon and logo can be of any format as long as they are a valid images.
+
+    Only new and changed files are copied (see sync_static_file) and files that are no longer in static are removed from dst_dir. Built in files the folder
+    lacks are added, see get_static_files.
+    Returns the number of files copied.
     """
-    
+    from concurrent.futures import ThreadPoolExecutor
+
     static_src_path = Path(static_src_dir)
     dst_path = Path(dst_dir)
     if not static_src_path.exists() or not static_src_path.is_dir():
         print(f"Warning: Static assets directory '{static_src_path}' not found. Skipping copy.")
-        return
-    shutil.copytree(static_src_path, dst_path, dirs_exist_ok=True)
+        return 0
+
+    static_files = get_static_files(static_src_path)
+    with ThreadPoolExecutor() as executor:
+        copied = sum(executor.map(
+            lambda relative_path: sync_static_file(static_files[relative_path], dst_path / relative_path),
+            static_files,
+        ))
+
+    static_file_set = set(static_files)
+    for dst_item in sorted(dst_path.rglob("*"), reverse=True):
+        relative_path = dst_item.relative_to(dst_path)
+        if dst_item.is_dir() and not dst_item.is_symlink():
+            if not (static_src_path / relative_path).is_dir():
+                shutil.rmtree(dst_item)
+        elif relative_path not in static_file_set:
+            dst_item.unlink()
+    return copied
 
 
 def natural_sort_key(s):
@@ -360,13 +322,20 @@ def scan_src(src_dir_path='src'):
     This function correctly sorts folders and files with numerical prefixes like
     "9-Item.md" and "10-Item.md".
 
+    The pages are indexed as they are found, so rendering a page never has to search the site:
+    every page knows its position, its url, the title of its section and its prev/next links.
+
     Return:
-        all_files_to_process: {original_path, output_folder_name, output_file_slug, display_title}
+        all_files_to_process: {original_path, output_folder_name, output_file_slug, display_title,
+                               index, url, section_title, prev_page, next_page, default_date}
+                              prev_page/next_page are {title, url} or None for the first/last page,
+                              default_date is today's, see set_page_dates for the others
         sidebar_data_for_template: {title, output_folder_name, files}
     """
     src_path = Path(src_dir_path)
     all_files_to_process = []
     sidebar_data_for_template = []
+    today = format_page_date(datetime.date.today())
 
     if not src_path.exists():
         return all_files_to_process, sidebar_data_for_template
@@ -397,7 +366,13 @@ def scan_src(src_dir_path='src'):
                 "original_path": md_file_path,
                 "output_folder_name": section_output_folder_slug,
                 "output_file_slug": file_output_slug,
-                "display_title": cleaned_file_display_title
+                "display_title": cleaned_file_display_title,
+                "index": len(all_files_to_process),
+                "url": f"/{section_output_folder_slug}/{file_output_slug}/",
+                "section_title": cleaned_section_display_title,
+                "prev_page": None,
+                "next_page": None,
+                "default_date": today,
             })
             
             # Add to the list for the current sidebar section
@@ -414,206 +389,1237 @@ def scan_src(src_dir_path='src'):
                 "files": current_sidebar_section_files
             })
 
+    for prev_item, next_item in zip(all_files_to_process, all_files_to_process[1:]):
+        prev_item["next_page"] = {"title": next_item["display_title"], "url": next_item["url"]}
+        next_item["prev_page"] = {"title": prev_item["display_title"], "url": prev_item["url"]}
+
     return all_files_to_process, sidebar_data_for_template
 
-def process_md_files(all_files_to_process, dist_base_path, sidebar_data_for_template, jinja_env):
+PAGE_DATE_SOURCES = ('today', 'mtime', 'git')
+
+
+def format_page_date(date):
+    """a date as pages show it, e.g. 1st January 2025"""
+    day_val = date.day
+    if 4 <= day_val <= 20 or 24 <= day_val <= 30:
+        day_suffix = "th"
+    else:
+        day_suffix = ["st", "nd", "rd"][day_val % 10 - 1]
+    return f"{str(day_val)}{day_suffix} {date.strftime('%B %Y')}"
+
+
+def get_git_page_dates(src_dir_path, cache_path=None):
     """
-    Takes the list of md files from src and processes each one to generate the final HTML page.
-    It also builds a hierarchical search index
-    """    
-    search_index_entries = []
-    page_template = jinja_env.get_template('layout.html')
+    Returns {md path: date} with the date of the last commit that changed every md file under
+    src_dir_path (paths as scan_src gives them), from a single walk of the git history.
+    The dates only change with new commits, so they are cached in cache_path along with the
+    commit they were read at. Returns None if git or the repository isn't available.
+    """
+    import subprocess
 
-    for i, file_item in enumerate(all_files_to_process):
-        md_path = file_item["original_path"]
-        output_folder_name = file_item["output_folder_name"]
-        output_file_slug = file_item["output_file_slug"]
+    try:
+        head = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
 
+    if cache_path:
         try:
-            full_md_text_from_file = md_path.read_text(encoding="utf-8")
-        except Exception as e:
-            print(f"Error reading file {md_path}: {e}. Skipping.")
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.loads(f.read())
+            if cached.get('head') == head and cached.get('src_dir') == Path(src_dir_path).as_posix():
+                return {path: datetime.date.fromisoformat(date) for path, date in cached['dates'].items()}
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, TypeError, ValueError):
+            pass
+
+    # newest commits come first, so the first date seen for a path is its last change
+    log = subprocess.run(
+        ['git', '-c', 'core.quotePath=false', 'log', '--format=%x00%cd', '--date=short', '--name-only', '--relative', '--', str(src_dir_path)],
+        capture_output=True, text=True, encoding='utf-8',
+    )
+    if log.returncode != 0:
+        return None
+    dates = {}
+    for commit in log.stdout.split('\x00')[1:]:
+        date, *paths = commit.strip().split('\n')
+        for path in paths:
+            if path:
+                dates.setdefault(path, date)
+
+    if cache_path:
+        cache_path = Path(cache_path)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"head": head, "src_dir": Path(src_dir_path).as_posix(), "dates": dates}, ensure_ascii=False))
+    return {path: datetime.date.fromisoformat(date) for path, date in dates.items()}
+
+
+def set_page_dates(all_files_to_process, source='today', src_dir_path='src_md', cache_path=None):
+    """
+    Sets the "default_date" of every page (see scan_src), the date a page shows unless its
+    front matter has one:
+        today:  the day of the build, worked out once for the whole build. The date is part of
+                the page hash (see get_page_hash), so the first build of a day renders every page
+        mtime:  the day the md file was last modified
+        git:    the day of the last commit that changed the md file, cached in cache_path
+                (see get_git_page_dates). Files git doesn't know yet use their mtime
+
+    With mtime or git, a page rebuilt without changes comes out byte for byte the same
+    on another day, so it isn't uploaded again by a deploy that compares files.
+    """
+    today = format_page_date(datetime.date.today())
+    git_dates = {}
+    if source == 'git':
+        git_dates = get_git_page_dates(src_dir_path, cache_path)
+        if git_dates is None:
+            print("Warning: could not read the git history, pages are dated by the modification time of their md file.")
+            git_dates = {}
+    for file_item in all_files_to_process:
+        if source == 'today':
+            file_item["default_date"] = today
             continue
+        page_date = git_dates.get(file_item["original_path"].as_posix())
+        if page_date is None:
+            try:
+                page_date = datetime.date.fromtimestamp(file_item["original_path"].stat().st_mtime)
+            except OSError:
+                file_item["default_date"] = today
+                continue
+        file_item["default_date"] = format_page_date(page_date)
 
-        page_meta, md_body_only_string = parse_metadata_and_body_from_string(full_md_text_from_file)
-        body_content_html = convert_md_to_html(md_body_only_string)
-        toc_table_link_html = generate_heading_links(body_content_html)
 
-        page_title_from_meta_or_file = page_meta.get('title', file_item["display_title"])
-        base_page_url = f"/{output_folder_name}/{output_file_slug}/"
-        
-        section_title_for_breadcrumbs = "Unknown Section" 
-        for sec_data in sidebar_data_for_template:
-            if sec_data["output_folder_name"] == output_folder_name:
-                section_title_for_breadcrumbs = sec_data["title"]
-                break
-        page_breadcrumbs_base = f"{section_title_for_breadcrumbs} > {page_title_from_meta_or_file}"
+def get_page_hash(source_hash, file_item):
+    """
+    The hash of a page in the build manifest: the hash of its md file along with its default date
+    (see set_page_dates). A cached page is rendered again once that date changes, so with the
+    default "today" every page of a site shows the day of the same build.
+    """
+    return hash_text(f'{source_hash}\x00{file_item["default_date"]}')
 
-        search_index_entries.append({
-            "type": "page", "id": base_page_url, "page_title": page_title_from_meta_or_file,
-            "display_title": page_title_from_meta_or_file, "breadcrumbs": page_breadcrumbs_base,
-            "url": base_page_url, "searchable_text": f"{page_title_from_meta_or_file} {page_breadcrumbs_base}".lower(),
-            "date": page_meta.get('date', None)
-        })
 
-        content_soup = BeautifulSoup(body_content_html, 'html.parser')
-        
-        last_seen_parent_headings = {1: "", 2: "", 3: "", 4: "", 5: ""}
-
-        for h_tag in content_soup.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-            heading_text = h_tag.get_text(strip=True)
-            heading_slug = h_tag.get('id')
-            level_match = re.match(r'h([1-6])', h_tag.name)
-            if heading_text and heading_slug and level_match:
-                heading_level = int(level_match.group(1))
-
-                if heading_level <= 5: # We only track up to h5 as parents
-                    last_seen_parent_headings[heading_level] = heading_text
-                # Reset the state for all lower heading levels to ensure correct hierarchy
-                # e.g., when we find an H2, any previous H3 is no longer a parent
-                for level in range(heading_level + 1, 7):
-                    if level in last_seen_parent_headings:
-                        last_seen_parent_headings[level] = ""
-                
-                breadcrumb_trail_parts = [page_breadcrumbs_base]
-                for level in range(1, heading_level):
-                    if level in last_seen_parent_headings and last_seen_parent_headings[level]:
-                        breadcrumb_trail_parts.append(last_seen_parent_headings[level])
-                breadcrumb_trail_parts.append(heading_text)
-                
-                heading_breadcrumbs = " » ".join(breadcrumb_trail_parts)
-
-                heading_display_title = f"{page_title_from_meta_or_file} » {heading_text}"
-                
-                heading_url = f"{base_page_url}#{heading_slug}"
-                
-                search_index_entries.append({
-                    "type": "heading", "id": heading_url, "page_title": page_title_from_meta_or_file,
-                    "heading_text": heading_text, "heading_level": heading_level,
-                    "display_title": heading_display_title, 
-                    "breadcrumbs": heading_breadcrumbs,
-                    "url": heading_url, 
-                    "searchable_text": f"{page_title_from_meta_or_file} {heading_breadcrumbs} {heading_text}".lower(),
-                    "date": page_meta.get('date', None)
-                })
-
-
-        today = datetime.datetime.today()
-        day_val = today.day
-        if 4 <= day_val <= 20 or 24 <= day_val <= 30:
-            day_suffix = "th"
-        else:
-            day_suffix = ["st", "nd", "rd"][day_val % 10 - 1]
-        default_date = f"{str(day_val)}{day_suffix} {today.strftime('%B %Y')}"
-        render_date = page_meta.get('date', default_date)
-
-        prev_page_data = None
-        if i > 0:
-            prev_item = all_files_to_process[i-1]
-            prev_page_data = {"title": prev_item["display_title"], "url": f"/{prev_item['output_folder_name']}/{prev_item['output_file_slug']}/"}
-        
-        next_page_data = None
-        if i < len(all_files_to_process) - 1:
-            next_item = all_files_to_process[i+1]
-            next_page_data = {"title": next_item["display_title"], "url": f"/{next_item['output_folder_name']}/{next_item['output_file_slug']}/"}
-        
+def load_build_manifest(manifest_path):
+    """
+    Loads the build manifest written by the previous build.
+    Returns an empty dict if there is no manifest or it can't be read,
+    which makes the next build a full one.
+    """
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if not isinstance(manifest, dict) or manifest.get('version') != BUILD_MANIFEST_VERSION:
+        return {}
+    return manifest
+
+
+def save_build_manifest(manifest_path, manifest):
+    manifest_path = Path(manifest_path)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        # json.dumps runs in C, json.dump(obj, f) streams through the pure python encoder
+        f.write(json.dumps(manifest, ensure_ascii=False, indent=None))
+
+
+def compute_site_hash(docs_dir, sidebar_data_for_template):
+    """
+    Hashes everything that is shared by all pages: the rendered layout.html
+    (which already contains the template and the header from config.yaml),
+    config.yaml itself and the sidebar structure (which also decides prev/next links).
+    If this hash changes, every page has to be re-rendered.
+    """
+    docs_dir = Path(docs_dir)
+    parts = [str(BUILD_MANIFEST_VERSION)]
+    for shared_file in (docs_dir / 'templates' / 'layout.html', docs_dir / 'config.yaml'):
+        try:
+            parts.append(shared_file.read_text(encoding='utf-8'))
+        except FileNotFoundError:
+            parts.append('')
+    parts.append(json.dumps(sidebar_data_for_template, sort_keys=True))
+    return hash_text('\0'.join(parts))
+
+
+def convert_md_page(full_md_text_from_file):
+    """
+    Parses the front matter of an md file and converts its body.
+    This is the costly part of rendering a page and it only depends on the file itself,
+    so vai run keeps the result (see DevSite).
+
+    Returns:
+        {meta, body_html, headings, intro_text} (see convert_md_to_html)
+    """
+    from vai.markdown_converter import convert_md_to_html
+
+    page_meta, md_body_only_string = parse_metadata_and_body_from_string(full_md_text_from_file)
+    body_content_html, page_headings, page_intro_text = convert_md_to_html(md_body_only_string)
+    return {
+        "meta": page_meta,
+        "body_html": body_content_html,
+        "headings": page_headings,
+        "intro_text": page_intro_text,
+    }
+
+
+def render_md_file(i, all_files_to_process, sidebar_data_for_template, page_template, full_md_text_from_file):
+    """
+    Renders a single md file (the i-th one in all_files_to_process) into a full HTML page.
+
+    Returns:
+        rendered: the final HTML of the page
+        search_index_entries: the page and heading entries of this page for the search index
+    """
+    with build_profiler.stage('convert markdown'):
+        converted_page = convert_md_page(full_md_text_from_file)
+    return render_converted_page(i, all_files_to_process, sidebar_data_for_template, page_template, converted_page)
+
+
+def make_search_index_entries(i, all_files_to_process, converted_page):
+    """
+    Returns the page and heading entries for the search index of a page converted by convert_md_page.
+    Unlike the rest of render_converted_page this doesn't need the layout, so vai run --memory
+    can index pages it hasn't rendered.
+    """
+    file_item = all_files_to_process[i]
+    search_index_entries = []
+
+    page_meta = converted_page["meta"]
+    page_headings = converted_page["headings"]
+    page_intro_text = converted_page["intro_text"]
+
+    page_title_from_meta_or_file = page_meta.get('title', file_item["display_title"])
+    base_page_url = file_item["url"]
+    page_breadcrumbs_base = f"{file_item['section_title']} > {page_title_from_meta_or_file}"
+
+    search_index_entries.append({
+        "type": "page", "id": base_page_url, "page_title": page_title_from_meta_or_file,
+        "display_title": page_title_from_meta_or_file, "breadcrumbs": page_breadcrumbs_base,
+        "url": base_page_url, "searchable_text": f"{page_title_from_meta_or_file} {page_breadcrumbs_base}".lower(),
+        "date": page_meta.get('date', None), "body_text": page_intro_text
+    })
+
+    # the headings above the current one, as (level, breadcrumbs down to that heading)
+    parent_headings = []
+
+    for heading in page_headings:
+        heading_text = heading["text"]
+        heading_slug = heading["id"]
+        if heading_text:
+            heading_level = heading["level"]
+
+            # e.g., when we find an H2, any previous H2 or H3 is no longer a parent
+            while parent_headings and parent_headings[-1][0] >= heading_level:
+                parent_headings.pop()
+            parent_breadcrumbs = parent_headings[-1][1] if parent_headings else page_breadcrumbs_base
+            heading_breadcrumbs = f"{parent_breadcrumbs} » {heading_text}"
+            if heading_level <= 5: # We only track up to h5 as parents
+                parent_headings.append((heading_level, heading_breadcrumbs))
+
+            heading_display_title = f"{page_title_from_meta_or_file} » {heading_text}"
+            
+            heading_url = f"{base_page_url}#{heading_slug}"
+            
+            search_index_entries.append({
+                "type": "heading", "id": heading_url, "page_title": page_title_from_meta_or_file,
+                "heading_text": heading_text, "heading_level": heading_level,
+                "display_title": heading_display_title, 
+                "breadcrumbs": heading_breadcrumbs,
+                "url": heading_url, 
+                "searchable_text": f"{page_title_from_meta_or_file} {heading_breadcrumbs} {heading_text}".lower(),
+                "date": page_meta.get('date', None), "body_text": heading["body_text"]
+            })
+
+    return search_index_entries
+
+
+# the values of layout.html that differ from page to page (see render_converted_page),
+# everything else in a page (the sidebar above all) is the same for every page of a build
+PAGE_TEMPLATE_VARIABLES = ('title', 'body_content', 'toc_table_link', 'date', 'prev_page_data', 'next_page_data')
+PAGE_LINK_VARIABLES = ('prev_page_data', 'next_page_data')
+PAGE_LINK_ATTRIBUTES = ('url', 'title')
+SIDEBAR_FRAGMENT_FILE_NAME = "sidebar.{hash}.html"
+# takes the place of the sidebar in pages built with --sidebar-fragment, script.js swaps it for the fragment
+SIDEBAR_FRAGMENT_PLACEHOLDER = '<a href="{url}" data-vai-sidebar hidden></a>'
+
+
+class PageValueMarker:
+    """stands in for a page value while LayoutTemplate renders a shell"""
+    def __init__(self, name):
+        self.name = name
+
+    def __str__(self):
+        return f"\x00{self.name}\x00"
+
+    def __html__(self):
+        return str(self)
+
+
+def get_page_value_outputs(template_ast):
+    """
+    How the layout outputs the page values, if only in ways a shell can be filled in for:
+    {{ title }}, {{ body_content|safe }}, {{ prev_page_data.url }} / .title and {% if prev_page_data %}
+    (the same for next_page_data). Anything else (other filters, tests, includes...) might do
+    something with the value, so such layouts are rendered in full for every page.
+
+    Returns:
+        {value name: True if output with |safe}, e.g. {'title': False, 'prev_page_data.url': False},
+        None if the layout can't be rendered into shells
+    """
+    from jinja2 import nodes
+
+    outputs = {}
+
+    def add_output(name, is_safe):
+        # the markers don't say how they were output, so each value is output one way only
+        return outputs.setdefault(name, is_safe) == is_safe
+
+    def check_name(node, parent, grandparent):
+        if node.name in PAGE_LINK_VARIABLES:
+            if isinstance(parent, nodes.Getattr) and parent.attr in PAGE_LINK_ATTRIBUTES and isinstance(grandparent, nodes.Output):
+                return add_output(f"{node.name}.{parent.attr}", False)
+            return isinstance(parent, nodes.If) and parent.test is node
+        if isinstance(parent, nodes.Output):
+            return add_output(node.name, False)
+        if isinstance(parent, nodes.Filter) and parent.name == 'safe' and not parent.args and isinstance(grandparent, nodes.Output):
+            return add_output(node.name, True)
+        return False
+
+    def walk(node, parent=None, grandparent=None):
+        if isinstance(node, (nodes.Extends, nodes.Include, nodes.Import, nodes.FromImport)):
+            return False
+        if isinstance(node, nodes.Name) and node.name in PAGE_TEMPLATE_VARIABLES and not check_name(node, parent, grandparent):
+            return False
+        return all(walk(child, node, parent) for child in node.iter_child_nodes())
+
+    return outputs if walk(template_ast) else None
+
+
+def split_out_sidebar(full_html, empty_sidebar_html):
+    """
+    Finds the sidebar in a page rendered with and without sidebar_data.
+
+    Returns:
+        (position, fragment): full_html is empty_sidebar_html with fragment inserted at position,
+        or None if the difference is not a run of whole elements
+    """
+    if full_html == empty_sidebar_html:
+        return None
+    prefix_length = len(os.path.commonprefix([full_html, empty_sidebar_html]))
+    suffix_length = len(os.path.commonprefix([full_html[::-1], empty_sidebar_html[::-1]]))
+    suffix_length = min(suffix_length, len(empty_sidebar_html) - prefix_length)
+    fragment = full_html[prefix_length:len(full_html) - suffix_length]
+    if (
+        '\x00' in fragment
+        or not fragment.strip().startswith('<') or not fragment.strip().endswith('>')
+        or not empty_sidebar_html[:prefix_length].rstrip().endswith('>')
+        or not empty_sidebar_html[prefix_length:].lstrip().startswith('<')
+    ):
+        return None
+    return prefix_length, fragment
+
+
+class LayoutTemplate:
+    """
+    layout.html, rendered once per build rather than once per page.
+
+    Only the PAGE_TEMPLATE_VARIABLES differ between pages, so the layout is rendered once for
+    every combination of prev/next links into a shell, with markers (see PageValueMarker) where the
+    page values go. Rendering a page then only fills in its values. The shells are made again when
+    a different sidebar_data is passed. Layouts that use the page values in other ways
+    (see get_page_value_outputs) are rendered in full for every page, as before.
+
+    render() takes the same arguments as a jinja Template, which this stands in for.
+
+    With sidebar_fragment the sidebar is left out of the pages. It is written once as a shared
+    file (see get_sidebar_fragment) and the pages only carry a link to it, which script.js replaces
+    with the fragment. The sidebar stays in the pages if it can't be split out of the layout.
+    """
+    def __init__(self, environment, source, sidebar_fragment=False):
+        self.template = environment.from_string(source)
+        self.autoescape = environment.autoescape
+        self.page_value_outputs = None
+        if isinstance(environment.autoescape, bool) and environment.finalize is None:
+            self.page_value_outputs = get_page_value_outputs(environment.parse(source))
+        self.use_shells = self.page_value_outputs is not None
+        self.sidebar_fragment = sidebar_fragment
+        self.sidebar_data = None
+        self.shells = {}
+        self.sidebar_fragment_html = None
+
+    def render_with_markers(self, sidebar_data, has_prev, has_next):
+        context = {name: PageValueMarker(name) for name in PAGE_TEMPLATE_VARIABLES}
+        for name, has_link in zip(PAGE_LINK_VARIABLES, (has_prev, has_next)):
+            context[name] = {attribute: PageValueMarker(f"{name}.{attribute}") for attribute in PAGE_LINK_ATTRIBUTES} if has_link else None
+        return self.template.render(sidebar_data=sidebar_data, **context)
+
+    def set_sidebar_data(self, sidebar_data):
+        if sidebar_data is self.sidebar_data:
+            return
+        self.sidebar_data = sidebar_data
+        self.shells = {}
+        self.sidebar_fragment_html = None
+        if self.sidebar_fragment and self.use_shells:
+            # taken from the page with both links, the other kinds of page must have the same sidebar
+            split = split_out_sidebar(self.render_with_markers(sidebar_data, True, True), self.render_with_markers([], True, True))
+            self.sidebar_fragment_html = split[1] if split else None
+
+    def get_sidebar_fragment(self, sidebar_data):
+        """
+        Returns:
+            (fragment html, url) of the sidebar left out of the pages, None if the pages keep it
+        """
+        self.set_sidebar_data(sidebar_data)
+        if self.sidebar_fragment_html is None:
+            return None
+        fragment_hash = hash_text(self.sidebar_fragment_html)[:ASSET_HASH_LENGTH]
+        return self.sidebar_fragment_html, '/' + SIDEBAR_FRAGMENT_FILE_NAME.format(hash=fragment_hash)
+
+    def get_shell(self, has_prev, has_next):
+        """the layout split at the markers: literal html at even positions, marker names at odd ones (None if it can't be split)"""
+        if (has_prev, has_next) not in self.shells:
+            shell_html = self.render_with_markers(self.sidebar_data, has_prev, has_next)
+            sidebar_fragment = self.get_sidebar_fragment(self.sidebar_data)
+            if sidebar_fragment:
+                split = split_out_sidebar(shell_html, self.render_with_markers([], has_prev, has_next))
+                if split and split[1] == sidebar_fragment[0]:
+                    position, fragment = split
+                    placeholder = SIDEBAR_FRAGMENT_PLACEHOLDER.format(url=sidebar_fragment[1])
+                    shell_html = shell_html[:position] + placeholder + shell_html[position + len(fragment):]
+            shell = shell_html.split('\x00')
+            # a stray \x00 in the layout or the sidebar would throw the markers off
+            self.shells[(has_prev, has_next)] = shell if len(shell) % 2 == 1 else None
+        return self.shells[(has_prev, has_next)]
+
+    def render(self, **context):
+        if not self.use_shells or set(context) != {'sidebar_data', *PAGE_TEMPLATE_VARIABLES}:
+            return self.template.render(**context)
+        from markupsafe import escape
+
+        self.set_sidebar_data(context['sidebar_data'])
+        shell = self.get_shell(bool(context['prev_page_data']), bool(context['next_page_data']))
+        if shell is None:
+            return self.template.render(**context)
+        parts = shell[:]
+        for n in range(1, len(shell), 2):
+            name = shell[n]
+            variable, _, attribute = name.partition('.')
+            value = context[variable][attribute] if attribute else context[variable]
+            parts[n] = str(escape(value)) if self.autoescape and not self.page_value_outputs[name] else str(value)
+        return ''.join(parts)
+
+
+def render_converted_page(i, all_files_to_process, sidebar_data_for_template, page_template, converted_page):
+    """
+    Second half of render_md_file: puts a page converted by convert_md_page into the layout
+    and makes its search index entries. Everything here depends on the rest of the site
+    (sidebar, prev/next pages), so it is redone whenever the site structure changes.
+    """
+    file_item = all_files_to_process[i]
+    page_meta = converted_page["meta"]
+    body_content_html = converted_page["body_html"]
+    toc_table_link_html = generate_heading_links(converted_page["headings"])
+    page_title_from_meta_or_file = page_meta.get('title', file_item["display_title"])
+    search_index_entries = make_search_index_entries(i, all_files_to_process, converted_page)
+
+    render_date = page_meta.get('date', file_item["default_date"])
+
+    with build_profiler.stage('render template'):
         rendered = page_template.render(
             body_content=body_content_html,
             toc_table_link=toc_table_link_html,
             sidebar_data=sidebar_data_for_template,
             title=page_title_from_meta_or_file,
             date=render_date,
-            prev_page_data=prev_page_data,
-            next_page_data=next_page_data,
+            prev_page_data=file_item["prev_page"],
+            next_page_data=file_item["next_page"],
 
         )
+    return rendered, search_index_entries
+
+
+RE_SEARCH_TOKEN = re.compile(r'\w+')
+
+
+def tokenize_search_text(text):
+    """splits text into lowercased word tokens. static/search_worker.js tokenizes queries the same way"""
+    return RE_SEARCH_TOKEN.findall(text.lower())
+
+
+def get_search_shard_name(token):
+    """
+    Name of the shard file that holds a token: its first SEARCH_INDEX_SHARD_PREFIX_LENGTH characters,
+    with anything that is not a-z or 0-9 written as _<hex code point>_ so it is safe as a file name.
+    Must match searchShardName in static/search_worker.js
+    """
+    return ''.join(
+        c if ('a' <= c <= 'z' or '0' <= c <= '9') else f'_{ord(c):x}_'
+        for c in token[:SEARCH_INDEX_SHARD_PREFIX_LENGTH]
+    )
+
+
+def get_search_fields(entry):
+    """the texts of a search index entry that are indexed, by field (see SEARCH_FIELD_WEIGHTS)"""
+    if entry["type"] == "page":
+        fields = {"title": entry["page_title"], "breadcrumbs": entry["breadcrumbs"]}
+    else:
+        fields = {"heading": entry["heading_text"], "breadcrumbs": entry["breadcrumbs"]}
+    fields["body"] = entry.get("body_text", "")
+    return fields
+
+
+def score_search_postings(term_frequencies):
+    """
+    BM25F score of every token in every entry.
+
+    term_frequencies holds, for every entry, {field: (field length in tokens, {token: count})}.
+    The count of a token in each field is normalised by the field's length against the average
+    length of that field, weighted by SEARCH_FIELD_WEIGHTS and summed, then saturated with k1
+    and multiplied by the token's idf as in BM25.
+
+    Returns {token: [(entry id, score)]}, entry ids ascending
+    """
+    field_length_totals = {}
+    field_counts = {}
+    document_frequency = {}
+    for entry_fields in term_frequencies:
+        entry_tokens = set()
+        for field, (field_length, counts) in entry_fields.items():
+            field_length_totals[field] = field_length_totals.get(field, 0) + field_length
+            field_counts[field] = field_counts.get(field, 0) + 1
+            entry_tokens.update(counts)
+        for token in entry_tokens:
+            document_frequency[token] = document_frequency.get(token, 0) + 1
+    average_field_length = {
+        field: (field_length_totals[field] / field_counts[field]) or 1 for field in field_length_totals
+    }
+
+    entry_count = len(term_frequencies)
+    idf = {
+        token: math.log(1 + (entry_count - df + 0.5) / (df + 0.5))
+        for token, df in document_frequency.items()
+    }
+
+    postings = {}
+    for entry_id, entry_fields in enumerate(term_frequencies):
+        weighted_frequencies = {}
+        for field, (field_length, counts) in entry_fields.items():
+            length_norm = 1 - SEARCH_BM25_B + SEARCH_BM25_B * field_length / average_field_length[field]
+            weight = SEARCH_FIELD_WEIGHTS[field] / length_norm
+            for token, count in counts.items():
+                weighted_frequencies[token] = weighted_frequencies.get(token, 0) + weight * count
+        for token, weighted_frequency in weighted_frequencies.items():
+            score = idf[token] * weighted_frequency / (SEARCH_BM25_K1 + weighted_frequency)
+            postings.setdefault(token, []).append((entry_id, score))
+    return postings
+
+
+def build_search_index(search_index_entries):
+    """
+    Turns the search index entries of all pages (see render_md_file) into the compact, sharded,
+    ranked inverted index that static/search_worker.js loads.
+
+    index.json holds the tables every search needs:
+        pages: [title, breadcrumbs, url] once per page, instead of repeating them in every heading entry
+        entries: [page] for a page or [page, heading text, heading level, anchor, parent entry] for a heading.
+                 The breadcrumbs of a heading are rebuilt from its parent entries in the browser
+        shards: names of the shard files
+    Each shard ({shard name}.json) maps the tokens starting with the same characters to their postings,
+    a flat [entry id, score, entry id, score, ...] list where score is the BM25F score of the token in
+    that entry (see score_search_postings) in hundredths. The browser only fetches the shards of the
+    words being typed and adds up the scores of the postings, it never scans the whole site.
+
+    Returns:
+        index: content of index.json
+        shards: {shard name: {token: postings}}
+    """
+    pages = []
+    entries = []
+    term_frequencies = []
+    page_index = -1
+    parent_entry_by_level = {}
+
+    for entry in search_index_entries:
+        entry_id = len(entries)
+        if entry["type"] == "page":
+            pages.append([entry["page_title"], entry["breadcrumbs"], entry["url"]])
+            page_index = len(pages) - 1
+            parent_entry_by_level = {}
+            entries.append([page_index])
+        else:
+            heading_level = entry["heading_level"]
+            # parent = closest previous heading of a higher level, same as the breadcrumbs in render_md_file
+            parent_entry = -1
+            for level in range(heading_level - 1, 0, -1):
+                if level in parent_entry_by_level:
+                    parent_entry = parent_entry_by_level[level]
+                    break
+            parent_entry_by_level[heading_level] = entry_id
+            for level in range(heading_level + 1, 7):
+                parent_entry_by_level.pop(level, None)
+
+            anchor = entry["url"].split('#', 1)[1]
+            entries.append([page_index, entry["heading_text"], heading_level, anchor, parent_entry])
+
+        entry_fields = {}
+        for field, text in get_search_fields(entry).items():
+            tokens = tokenize_search_text(text)
+            entry_fields[field] = (len(tokens), collections.Counter(tokens))
+        term_frequencies.append(entry_fields)
+
+    shards = {}
+    postings = score_search_postings(term_frequencies)
+    for token in sorted(postings):
+        flat_postings = []
+        for entry_id, score in postings[token]:
+            flat_postings += [entry_id, max(1, round(score * 100))]
+        shards.setdefault(get_search_shard_name(token), {})[token] = flat_postings
+
+    index = {
+        "version": SEARCH_INDEX_VERSION,
+        "shard_prefix_length": SEARCH_INDEX_SHARD_PREFIX_LENGTH,
+        "pages": pages,
+        "entries": entries,
+        "shards": sorted(shards),
+    }
+    return index, shards
+
+
+def make_search_index_files(search_index_entries, legacy_search_index=False):
+    """
+    Returns {path relative to the site root: json text} of the sharded search index
+    (see build_search_index) and, with legacy_search_index, of the old single search_index.json
+    for sites whose static/script.js predates the sharded index.
+    """
+    index, shards = build_search_index(search_index_entries)
+    search_index_files = {
+        f"{SEARCH_INDEX_DIR_NAME}/index.json": json.dumps(index, ensure_ascii=False, separators=(',', ':')),
+    }
+    for shard_name, shard in shards.items():
+        search_index_files[f"{SEARCH_INDEX_DIR_NAME}/{shard_name}.json"] = json.dumps(shard, ensure_ascii=False, separators=(',', ':'))
+
+    if legacy_search_index:
+        legacy_entries = [
+            {key: value for key, value in entry.items() if key != "body_text"}
+            for entry in search_index_entries
+        ]
+        search_index_files[LEGACY_SEARCH_INDEX_FILE_NAME] = json.dumps(legacy_entries, ensure_ascii=False, indent=None)
+    return search_index_files
+
+
+def write_search_index(search_index_entries, dist_base_path, legacy_search_index=False):
+    """Writes the search index files (see make_search_index_files) to dist_base_path"""
+    search_index_files = make_search_index_files(search_index_entries, legacy_search_index)
+    search_index_dir = Path(dist_base_path) / SEARCH_INDEX_DIR_NAME
+    search_index_dir.mkdir(parents=True, exist_ok=True)
+
+    for relative_path, content in search_index_files.items():
+        with open(Path(dist_base_path) / relative_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+    # shards that are gone are removed last, instead of clearing the folder first,
+    # so the dev server never serves a site without a search index while it is rewritten
+    for old_file in search_index_dir.iterdir():
+        if f"{SEARCH_INDEX_DIR_NAME}/{old_file.name}" not in search_index_files:
+            old_file.unlink()
+
+    legacy_search_index_path = Path(dist_base_path) / LEGACY_SEARCH_INDEX_FILE_NAME
+    if not legacy_search_index and legacy_search_index_path.exists():
+        legacy_search_index_path.unlink()
+
+
+def uses_legacy_search_index(static_dir='static'):
+    """True if the site's script.js (copied by vai init from an older version) still fetches search_index.json"""
+    script_path = Path(static_dir) / 'script.js'
+    try:
+        return LEGACY_SEARCH_INDEX_FILE_NAME in script_path.read_text(encoding='utf-8')
+    except (FileNotFoundError, UnicodeDecodeError):
+        return False
 
-        output_dir = dist_base_path / output_folder_name / output_file_slug
-        output_dir.mkdir(parents=True, exist_ok=True)
-        (output_dir / "index.html").write_text(rendered, encoding="utf-8")
 
-    search_index_file_path = dist_base_path / "search_index.json"
-    with open(search_index_file_path, 'w', encoding='utf-8') as f:
-        json.dump(search_index_entries, f, ensure_ascii=False, indent=None)
+# state of a render worker process, set once per worker by init_render_worker
+_render_worker_state = {}
 
-def build():
+
+def init_render_worker(all_files_to_process, sidebar_data_for_template, layout_template_source, autoescape, finalize_page, highlight_cache_path=None, profile=False, sidebar_fragment=False):
+    """
+    Runs once in every worker process of a parallel build.
+    Jinja templates can't be sent to other processes, so each worker compiles
+    layout.html from its source and keeps it (and its shells, see LayoutTemplate) for all the pages it renders.
+    Each worker also starts from the highlight cache saved by the previous build.
+    With profile the worker records its stages too (see BuildProfiler).
+    """
+    from jinja2 import Environment
+    from vai.markdown_converter import highlight_cache
+
+    if profile:
+        build_profiler.enable()
+    if highlight_cache_path:
+        highlight_cache.load(highlight_cache_path)
+    worker_env = Environment(autoescape=autoescape)
+    _render_worker_state['all_files_to_process'] = all_files_to_process
+    _render_worker_state['sidebar_data_for_template'] = sidebar_data_for_template
+    _render_worker_state['page_template'] = LayoutTemplate(worker_env, layout_template_source, sidebar_fragment)
+    _render_worker_state['finalize_page'] = finalize_page
+
+
+def render_md_file_in_worker(page_to_render):
+    from vai.markdown_converter import highlight_cache
+
+    i, full_md_text_from_file = page_to_render
+    all_files_to_process = _render_worker_state['all_files_to_process']
+    with build_profiler.stage('page', page=all_files_to_process[i]["original_path"].as_posix()):
+        rendered, search_index_entries = render_md_file(
+            i,
+            all_files_to_process,
+            _render_worker_state['sidebar_data_for_template'],
+            _render_worker_state['page_template'],
+            full_md_text_from_file,
+        )
+        finalize_page = _render_worker_state['finalize_page']
+        if finalize_page:
+            with build_profiler.stage('minify page'):
+                rendered = finalize_page(rendered)
+    # blocks highlighted for this page and the counts go back to the main process's cache,
+    # and so do the stages recorded for it when profiling
+    highlight_cache_update = (highlight_cache.take_new_entries(), highlight_cache.hits, highlight_cache.misses)
+    highlight_cache.hits = highlight_cache.misses = 0
+    return rendered, search_index_entries, highlight_cache_update, build_profiler.take_events()
+
+
+def render_pages_in_parallel(pages_to_render, all_files_to_process, sidebar_data_for_template, layout_template_source, autoescape, jobs, finalize_page=None, highlight_cache_path=None, sidebar_fragment=False):
+    """
+    Renders (i, md text) pairs over a pool of `jobs` processes.
+    Results are returned in the same order as pages_to_render so the output
+    is identical to a serial build.
+    What the workers add to their highlight caches is merged into the one of this process.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from vai.markdown_converter import highlight_cache
+
+    chunksize = max(1, len(pages_to_render) // (jobs * 4))
+    rendered_pages = []
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=init_render_worker,
+        initargs=(
+            all_files_to_process, sidebar_data_for_template, layout_template_source, autoescape, finalize_page,
+            highlight_cache_path, build_profiler.enabled, sidebar_fragment,
+        ),
+    ) as executor:
+        for rendered, search_index_entries, highlight_cache_update, profile_events in executor.map(render_md_file_in_worker, pages_to_render, chunksize=chunksize):
+            highlight_cache.merge(*highlight_cache_update)
+            build_profiler.add_events(profile_events)
+            rendered_pages.append((rendered, search_index_entries))
+    return rendered_pages
+
+
+def process_md_files(all_files_to_process, dist_base_path, sidebar_data_for_template, jinja_env, cached_pages=None, jobs=1, finalize_page=None, legacy_search_index=False, highlight_cache_path=None, index_pages='copy', sidebar_fragment=False, client_navigation=False):
+    """
+    Takes the list of md files from src and processes each one to generate the final HTML page.
+    It also builds a hierarchical search index
+
+    cached_pages are the page entries of the previous build manifest (see build()).
+    A page whose source hash is unchanged and whose output still exists is not
+    re-rendered, its search index entries are reused instead.
+
+    If jobs > 1, pages are rendered over a pool of that many processes.
+    Files and search index entries are still written in page order.
+    The workers load their highlight cache from highlight_cache_path.
+
+    finalize_page (optional) is applied to every rendered page before it is written,
+    e.g. minification for vai build. It runs in the render workers, so it has
+    to be picklable (a module level function or a functools.partial of one).
+
+    The search index is written with write_search_index, and the section/root indexes (see
+    make_index_page for the index_pages modes) are written along with the pages they show.
+    With sidebar_fragment the sidebar is written once to its own file instead of into every page
+    (see LayoutTemplate). With client_navigation every page (and index showing it) gets a content.json
+    for script.js to swap in, see make_page_content.
+
+    Returns:
+        manifest_pages: {source path: {hash, output, search_index_entries}} for the new build manifest
+    """    
+    search_index_entries = []
+    manifest_pages = {}
+    cached_pages = cached_pages or {}
+    index_folders_by_page = get_index_pages(sidebar_data_for_template)
+    layout_template_source = jinja_env.loader.get_source(jinja_env, 'layout.html')[0]
+    page_template = LayoutTemplate(jinja_env, layout_template_source, sidebar_fragment)
+
+    if sidebar_fragment:
+        fragment = page_template.get_sidebar_fragment(sidebar_data_for_template)
+        if fragment:
+            fragment_html, fragment_url = fragment
+            (dist_base_path / fragment_url.lstrip('/')).write_text(finalize_page(fragment_html) if finalize_page else fragment_html, encoding='utf-8')
+        else:
+            print("Warning: the sidebar could not be split out of layout.html, it stays in every page.")
+
+    # first pass: read every md file and work out which ones have to be rendered
+    pages = []
+    pages_to_render = []
+    with build_profiler.stage('read sources'):
+        for i, file_item in enumerate(all_files_to_process):
+            md_path = file_item["original_path"]
+            output_folder_name = file_item["output_folder_name"]
+            output_file_slug = file_item["output_file_slug"]
+
+            try:
+                full_md_text_from_file = md_path.read_text(encoding="utf-8")
+            except Exception as e:
+                print(f"Error reading file {md_path}: {e}. Skipping.")
+                continue
+
+            source_hash = get_page_hash(hash_text(full_md_text_from_file), file_item)
+            output_dir = dist_base_path / output_folder_name / output_file_slug
+            cached_page = cached_pages.get(md_path.as_posix())
+
+            is_cached = bool(cached_page and cached_page.get('hash') == source_hash and (output_dir / "index.html").exists())
+            if not is_cached:
+                pages_to_render.append((i, full_md_text_from_file))
+            pages.append((i, source_hash, is_cached))
+
+    with build_profiler.stage('render pages'):
+        if jobs > 1 and len(pages_to_render) > 1:
+            rendered_pages = render_pages_in_parallel(
+                pages_to_render, all_files_to_process, sidebar_data_for_template, layout_template_source, jinja_env.autoescape,
+                jobs, finalize_page, highlight_cache_path=highlight_cache_path, sidebar_fragment=sidebar_fragment,
+            )
+        else:
+            rendered_pages = []
+            for i, full_md_text_from_file in pages_to_render:
+                with build_profiler.stage('page', page=all_files_to_process[i]["original_path"].as_posix()):
+                    rendered, page_search_entries = render_md_file(
+                        i, all_files_to_process, sidebar_data_for_template, page_template, full_md_text_from_file
+                    )
+                    if finalize_page:
+                        with build_profiler.stage('minify page'):
+                            rendered = finalize_page(rendered)
+                rendered_pages.append((rendered, page_search_entries))
+    rendered_pages_by_index = {i: rendered_page for (i, _), rendered_page in zip(pages_to_render, rendered_pages)}
+
+    # second pass: write the rendered pages and merge the search index in page order
+    missing_regions_reported = False
+    with build_profiler.stage('write pages'):
+        for i, source_hash, is_cached in pages:
+            file_item = all_files_to_process[i]
+            page_key = file_item["original_path"].as_posix()
+            output_folder_name = file_item["output_folder_name"]
+            output_file_slug = file_item["output_file_slug"]
+
+            index_folders = index_folders_by_page.get((output_folder_name, output_file_slug), [])
+            if is_cached:
+                page_search_entries = cached_pages[page_key]['search_index_entries']
+                # the indexes of a cached page are still there from the build that rendered it
+                missing_index_folders = [folder for folder in index_folders if not (dist_base_path / folder / "index.html").exists()]
+                if missing_index_folders:
+                    rendered = (dist_base_path / output_folder_name / output_file_slug / "index.html").read_text(encoding="utf-8")
+                    write_index_pages(dist_base_path, missing_index_folders, output_folder_name, output_file_slug, rendered, index_pages)
+            else:
+                rendered, page_search_entries = rendered_pages_by_index[i]
+                with build_profiler.stage('write page', page=page_key):
+                    page_content = make_page_content(rendered) if client_navigation else None
+                    if page_content:
+                        rendered = insert_into_head(rendered, CLIENT_NAVIGATION_META)
+                    elif client_navigation and not missing_regions_reported:
+                        print(f"Warning: layout.html has no <title> or no element with one of the ids {', '.join(CLIENT_NAVIGATION_REGIONS)}, pages without them load in full.")
+                        missing_regions_reported = True
+                    output_dir = dist_base_path / output_folder_name / output_file_slug
+                    output_dir.mkdir(parents=True, exist_ok=True)
+                    (output_dir / "index.html").write_text(rendered, encoding="utf-8")
+                    write_index_pages(dist_base_path, index_folders, output_folder_name, output_file_slug, rendered, index_pages)
+                    if page_content:
+                        # a redirect index has nothing to swap in, script.js then loads the page in full
+                        content_folders = [output_dir] + ([dist_base_path / folder for folder in index_folders] if index_pages != 'redirect' else [])
+                        for content_folder in content_folders:
+                            (content_folder / CLIENT_NAVIGATION_FILE_NAME).write_text(page_content, encoding="utf-8")
+
+            search_index_entries.extend(page_search_entries)
+            manifest_pages[page_key] = {
+                "hash": source_hash,
+                "output": f"{output_folder_name}/{output_file_slug}",
+                "search_index_entries": page_search_entries,
+            }
+
+    with build_profiler.stage('search index'):
+        write_search_index(search_index_entries, dist_base_path, legacy_search_index=legacy_search_index)
+
+    return manifest_pages
+
+def build(jobs=1, production=False, url_rewriter=None, hash_assets=False, index_pages='copy', sidebar_fragment=False, page_dates='today', compress=False, client_navigation=False):
     """converts all the md files from src_md to html files in
     src_html while retaining the folder structure. (numbers will be excluded
     but position retains in frontend)
-    """
-    sidebar_data_for_redirect = []
-    root_redirect_target_url = "/" 
 
+    jobs is the number of processes used to render pages (see process_md_files).
+
+    The build is incremental. A manifest kept in .vai_cache records a hash of every
+    md file and of everything shared by all pages (layout, config.yaml, sidebar).
+    If the shared hash is unchanged, only the md files that changed are re-rendered.
+    Otherwise src_html is wiped and every page is rendered again.
+    Highlighted code blocks are cached in .vai_cache too (see HighlightCache), for every kind of build.
+
+    With production=True (vai build) the pages are minified right after rendering and
+    written straight to dist, and static assets are minified on the way as well.
+    This is always a full build and src_html is left untouched.
+    url_rewriter (a UrlPrefixRewriter), if given, rewrites the site's urls for a base path deployment.
+    With hash_assets the static assets also get content hashed names that the pages link to, and
+    dist/asset_manifest.json maps every asset to its hashed name (see process_static_assets).
+    index_pages is how the section and root urls show their first page, see make_index_page.
+    With sidebar_fragment (production only) the pages load the sidebar from one shared file, see LayoutTemplate.
+    With client_navigation (production only) script.js opens the pages of the site without reloading, see make_page_content.
+    page_dates is where pages without a date in their front matter get one from, see set_page_dates.
+    With compress (production only) .gz and .br files are written next to the output, see compress_output.
+    Production builds end with dist/deploy_manifest.json, see write_deploy_manifest.
+
+    Returns:
+        all_files_to_process, sidebar_data: the site structure (see scan_src), used by vai run
+    """
+    from jinja2 import Environment, FileSystemLoader
+    from vai.markdown_converter import highlight_cache
 
     DOCS_DIR = Path("./") 
 
-    setup_header_in_layout_html()
+    with build_profiler.stage('setup header'):
+        setup_header_in_layout_html()
 
     current_env = Environment(
         loader=FileSystemLoader(str(DOCS_DIR / 'templates')),  
         autoescape=True
     )
 
-
-    src_html_path_obg = DOCS_DIR / 'src_html'
-    if src_html_path_obg.exists():
-        shutil.rmtree(src_html_path_obg)
-    src_html_path_obg.mkdir(parents=True, exist_ok=True)
-
-    copy_static_assets(static_src_dir=str(DOCS_DIR / 'static'), dst_dir=str(src_html_path_obg / 'static'))
-
-    all_files_to_process, sidebar_data = scan_src(src_dir_path=str(DOCS_DIR / 'src_md'))
-    sidebar_data_for_redirect = sidebar_data
-
-    if sidebar_data and sidebar_data[0].get('files') and len(sidebar_data[0]['files']) > 0:
-        first_section_slug_for_root = sidebar_data[0]['output_folder_name']
-        first_file_slug_for_root = sidebar_data[0]['files'][0]['slug']
-        root_redirect_target_url = f"/{first_section_slug_for_root}/{first_file_slug_for_root}/"
+    with build_profiler.stage('scan src'):
+        all_files_to_process, sidebar_data = scan_src(src_dir_path=str(DOCS_DIR / 'src_md'))
+    if page_dates != 'today':
+        with build_profiler.stage('page dates'):
+            set_page_dates(
+                all_files_to_process, page_dates, src_dir_path=str(DOCS_DIR / 'src_md'),
+                cache_path=DOCS_DIR / BUILD_CACHE_DIR_NAME / PAGE_DATES_CACHE_FILE_NAME,
+            )
+
+    manifest_path = DOCS_DIR / BUILD_CACHE_DIR_NAME / BUILD_MANIFEST_FILE_NAME
+    highlight_cache_path = DOCS_DIR / BUILD_CACHE_DIR_NAME / HIGHLIGHT_CACHE_FILE_NAME
+    with build_profiler.stage('load caches'):
+        site_hash = compute_site_hash(DOCS_DIR, sidebar_data)
+        highlight_cache.load(highlight_cache_path)
+        previous_manifest = {} if production else load_build_manifest(manifest_path)
+
+    # the name is kept from when this was always src_html. For production builds it is dist
+    src_html_path_obg = DOCS_DIR / ('dist' if production else 'src_html')
+    cached_pages = None
+    if previous_manifest.get('site_hash') == site_hash and src_html_path_obg.exists():
+        cached_pages = previous_manifest.get('pages', {})
     else:
-         root_redirect_target_url = "/"
+        with build_profiler.stage('clean output'):
+            if src_html_path_obg.exists():
+                shutil.rmtree(src_html_path_obg)
+            src_html_path_obg.mkdir(parents=True, exist_ok=True)
+
+    finalize_page = None
+    with build_profiler.stage('static assets'):
+        if production:
+            asset_names = process_static_assets(
+                static_src_dir=str(DOCS_DIR / 'static'),
+                dst_dir=str(src_html_path_obg / 'static'),
+                url_rewriter=url_rewriter,
+                hash_names=hash_assets,
+                asset_hashes_path=DOCS_DIR / BUILD_CACHE_DIR_NAME / ASSET_HASHES_FILE_NAME,
+            )
+            if hash_assets:
+                with open(src_html_path_obg / ASSET_MANIFEST_FILE_NAME, 'w', encoding='utf-8') as f:
+                    f.write(json.dumps(asset_names, ensure_ascii=False, indent=2, sort_keys=True))
+                url_rewriter = url_rewriter or UrlPrefixRewriter()
+                url_rewriter.asset_names = asset_names
+            finalize_page = functools.partial(finalize_html_page, url_rewriter=url_rewriter)
+        else:
+            copy_static_assets(static_src_dir=str(DOCS_DIR / 'static'), dst_dir=str(src_html_path_obg / 'static'))
 
-    process_md_files(
+    manifest_pages = process_md_files(
         all_files_to_process,
         src_html_path_obg,
         sidebar_data,
-        current_env
+        current_env,
+        cached_pages=cached_pages,
+        jobs=jobs,
+        finalize_page=finalize_page,
+        legacy_search_index=uses_legacy_search_index(DOCS_DIR / 'static'),
+        highlight_cache_path=highlight_cache_path,
+        index_pages=index_pages,
+        sidebar_fragment=sidebar_fragment and production,
+        client_navigation=client_navigation and production,
     )
+    with build_profiler.stage('save caches'):
+        highlight_cache.save(highlight_cache_path)
+        if not production:
+            save_build_manifest(manifest_path, {
+                "version": BUILD_MANIFEST_VERSION,
+                "site_hash": site_hash,
+                "pages": manifest_pages,
+            })
+    print(f"Highlight cache: {highlight_cache.hits} hits, {highlight_cache.misses} misses.")
+
+    if production and compress:
+        with build_profiler.stage('compress'):
+            compress_output(src_html_path_obg, jobs=jobs)
+    if production:
+        with build_profiler.stage('deploy manifest'):
+            write_deploy_manifest(src_html_path_obg)
+
+    return all_files_to_process, sidebar_data
+
+
+INDEX_PAGE_MODES = ('copy', 'redirect', 'canonical')
+
+INDEX_REDIRECT_PAGE = (
+    '<!doctype html><html><head><meta charset="utf-8"><title>Redirecting</title>'
+    '<link rel="canonical" href="{url}"><meta http-equiv="refresh" content="0; url={url}">'
+    '<script>location.replace("{url}" + location.search + location.hash)</script></head>'
+    '<body><a href="{url}">Continue</a></body></html>'
+)
+# where insert_into_head puts a tag: minified pages may leave out <head>, then it goes after <html> (or the doctype)
+RE_HEAD_START_POSITIONS = [re.compile(pattern, re.IGNORECASE) for pattern in (r'<head(?:\s[^>]*)?>', r'<html(?:\s[^>]*)?>', r'<!doctype[^>]*>')]
+# a charset declaration at the start of the head stays first, inserted tags go after it
+RE_LEADING_CHARSET_META = re.compile(r'\s*<meta\s[^>]*\bcharset\s*=[^>]*>', re.IGNORECASE)
+
+# vai build --client-navigation: every page gets a content.json with what script.js swaps in when
+# another page of the site is opened, the title and the inner html of these elements (by id)
+CLIENT_NAVIGATION_FILE_NAME = "content.json"
+CLIENT_NAVIGATION_REGIONS = ('content-area', 'toc-links')
+CLIENT_NAVIGATION_META = f'<meta name="vai-client-navigation" content="{CLIENT_NAVIGATION_FILE_NAME}">'
+RE_PAGE_TITLE = re.compile(r'<title(?:\s[^>]*)?>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+
+
+def insert_into_head(page_html, tag):
+    """puts tag at the start of the head of a page, after its charset declaration if that comes first"""
+    for pattern in RE_HEAD_START_POSITIONS:
+        head_start = pattern.search(page_html)
+        if head_start:
+            position = head_start.end()
+            charset_meta = RE_LEADING_CHARSET_META.match(page_html, position)
+            if charset_meta:
+                position = charset_meta.end()
+            return page_html[:position] + tag + page_html[position:]
+    return tag + page_html
+
+
+def get_element_inner_html(page_html, element_id):
+    """the inner html of the element with id element_id in a rendered page, None if there is none"""
+    quoted_id = re.escape(element_id)
+    start = re.search(rf'<([a-zA-Z][\w-]*)(?=\s)[^>]*?\sid=(?:"{quoted_id}"|\'{quoted_id}\'|{quoted_id}(?=[\s/>]))[^>]*>', page_html)
+    if not start:
+        return None
+    # elements with the same tag name inside it have to be skipped to find its end tag
+    depth = 1
+    for tag in re.finditer(rf'<(/?){start.group(1)}(?=[\s/>])', page_html[start.end():], re.IGNORECASE):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return page_html[start.end():start.end() + tag.start()]
+    return None
+
+
+def make_page_content(page_html):
+    """
+    The content.json of a page for client navigation: {title, regions: {element id: inner html}}
+    with the CLIENT_NAVIGATION_REGIONS. None if the layout doesn't have all of them.
+    """
+    title = RE_PAGE_TITLE.search(page_html)
+    regions = {element_id: get_element_inner_html(page_html, element_id) for element_id in CLIENT_NAVIGATION_REGIONS}
+    if title is None or None in regions.values():
+        return None
+    return json.dumps({"title": html.unescape(title.group(1)), "regions": regions}, ensure_ascii=False)
+
 
+def get_index_pages(sidebar_data):
+    """
+    Every section folder shows its first page at the section's url,
+    and the site root shows the very first page.
+
+    Returns:
+        {(section folder, page slug): [index folders]}, '' being the site root
+    """
+    index_pages = {}
     for section in sidebar_data:
-        if section.get('files') and len(section['files']) > 0:
-            section_slug = section['output_folder_name']
-            first_file_in_section_slug = section['files'][0]['slug']
+        if section.get('files'):
+            first_page = (section['output_folder_name'], section['files'][0]['slug'])
+            index_pages.setdefault(first_page, []).append(section['output_folder_name'])
+    if sidebar_data and sidebar_data[0].get('files'):
+        index_pages[(sidebar_data[0]['output_folder_name'], sidebar_data[0]['files'][0]['slug'])].append('')
+    return index_pages
+
 
-            source_html_for_section_index = src_html_path_obg / section_slug / first_file_in_section_slug / "index.html"
+def make_index_page(page_html, target_url, mode='copy'):
+    """
+    The html of a section or root index showing the page at target_url (relative to the index, so it
+    works under a base path too):
+        copy:       the page itself
+        redirect:   a small page redirecting to the page, instead of another full size copy
+        canonical:  the page, with a canonical link to it so search engines index it only once
+    """
+    if mode == 'redirect':
+        return INDEX_REDIRECT_PAGE.format(url=html.escape(target_url))
+    if mode == 'canonical':
+        return insert_into_head(page_html, f'<link rel="canonical" href="{html.escape(target_url)}">')
+    return page_html
 
-            section_index_output_path = src_html_path_obg / section_slug / "index.html"
 
-            if source_html_for_section_index.exists():
-                (src_html_path_obg / section_slug).mkdir(parents=True, exist_ok=True)
+def write_index_pages(dist_base_path, index_folders, output_folder_name, output_file_slug, page_html, mode='copy'):
+    """writes the section/root indexes (see get_index_pages) of a page from its rendered html"""
+    for index_folder in index_folders:
+        target_url = f"{output_file_slug}/" if index_folder else f"{output_folder_name}/{output_file_slug}/"
+        index_dir = Path(dist_base_path) / index_folder
+        index_dir.mkdir(parents=True, exist_ok=True)
+        (index_dir / "index.html").write_text(make_index_page(page_html, target_url, mode), encoding='utf-8')
+
+
+# files of these types are precompressed by vai build --compress
+COMPRESSIBLE_EXTENSIONS = {'.html', '.css', '.js', '.mjs', '.json', '.xml', '.svg', '.txt', '.map', '.md', '.wasm', '.ico'}
+COMPRESS_MIN_SIZE = 256
+# a variant is only written if it is at most this fraction of the file, otherwise it isn't worth serving
+COMPRESS_MAX_RATIO = 0.9
+
+
+def compress_file(file_path, use_brotli=True):
+    """
+    Writes file_path.gz and file_path.br next to file_path, at maximum compression.
+    gzip is written without a timestamp, so the same file always gives the same .gz.
+
+    Returns:
+        (size, gzip size, brotli size), a compressed size being None if that variant wasn't written
+    """
+    import gzip
+
+    file_path = Path(file_path)
+    data = file_path.read_bytes()
+    compressors = {'.gz': lambda: gzip.compress(data, compresslevel=9, mtime=0)}
+    if use_brotli:
+        import brotli
+        compressors['.br'] = lambda: brotli.compress(data, quality=11)
+
+    sizes = {'.gz': None, '.br': None}
+    for suffix, compress in compressors.items():
+        compressed = compress()
+        if len(compressed) <= len(data) * COMPRESS_MAX_RATIO:
+            file_path.with_name(file_path.name + suffix).write_bytes(compressed)
+            sizes[suffix] = len(compressed)
+    return len(data), sizes['.gz'], sizes['.br']
+
+
+def compress_output(output_dir, jobs=1):
+    """
+    Precompresses every compressible file in output_dir (see compress_file) over a pool of `jobs`
+    processes, for hosts that serve .gz/.br siblings as they are (e.g. nginx gzip_static/brotli_static).
+    Files smaller than COMPRESS_MIN_SIZE are skipped. Brotli is optional, without it only .gz files are written.
+    """
+    try:
+        import brotli  # noqa: F401
+        use_brotli = True
+    except ImportError:
+        print("Warning: Brotli is not installed (pip install vai-ssg[compress]), only .gz files are written.")
+        use_brotli = False
+
+    files_to_compress = [
+        file_path for file_path in sorted(Path(output_dir).rglob('*'))
+        if file_path.suffix.lower() in COMPRESSIBLE_EXTENSIONS and file_path.is_file() and file_path.stat().st_size >= COMPRESS_MIN_SIZE
+    ]
+    if jobs > 1 and len(files_to_compress) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        chunksize = max(1, len(files_to_compress) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(functools.partial(compress_file, use_brotli=use_brotli), files_to_compress, chunksize=chunksize))
+    else:
+        results = [compress_file(file_path, use_brotli) for file_path in files_to_compress]
+
+    total_size = sum(size for size, _, _ in results)
+    gzip_size = sum(gzip_size if gzip_size is not None else size for size, gzip_size, _ in results)
+    message = f"Compressed {len(results)} files: {total_size / 1024:.0f} KB, {gzip_size / 1024:.0f} KB with gzip"
+    if use_brotli:
+        brotli_size = sum(brotli_size if brotli_size is not None else size for size, _, brotli_size in results)
+        message += f", {brotli_size / 1024:.0f} KB with brotli"
+    print(message + ".")
+
+
+def hash_file(file_path):
+    """sha256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_deploy_manifest(output_dir):
+    """
+    Writes output_dir/deploy_manifest.json with the size and content hash of every file in output_dir,
+    so a deploy can upload (and purge from a CDN) only what changed since the last one (see vai diff).
+    Paths are relative posix paths in sorted order and nothing else is recorded, so identical builds
+    give identical manifests.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    output_path = Path(output_dir)
+    manifest_file = output_path / DEPLOY_MANIFEST_FILE_NAME
+    output_files = sorted(f for f in output_path.rglob('*') if f.is_file() and f != manifest_file)
+    # hashlib releases the GIL while hashing, so threads are enough
+    with ThreadPoolExecutor() as executor:
+        hashes = list(executor.map(hash_file, output_files))
+    files = {
+        file_path.relative_to(output_path).as_posix(): {"size": file_path.stat().st_size, "sha256": file_hash}
+        for file_path, file_hash in zip(output_files, hashes)
+    }
+    with open(manifest_file, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({"version": DEPLOY_MANIFEST_VERSION, "files": files}, ensure_ascii=False, indent=1, sort_keys=True))
+
+
+def load_deploy_manifest(path):
+    """loads a deploy manifest, path being the manifest or a dist folder containing one"""
+    path = Path(path)
+    if path.is_dir():
+        path = path / DEPLOY_MANIFEST_FILE_NAME
+    with open(path, 'r', encoding='utf-8') as f:
+        manifest = json.loads(f.read())
+    if not isinstance(manifest, dict) or manifest.get('version') != DEPLOY_MANIFEST_VERSION:
+        raise ValueError(f"'{path}' is not a deploy manifest of this version of vai.")
+    return manifest
+
+
+def diff_deploy_manifests(old_manifest, new_manifest):
+    """
+    Returns:
+        {added, changed, removed}: sorted lists of the paths that differ between two deploy manifests
+    """
+    old_files = old_manifest['files']
+    new_files = new_manifest['files']
+    return {
+        "added": sorted(path for path in new_files if path not in old_files),
+        "changed": sorted(path for path in new_files if path in old_files and new_files[path] != old_files[path]),
+        "removed": sorted(path for path in old_files if path not in new_files),
+    }
+
+
+def get_file_url(path):
+    """the url a file of dist is served at, a page's index.html being served at its folder"""
+    if path == 'index.html' or path.endswith('/index.html'):
+        return '/' + path[:-len('index.html')]
+    return '/' + path
+
+
+def cli_diff(old_path, new_path, as_urls=False, as_json=False):
+    """
+    Compares the deploy manifests of two builds (see write_deploy_manifest) and prints the files
+    that were added, changed or removed, one per line, or as json.
+    With as_urls the files are printed as the urls they are served at, e.g. to purge them from a CDN.
+    """
+    try:
+        changes = diff_deploy_manifests(load_deploy_manifest(old_path), load_deploy_manifest(new_path))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        return
+    if as_urls:
+        changes = {change: [get_file_url(path) for path in paths] for change, paths in changes.items()}
+    if as_json:
+        print(json.dumps(changes, ensure_ascii=False, indent=2))
+        return
+    for change, paths in changes.items():
+        for path in paths:
+            print(f"{change:<8} {path}")
 
-                content_of_first_page_in_section = source_html_for_section_index.read_text(encoding='utf-8')
-                section_index_output_path.write_text(content_of_first_page_in_section, encoding='utf-8')
-            else:
-                print(f"WARNING: Source HTML for section index copy not found at: {source_html_for_section_index}")
-                
-    if not (src_html_path_obg / 'index.html').exists() and  sidebar_data_for_redirect:
-        if  root_redirect_target_url != "/":
-            try:
-                path_parts =  root_redirect_target_url.strip('/').split('/')
-                if len(path_parts) >= 2:
-                    first_section_slug_for_copy = path_parts[0]
-                    first_file_slug_for_copy = path_parts[1]
-                    source_html_path = src_html_path_obg / first_section_slug_for_copy / first_file_slug_for_copy / "index.html"
-
-                    if source_html_path.exists():
-                        content_of_first_page = source_html_path.read_text(encoding='utf-8')
-                        (src_html_path_obg / 'index.html').write_text(content_of_first_page, encoding='utf-8')
-                    else:
-                        print(f"WARNING: Source HTML for root index.html copy not found at: {source_html_path}")
-                else:
-                    print("WARNING: Could not determine path components from  root_redirect_target_url to copy for root index.html.")
-            except Exception as e:
-                print(f"ERROR: Occurred while trying to create root index.html by copying: {e}")
 
 def cli_init():
     """populares current dir with necessary metadata in it
@@ -703,138 +1709,762 @@ def cli_init():
 
 
 
+class UrlPrefixRewriter:
+    """
+    Rewrites the site's root relative urls for deployments that are not served from
+    the domain root, e.g. github pages serves the site from /<repo name>/.
+    The rules are compiled once per build and the html is rewritten with a small
+    tokenizer, so only the affected attribute values change and the page is never
+    parsed into (and serialized back from) a DOM.
+
+    Rules:
+        <a href>: root relative links get the prefix, unless the link opens in a new tab (target="_blank")
+        <link href>, <script src>, <img src>: /static/... urls get the prefix
+        script.js: the search index url and the urls of the search results get the prefix
+
+    asset_names ({name in static: content hashed name}, see process_static_assets) also points the
+    /static/... urls of <link>, <script> and <img> to the content hashed copies (vai build --hash-assets).
+    The prefix is optional for that. The <script> of script.js then also gets the hashed name of the
+    search worker it starts in data-search-worker, see SEARCH_WORKER_URL in script.js.
+    """
+    # comments are skipped as a whole, the body of script and style tags is skipped after its start tag
+    RE_HTML_TOKEN = re.compile(r'<!--.*?-->|<([a-zA-Z][a-zA-Z0-9-]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>', re.DOTALL)
+    RE_ATTRIBUTE = re.compile(r'([^\s=/>"\']+)(?:(\s*=\s*)("[^"]*"|\'[^\']*\'|[^\s>"\']+))?')
+    RAW_TEXT_TAGS = ('script', 'style')
+    URL_ATTRIBUTES = {'a': 'href', 'link': 'href', 'script': 'src', 'img': 'src'}
+
+    RE_STATIC_URL = re.compile(r'/static/([^?#]*)(.*)', re.DOTALL)
+
+    def __init__(self, prefix=None, asset_names=None):
+        self.asset_names = asset_names or {}
+        self.prefix = ''
+        self.js_rules = []
+        if not prefix:
+            return
+        prefix = '/' + prefix.strip('/')
+        self.prefix = prefix
+        self.js_rules = [
+            # '/search_index/' (sharded index) and fetch('/search_index.json') (older script.js)
+            (re.compile(r"""(['"])/search_index(/|\.json['"])"""), r"\1" + prefix + r"/search_index\2"),
+            # a.href = result.url;  and  window.location.href = singleResultToNavigate.url;
+            (re.compile(r"((?:\ba\.href|window\.location\.href)\s*=\s*)((?:result|singleResultToNavigate)\.url\s*;)"), r"\1'" + prefix + r"' + \2"),
+        ]
+
+    def has_prefix(self, url):
+        return bool(self.prefix) and (url == self.prefix or url.startswith(self.prefix + '/'))
+
+    def get_asset_url(self, url):
+        """/static/style.css?v=1 -> /static/style.<hash>.css?v=1"""
+        match = self.RE_STATIC_URL.match(url)
+        hashed_name = self.asset_names.get(match.group(1))
+        return f"/static/{hashed_name}{match.group(2)}" if hashed_name else url
+
+    def get_extra_attributes(self, tag_name, url, attributes):
+        """' data-search-worker="search_worker.<hash>.js"' for the <script> of script.js, '' for the rest"""
+        worker_name = self.asset_names.get('search_worker.js')
+        if tag_name != 'script' or not worker_name or 'data-search-worker' in attributes:
+            return ''
+        match = self.RE_STATIC_URL.match(url)
+        if not match or match.group(1) != 'script.js':
+            return ''
+        return f' data-search-worker="{html.escape(worker_name)}"'
+
+    def rewrite_url(self, tag_name, url, attributes):
+        if tag_name == 'a':
+            if not self.prefix or attributes.get('target') == '_blank':
+                return url
+            if url.startswith('/') and not url.startswith('//') and not self.has_prefix(url):
+                return self.prefix + url
+        elif url.startswith('/static/') and not self.has_prefix(url):
+            return self.prefix + self.get_asset_url(url)
+        return url
+
+    def rewrite_start_tag(self, tag_name, attributes_text):
+        url_attribute = self.URL_ATTRIBUTES[tag_name]
+        attribute_matches = list(self.RE_ATTRIBUTE.finditer(attributes_text))
+        attributes = {}
+        for match in attribute_matches:
+            value = match.group(3) or ''
+            if value[:1] in ('"', "'"):
+                value = value[1:-1]
+            attributes.setdefault(match.group(1).lower(), value)
+
+        for match in attribute_matches:
+            if match.group(1).lower() != url_attribute or match.group(3) is None:
+                continue
+            url = attributes[url_attribute]
+            new_url = self.rewrite_url(tag_name, url, attributes)
+            extra_attributes = self.get_extra_attributes(tag_name, url, attributes)
+            if new_url == url and not extra_attributes:
+                return None
+            quote = match.group(3)[0] if match.group(3)[0] in ('"', "'") else '"'
+            return (
+                attributes_text[:match.start(3)]
+                + f'{quote}{new_url}{quote}'
+                + attributes_text[match.end(3):]
+                + extra_attributes
+            )
+        return None
+
+    def rewrite_html(self, content):
+        parts = []
+        pos = 0
+        search_from = 0
+        while True:
+            match = self.RE_HTML_TOKEN.search(content, search_from)
+            if not match:
+                break
+            search_from = match.end()
+            tag_name = (match.group(1) or '').lower()
+            if not tag_name:
+                continue
+
+            if tag_name in self.URL_ATTRIBUTES:
+                new_attributes_text = self.rewrite_start_tag(tag_name, match.group(2))
+                if new_attributes_text is not None:
+                    parts.append(content[pos:match.start(2)])
+                    parts.append(new_attributes_text)
+                    pos = match.end(2)
+
+            if tag_name in self.RAW_TEXT_TAGS:
+                end_tag = re.compile(rf'</{tag_name}\s*>', re.IGNORECASE).search(content, search_from)
+                search_from = end_tag.end() if end_tag else len(content)
+
+        parts.append(content[pos:])
+        return ''.join(parts)
+
+    def rewrite_js(self, content):
+        for pattern, replacement in self.js_rules:
+            content = pattern.sub(replacement, content)
+        return content
+
+
 def add_github_prefix_to_static_resources(html, github_repo_name):
-    soup = BeautifulSoup(html, 'html.parser')
+    """prefixes the site's urls in a html page with github_repo_name. See UrlPrefixRewriter"""
+    return UrlPrefixRewriter(github_repo_name).rewrite_html(html)
+
+def finalize_html_page(content, url_rewriter=None):
+    """prepares a rendered html page for dist: rewrites urls for base path deployments (if any) and minifies it"""
+    import minify_html
+
+    if url_rewriter:
+        content = url_rewriter.rewrite_html(content)
+    return minify_html.minify(
+        content,
+        minify_js=True,
+        minify_css=True,
+        preserve_chevron_percent_template_syntax=True,
+    )
 
-    tags_attrs = {
-        'link': 'href',
-        'script': 'src',
-        'img': 'src',
-        'a': 'href',
 
-    }
+def finalize_js_file(content, url_rewriter=None):
+    """prepares a js file for dist: points the search fetch and results to the base path (if any) and minifies it"""
+    import rjsmin
+
+    if url_rewriter:
+        content = url_rewriter.rewrite_js(content)
+    return rjsmin.jsmin(content)
+
+
+def process_static_file(src_file, dest_file_path, url_rewriter=None):
+    """minifies a single static asset (html, js, css) into dist. Everything else is hardlinked or copied as is."""
+    dest_file_path.parent.mkdir(parents=True, exist_ok=True)
+    if src_file.suffix == ".html":
+        content = src_file.read_text(encoding="utf-8")
+        dest_file_path.write_text(finalize_html_page(content, url_rewriter), encoding="utf-8")
+    elif src_file.suffix == '.js':
+        content = src_file.read_text(encoding="utf-8")
+        dest_file_path.write_text(finalize_js_file(content, url_rewriter), encoding="utf-8")
+    elif src_file.suffix == '.css':
+        import rcssmin
+        content = src_file.read_text(encoding="utf-8")
+        dest_file_path.write_text(rcssmin.cssmin(content), encoding="utf-8")
+    else:
+        link_or_copy_file(src_file, dest_file_path)
+
+
+def load_asset_hashes(asset_hashes_path):
+    """{path in static: [size, mtime_ns, sha256]} saved by the previous vai build --hash-assets"""
+    try:
+        with open(asset_hashes_path, 'r', encoding='utf-8') as f:
+            asset_hashes = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return asset_hashes if isinstance(asset_hashes, dict) else {}
+
+
+def process_static_assets(static_src_dir='static', dst_dir='dist/static', url_rewriter=None, hash_names=False, asset_hashes_path=None):
+    """
+    Production version of copy_static_assets. Every file of the static folder (and the built in
+    files it lacks, see get_static_files) is minified or copied into dst_dir over a thread pool
+    (see process_static_file).
+
+    With hash_names every file also gets a copy (a hardlink) named after a hash of its content,
+    e.g. style.css -> style.1a2b3c4d5e.css, which can be cached forever. Minified files are hashed
+    after minifying. The hashes of the other files are kept in asset_hashes_path and only
+    computed again for files whose size or modification time changed.
+    The files keep their own name as well, for urls that are not rewritten (e.g. url() in css).
+
+    Returns:
+        asset_names: {path in static: content hashed path in static}, empty without hash_names
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    static_src_path = Path(static_src_dir)
+    dst_path = Path(dst_dir)
+    if not static_src_path.exists() or not static_src_path.is_dir():
+        print(f"Warning: Static assets directory '{static_src_path}' not found. Skipping copy.")
+        return {}
+
+    previous_asset_hashes = load_asset_hashes(asset_hashes_path) if hash_names and asset_hashes_path else {}
+    asset_hashes = {}
+
+    def process_file(relative_path, src_file):
+        dest_file_path = dst_path / relative_path
+        process_static_file(src_file, dest_file_path, url_rewriter)
+        if not hash_names:
+            return None
+
+        if src_file.suffix in ('.html', '.js', '.css'):
+            content_hash = hashlib.sha256(dest_file_path.read_bytes()).hexdigest()
+        else:
+            src_stat = src_file.stat()
+            previous = previous_asset_hashes.get(relative_path.as_posix())
+            if previous and previous[:2] == [src_stat.st_size, src_stat.st_mtime_ns]:
+                content_hash = previous[2]
+            else:
+                content_hash = hashlib.sha256(src_file.read_bytes()).hexdigest()
+            asset_hashes[relative_path.as_posix()] = [src_stat.st_size, src_stat.st_mtime_ns, content_hash]
+
+        hashed_file_path = dest_file_path.with_name(f"{dest_file_path.stem}.{content_hash[:ASSET_HASH_LENGTH]}{dest_file_path.suffix}")
+        link_or_copy_file(dest_file_path, hashed_file_path)
+        return relative_path.as_posix(), hashed_file_path.relative_to(dst_path).as_posix()
+
+    static_files = get_static_files(static_src_path)
+    with ThreadPoolExecutor() as executor:
+        # dict() goes through all the results, so an error in any of the files is raised here
+        asset_names = dict(name for name in executor.map(process_file, static_files.keys(), static_files.values()) if name)
+
+    if hash_names and asset_hashes_path:
+        asset_hashes_path = Path(asset_hashes_path)
+        asset_hashes_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(asset_hashes_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(asset_hashes, ensure_ascii=False, indent=None))
+    return asset_names
+
+
+def cli_build(github=False, jobs=1, hash_assets=False, profile=False, profile_output=None, index_pages='copy', sidebar_fragment=False, page_dates='today', compress=False, client_navigation=False):
+    """
+    Converts all .md files from the src_md folder into minified .html files and
+    minifies the css and js in static, writing everything straight into the dist folder.
+    Pages go from the renderer to the minifier without a round trip through src_html.
+
+    With profile the time spent in every stage and page is printed after the build
+    (see BuildProfiler), and written to profile_output if given.
+    """
 
-    for tag_name, attr in tags_attrs.items():
-        for tag in soup.find_all(tag_name):
-            if tag.has_attr(attr):
-                # For <a> tags, skip if target="_blank"
-                if tag.name == 'a' and tag.get('target') == '_blank':
-                    continue
-                elif tag.name == 'a':
-                    val = tag[attr]
-                    if val.startswith('/') and not val.startswith(github_repo_name):
-                        new_val = f'{github_repo_name.rstrip("/")}{val}'
-                        tag[attr] = new_val
-                else:                        
-                    val = tag[attr]
-                    if '/static' in val and not val.startswith(f'{github_repo_name}/static'):
-                        new_val = val.replace('/static', f'{github_repo_name}/static')
-                        tag[attr] = new_val
-
-    updated_html = str(soup)
-    return updated_html
-
-def cli_build(github=False):
-    """
-    It first converts all .md files from the src_md folder into .html files in the src_html folder 
-    (in case the user runs vai build without running vai run).
-    Then, it processes all the .html files in src_html 
-    by minimizing the HTML, CSS, and JS, and outputs the final files into the dist folder.
-    """
-
-    SRC_HTML_DIR = Path("src_html") 
     DIST_DIR = Path('dist')
 
-    if not Path('src_html').exists():
-        print(f"'src_html' folder not created. Please run 'vai init' or ensure it exists.")
+    # production builds only read src_md, src_html (the vai run output) doesn't have to exist
+    if not Path('src_md').exists():
+        print(f"'src_md' folder not found. Please run 'vai init' or ensure it exists.")
         return
 
-    # runs again to convert md to html just in case
-    build() 
-    
-    if not SRC_HTML_DIR.exists() or not any(SRC_HTML_DIR.iterdir()):
-        print(f"Error: The directory '{SRC_HTML_DIR}' is empty or does not exist after the build step.")
+    url_rewriter = None
+    if github:
+        import yaml
+        DOCS_DIR = Path("./")
+        # loaded once, the rules are compiled once and shared by every page and asset
+        with open(DOCS_DIR / "config.yaml", "r") as f:  
+            config = yaml.safe_load(f)
+        url_rewriter = UrlPrefixRewriter(config['github_repo_name'])
+
+    if profile or profile_output:
+        build_profiler.enable()
+    print('building...')
+    with build_profiler.stage('build'):
+        build(
+            jobs=jobs, production=True, url_rewriter=url_rewriter, hash_assets=hash_assets,
+            index_pages=index_pages, sidebar_fragment=sidebar_fragment, page_dates=page_dates, compress=compress,
+            client_navigation=client_navigation,
+        )
+
+    if not DIST_DIR.exists() or not any(DIST_DIR.iterdir()):
+        print(f"Error: The directory '{DIST_DIR}' is empty or does not exist after the build step.")
         print("Please ensure the `build()` function correctly outputs files to this location.")
         return
 
-    if DIST_DIR.exists(): 
-        shutil.rmtree(DIST_DIR)
-    DIST_DIR.mkdir(parents=True, exist_ok=True) 
+    print(f"Build finished! Minified/copied files are in '{DIST_DIR}'.")
 
-    print('building...')
-    for src_file in SRC_HTML_DIR.rglob("*"): 
-        if src_file.is_file():
-            relative_path = src_file.relative_to(SRC_HTML_DIR)
-            dest_file_path = DIST_DIR / relative_path
-
-            dest_file_path.parent.mkdir(parents=True, exist_ok=True)
-
-            if src_file.suffix == ".html":
-                content = src_file.read_text(encoding="utf-8")
-
-                if github:
-                    DOCS_DIR = Path("./")
-                    with open(DOCS_DIR / "config.yaml", "r") as f:  
-                        config = yaml.safe_load(f)
-                    github_repo_name = config['github_repo_name']
-
-                    if not github_repo_name.startswith('/'):
-                        github_repo_name = '/' + github_repo_name
-                    content = add_github_prefix_to_static_resources(content, github_repo_name)
-                
-                minified = minify_html.minify(
-                    content,
-                    minify_js=True,
-                    minify_css=True,
-                    preserve_chevron_percent_template_syntax=True,
-                )
-                dest_file_path.write_text(minified, encoding="utf-8") 
-
-            elif src_file.suffix == '.js':
-
-                content = src_file.read_text(encoding="utf-8")
-
-                if github:    
-                    prefix = github_repo_name
-                    pattern1 = r"(fetch\(\s*')[/]search_index\.json(')"
-                    replacement = r"\1" + prefix + r"/search_index.json\2"
-                    
-                    # Testeded with linux diff command and is proven to be accurate
-                    content  = re.sub(pattern1, replacement, content)
-
-                    pattern2 = r"(a\.href\s*=\s*)(result\.url\s*;)"
-                    replacement2 = r"\1'" + prefix + r"' + \2"
-                    content = re.sub(pattern2, replacement2, content)
-
-                minified = rjsmin.jsmin(content)
-                dest_file_path.write_text(minified, encoding="utf-8") 
-
-            elif src_file.suffix == '.css':
-                content = src_file.read_text(encoding="utf-8")
-                minified = rcssmin.cssmin(content)
-                dest_file_path.write_text(minified, encoding="utf-8")
-            
+    if build_profiler.enabled:
+        build_profiler.print_summary()
+        if profile_output:
+            build_profiler.write(profile_output)
+            print(f"Profile written to '{profile_output}'.")
+
+class DevSite:
+    """
+    The site served by vai run, kept in memory between rebuilds so that the cost of a rebuild
+    matches the size of the edit rather than the size of the site:
+
+        all_files_to_process, sidebar_data: the scanned src_md tree (see scan_src)
+        page_template: the compiled layout.html (a LayoutTemplate)
+        pages: {md path: {hash, converted}} with the parsed front matter, html body and headings
+               of every page converted so far (see convert_md_page). Pages left untouched by the
+               incremental build at startup are converted the first time they are needed.
+        manifest: the build manifest, kept in step with the output and saved after every change
+
+    Changes patch this model:
+
+        md page edited:            only that page is converted and rendered again (plus the
+                                   section/root copies of it), and only browsers showing it reload.
+                                   The prev/next links of its neighbours come from file names,
+                                   so they only change when pages are added, removed or renamed.
+        md page added or removed:  the tree is scanned again and every page is put into the layout
+                                   again (the sidebar changed), but only new pages are converted
+        layout or config.yaml:     layout.html is made again and, if it changed, every page is put
+                                   into it again. Nothing is converted
+        static asset edited:       only that file is copied
+
+    The search index and the manifest are written in the background after each change.
+
+    server is the livereload Server. The reload message it sends carries the url of the
+    rebuilt page, which the dev server plugin in script.js uses to skip other pages.
+    """
+    def __init__(self, server=None, docs_dir=Path("./")):
+        self.server = server
+        self.docs_dir = docs_dir
+        self.output_dir = docs_dir / 'src_html'
+        self.manifest_path = docs_dir / BUILD_CACHE_DIR_NAME / BUILD_MANIFEST_FILE_NAME
+        self.highlight_cache_path = docs_dir / BUILD_CACHE_DIR_NAME / HIGHLIGHT_CACHE_FILE_NAME
+        self.all_files_to_process = []
+        self.sidebar_data = []
+        self.page_template = None
+        self.pages = {}
+        self.manifest = {}
+        self.background_writer = None
+        self.background_write = None
+
+    def get_background_writer(self):
+        # a single thread, so writes happen in the order of the changes
+        if self.background_writer is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self.background_writer = ThreadPoolExecutor(max_workers=1)
+        return self.background_writer
+
+    def write_search_index_and_manifest(self, search_index_entries, manifest):
+        write_search_index(
+            search_index_entries, self.output_dir,
+            legacy_search_index=uses_legacy_search_index(self.docs_dir / 'static'),
+        )
+        save_build_manifest(self.manifest_path, manifest)
+
+    def wait_for_background_write(self):
+        if self.background_write is not None:
+            try:
+                self.background_write.result()
+            except Exception as e:
+                print(f"Error: could not write the search index or the build manifest: {e}")
+            self.background_write = None
+
+    def full_build(self, changed_files=None):
+        """the (incremental) build() vai run starts with"""
+        self.wait_for_background_write()
+        self.all_files_to_process, self.sidebar_data = build()
+        self.manifest = load_build_manifest(self.manifest_path)
+        self.compile_template()
+
+    def compile_template(self):
+        from jinja2 import Environment, FileSystemLoader
+
+        jinja_env = Environment(loader=FileSystemLoader(str(self.docs_dir / 'templates')), autoescape=True)
+        self.page_template = LayoutTemplate(jinja_env, jinja_env.loader.get_source(jinja_env, 'layout.html')[0])
+
+    def find_page(self, md_path):
+        md_path = Path(md_path).resolve()
+        for i, file_item in enumerate(self.all_files_to_process):
+            if file_item["original_path"].resolve() == md_path:
+                return i
+        return None
+
+    def get_converted_page(self, i):
+        """
+        Reads the i-th md file and returns (its hash, the page converted by convert_md_page).
+        The md is only converted again if the file changed since it was last converted.
+        """
+        md_path = self.all_files_to_process[i]["original_path"]
+        full_md_text_from_file = md_path.read_text(encoding="utf-8")
+        source_hash = hash_text(full_md_text_from_file)
+        page = self.pages.get(md_path.as_posix())
+        if not page or page["hash"] != source_hash:
+            page = {"hash": source_hash, "converted": convert_md_page(full_md_text_from_file)}
+            self.pages[md_path.as_posix()] = page
+        return source_hash, page["converted"]
+
+    def write_page(self, i, source_hash, converted_page):
+        """puts a converted page into the layout and writes it, with the section/root index showing it (if any). Returns its url"""
+        file_item = self.all_files_to_process[i]
+        rendered, page_search_entries = render_converted_page(
+            i, self.all_files_to_process, self.sidebar_data, self.page_template, converted_page
+        )
+        output_dir = self.output_dir / file_item["output_folder_name"] / file_item["output_file_slug"]
+        output_dir.mkdir(parents=True, exist_ok=True)
+        (output_dir / "index.html").write_text(rendered, encoding="utf-8")
+        index_folders = get_index_pages(self.sidebar_data).get((file_item["output_folder_name"], file_item["output_file_slug"]), [])
+        write_index_pages(self.output_dir, index_folders, file_item["output_folder_name"], file_item["output_file_slug"], rendered)
+        self.manifest['pages'][file_item["original_path"].as_posix()] = {
+            "hash": get_page_hash(source_hash, file_item),
+            "output": f"{file_item['output_folder_name']}/{file_item['output_file_slug']}",
+            "search_index_entries": page_search_entries,
+        }
+        return file_item["url"]
+
+    def finish_change(self, rebuilt_urls):
+        from vai.markdown_converter import highlight_cache
+
+        highlight_cache.save(self.highlight_cache_path)
+        # On a big site the search index takes far longer than the page, so it is written in the
+        # background and the browser reloads as soon as the page is on disk
+        manifest_pages = self.manifest['pages']
+        search_index_entries = [entry for page in manifest_pages.values() for entry in page['search_index_entries']]
+        self.background_write = self.get_background_writer().submit(
+            self.write_search_index_and_manifest, search_index_entries, dict(self.manifest, pages=dict(manifest_pages))
+        )
+        if len(rebuilt_urls) == 1:
+            print(f"Rebuilt {rebuilt_urls[0]}")
+            if self.server:
+                self.server.watcher.filepath = rebuilt_urls[0]
+        else:
+            print(f"Rebuilt {len(rebuilt_urls)} pages")
+
+    def rebuild_all_pages(self):
+        """puts every page into the layout again, e.g. after the sidebar or the layout changed"""
+        self.manifest = {
+            "version": BUILD_MANIFEST_VERSION,
+            "site_hash": compute_site_hash(self.docs_dir, self.sidebar_data),
+            "pages": {},
+        }
+        rebuilt_urls = []
+        for i in range(len(self.all_files_to_process)):
+            rebuilt_urls.append(self.write_page(i, *self.get_converted_page(i)))
+        self.finish_change(rebuilt_urls)
+
+    def on_md_change(self, changed_files=None):
+        """livereload passes the changed files of a glob, or nothing if a file was removed"""
+        if not self.manifest.get('pages'):
+            return self.full_build()
+        page_indexes = [self.find_page(md_path) for md_path in changed_files] if isinstance(changed_files, list) else [None]
+        if None in page_indexes:
+            return self.on_structure_change()
+
+        manifest_pages = self.manifest['pages']
+        rebuilt_urls = []
+        for i in page_indexes:
+            file_item = self.all_files_to_process[i]
+            source_hash, converted_page = self.get_converted_page(i)
+            if manifest_pages.get(file_item["original_path"].as_posix(), {}).get('hash') == get_page_hash(source_hash, file_item):
+                continue
+            rebuilt_urls.append(self.write_page(i, source_hash, converted_page))
+
+        if rebuilt_urls:
+            self.finish_change(rebuilt_urls)
+
+    def on_structure_change(self):
+        """pages were added, removed or renamed: scan src_md again and drop the pages that are gone"""
+        self.wait_for_background_write()
+        old_outputs = {(file_item["output_folder_name"], file_item["output_file_slug"]) for file_item in self.all_files_to_process}
+        self.all_files_to_process, self.sidebar_data = scan_src(src_dir_path=str(self.docs_dir / 'src_md'))
+        new_outputs = {(file_item["output_folder_name"], file_item["output_file_slug"]) for file_item in self.all_files_to_process}
+        new_sections = {section["output_folder_name"] for section in self.sidebar_data}
+
+        for output_folder_name, output_file_slug in old_outputs - new_outputs:
+            section_dir = self.output_dir / output_folder_name
+            removed_dir = section_dir if output_folder_name not in new_sections else section_dir / output_file_slug
+            if removed_dir.exists():
+                shutil.rmtree(removed_dir)
+        existing_paths = {file_item["original_path"].as_posix() for file_item in self.all_files_to_process}
+        self.pages = {page_key: page for page_key, page in self.pages.items() if page_key in existing_paths}
+
+        self.rebuild_all_pages()
+
+    def on_layout_change(self, changed_files=None):
+        """layout_no_header.html, config.yaml or the logo/favicon changed"""
+        self.wait_for_background_write()
+        layout_path = self.docs_dir / 'templates' / 'layout.html'
+        old_layout = layout_path.read_text(encoding='utf-8') if layout_path.exists() else None
+        setup_header_in_layout_html()
+        if layout_path.read_text(encoding='utf-8') == old_layout:
+            # e.g. a config.yaml setting that is not part of the header. The pages stay as they are,
+            # only the site hash of the manifest has to follow
+            self.manifest['site_hash'] = compute_site_hash(self.docs_dir, self.sidebar_data)
+            save_build_manifest(self.manifest_path, self.manifest)
+            return
+        self.compile_template()
+        self.rebuild_all_pages()
+
+    def on_static_change(self, changed_files=None):
+        static_dir = self.docs_dir / 'static'
+        if not isinstance(changed_files, list):
+            # a file was removed. copy_static_assets removes it from src_html and skips the rest
+            copy_static_assets(static_src_dir=str(static_dir), dst_dir=str(self.output_dir / 'static'))
+            return self.on_layout_change()
+
+        header_files_added = False
+        for changed_file in changed_files:
+            changed_file = Path(changed_file)
+            if changed_file.is_dir():
+                continue
+            dest_file_path = self.output_dir / 'static' / changed_file.relative_to(static_dir)
+            # the header links the logo and favicon by file name, see setup_header_in_layout_html
+            if changed_file.stem in ('logo', 'favicon') and not dest_file_path.exists():
+                header_files_added = True
+            sync_static_file(changed_file, dest_file_path)
+        if header_files_added:
+            self.on_layout_change()
+
+
+def make_etag(content):
+    """a strong ETag (quoted, as sent in the header) for the bytes of a response"""
+    return '"' + hashlib.sha256(content).hexdigest()[:32] + '"'
+
+
+class MemoryDevSite(DevSite):
+    """
+    The site served by vai run --memory. Nothing is written to src_html: a page is rendered
+    into memory the first time the browser asks for it and served from there, static assets are
+    served straight from static/ and the search index is built in memory. Every response has an
+    ETag, so a browser revalidating something that did not change gets an empty 304.
+
+        urls: {url: index in all_files_to_process}, including the section and root urls,
+              which serve the first page of the section/site (see get_index_pages)
+        rendered: {page url: (html, etag)} of the pages rendered so far. A change only drops what
+                  it affects, which is rendered again the next time it is requested
+        search_index_entries: {md path: (hash, entries)} of the pages indexed so far. Pages whose
+                  entries in the build manifest of the last vai run/build are still current are
+                  indexed without converting them. The manifest itself is never written,
+                  it keeps describing src_html
+        search_index: future of {url: (json, etag)}, built in the background. Once the browser
+                  has asked for it, it is built again after every change
+
+    The site is a WSGI app, served by livereload in place of src_html.
+    """
+    def __init__(self, server=None, docs_dir=Path("./")):
+        super().__init__(server, docs_dir)
+        self.urls = {}
+        self.rendered = {}
+        self.search_index_entries = {}
+        self.manifest_search_index_entries = {}
+        self.search_index = None
+
+    def full_build(self, changed_files=None):
+        from vai.markdown_converter import highlight_cache
+
+        setup_header_in_layout_html()
+        self.scan()
+        self.compile_template()
+        highlight_cache.load(self.highlight_cache_path)
+        self.manifest_search_index_entries = {
+            page_key: (page['hash'], page['search_index_entries'])
+            for page_key, page in load_build_manifest(self.manifest_path).get('pages', {}).items()
+        }
+        print(f"Serving {len(self.all_files_to_process)} pages from memory, rendered when requested")
+
+    def scan(self):
+        self.all_files_to_process, self.sidebar_data = scan_src(src_dir_path=str(self.docs_dir / 'src_md'))
+        self.urls = {self.get_page_url(i): i for i in range(len(self.all_files_to_process))}
+        for section in self.sidebar_data:
+            if section['files']:
+                first_page = self.urls[f"/{section['output_folder_name']}/{section['files'][0]['slug']}/"]
+                self.urls.setdefault(f"/{section['output_folder_name']}/", first_page)
+                self.urls.setdefault("/", first_page)
+
+    def get_page_url(self, i):
+        return self.all_files_to_process[i]["url"]
+
+    def render_page(self, i):
+        """returns (html, etag) of the i-th page, rendering it if it isn't in memory"""
+        page_url = self.get_page_url(i)
+        if page_url not in self.rendered:
+            source_hash, converted_page = self.get_converted_page(i)
+            rendered, page_search_entries = render_converted_page(
+                i, self.all_files_to_process, self.sidebar_data, self.page_template, converted_page
+            )
+            self.search_index_entries[self.all_files_to_process[i]["original_path"].as_posix()] = (source_hash, page_search_entries)
+            content = rendered.encode('utf-8')
+            self.rendered[page_url] = (content, make_etag(content))
+        return self.rendered[page_url]
+
+    def get_search_index_entries(self, i):
+        md_path = self.all_files_to_process[i]["original_path"]
+        if md_path.as_posix() not in self.search_index_entries:
+            source_hash = hash_text(md_path.read_text(encoding="utf-8"))
+            manifest_entries = self.manifest_search_index_entries.get(md_path.as_posix())
+            if manifest_entries and manifest_entries[0] == get_page_hash(source_hash, self.all_files_to_process[i]):
+                page_search_entries = manifest_entries[1]
             else:
-                shutil.copy2(src_file, dest_file_path)
+                source_hash, converted_page = self.get_converted_page(i)
+                page_search_entries = make_search_index_entries(i, self.all_files_to_process, converted_page)
+            self.search_index_entries[md_path.as_posix()] = (source_hash, page_search_entries)
+        return self.search_index_entries[md_path.as_posix()][1]
+
+    def start_search_index(self):
+        search_index_entries = []
+        for i in range(len(self.all_files_to_process)):
+            search_index_entries += self.get_search_index_entries(i)
+        self.search_index = self.get_background_writer().submit(
+            self.make_search_index_responses,
+            search_index_entries,
+            uses_legacy_search_index(self.docs_dir / 'static'),
+        )
 
-    print(f"Build finished! Minified/copied files are in '{DIST_DIR}'.")
+    def make_search_index_responses(self, search_index_entries, legacy_search_index):
+        search_index_responses = {}
+        for relative_path, content in make_search_index_files(search_index_entries, legacy_search_index).items():
+            content = content.encode('utf-8')
+            search_index_responses[f"/{relative_path}"] = (content, make_etag(content))
+        return search_index_responses
+
+    def finish_change(self, changed_urls, search_index_changed=True):
+        from vai.markdown_converter import highlight_cache
+
+        highlight_cache.save(self.highlight_cache_path)
+        if search_index_changed and self.search_index is not None:
+            self.start_search_index()
+        if len(changed_urls) == 1:
+            print(f"Changed {changed_urls[0]}")
+            if self.server:
+                self.server.watcher.filepath = changed_urls[0]
+        else:
+            print(f"Changed {len(changed_urls)} pages")
+
+    def on_md_change(self, changed_files=None):
+        page_indexes = [self.find_page(md_path) for md_path in changed_files] if isinstance(changed_files, list) else [None]
+        if None in page_indexes:
+            return self.on_structure_change()
+
+        changed_urls = []
+        for i in page_indexes:
+            md_path = self.all_files_to_process[i]["original_path"]
+            source_hash = hash_text(md_path.read_text(encoding="utf-8"))
+            if self.search_index_entries.get(md_path.as_posix(), (None,))[0] == source_hash:
+                continue
+            self.search_index_entries.pop(md_path.as_posix(), None)
+            self.rendered.pop(self.get_page_url(i), None)
+            changed_urls.append(self.get_page_url(i))
+
+        if changed_urls:
+            self.finish_change(changed_urls)
+
+    def on_structure_change(self):
+        self.scan()
+        existing_paths = {file_item["original_path"].as_posix() for file_item in self.all_files_to_process}
+        self.pages = {page_key: page for page_key, page in self.pages.items() if page_key in existing_paths}
+        self.search_index_entries = {
+            page_key: entries for page_key, entries in self.search_index_entries.items() if page_key in existing_paths
+        }
+        # the sidebar and prev/next links of every page may have changed
+        self.rendered = {}
+        self.finish_change([self.get_page_url(i) for i in range(len(self.all_files_to_process))])
+
+    def on_layout_change(self, changed_files=None):
+        layout_path = self.docs_dir / 'templates' / 'layout.html'
+        old_layout = layout_path.read_text(encoding='utf-8') if layout_path.exists() else None
+        setup_header_in_layout_html()
+        if layout_path.read_text(encoding='utf-8') == old_layout:
+            return
+        self.compile_template()
+        self.rendered = {}
+        self.finish_change([self.get_page_url(i) for i in range(len(self.all_files_to_process))], search_index_changed=False)
+
+    def on_static_change(self, changed_files=None):
+        # static assets are served from static/ itself. Only the header links the logo and favicon
+        # by file name (see setup_header_in_layout_html), so adding or removing them changes the layout
+        if not isinstance(changed_files, list) or any(Path(changed_file).stem in ('logo', 'favicon') for changed_file in changed_files):
+            self.on_layout_change()
+
+    def get_static_response(self, relative_path):
+        import mimetypes
+
+        static_dir = (self.docs_dir / 'static').resolve()
+        if relative_path in BUILT_IN_STATIC_FILES and not (static_dir / relative_path).is_file():
+            static_dir = get_built_in_static_dir().resolve()
+        file_path = (static_dir / relative_path).resolve()
+        if not file_path.is_relative_to(static_dir) or not file_path.is_file():
+            return None
+        stat = file_path.stat()
+        content_type = mimetypes.guess_type(file_path.name)[0] or 'application/octet-stream'
+        return file_path.read_bytes(), f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"', content_type
+
+    def get_response(self, path):
+        """returns (content, etag, content type) for a request path, or None if there is nothing there"""
+        if path.startswith('/static/'):
+            return self.get_static_response(path[len('/static/'):])
+        if path.startswith(f'/{SEARCH_INDEX_DIR_NAME}/') or path == f'/{LEGACY_SEARCH_INDEX_FILE_NAME}':
+            if self.search_index is None:
+                self.start_search_index()
+            search_index_response = self.search_index.result().get(path)
+            return search_index_response and (*search_index_response, 'application/json; charset=utf-8')
+        if path.endswith('/index.html'):
+            path = path[:-len('index.html')]
+        if path in self.urls:
+            return (*self.render_page(self.urls[path]), 'text/html; charset=utf-8')
+        return None
+
+    def __call__(self, environ, start_response):
+        # PATH_INFO holds the utf-8 bytes of the path as latin-1 (PEP 3333)
+        path = environ.get('PATH_INFO', '/').encode('latin-1').decode('utf-8', 'replace')
+        try:
+            response = self.get_response(path)
+        except Exception as e:
+            print(f"Error: could not render {path}: {e}")
+            start_response('500 Internal Server Error', [('Content-Type', 'text/plain; charset=utf-8')])
+            return [f"Error: could not render {path}: {e}".encode('utf-8')]
+
+        if response is None:
+            if not path.endswith('/') and f"{path}/" in self.urls:
+                start_response('301 Moved Permanently', [('Location', f"{path}/")])
+                return [b'']
+            start_response('404 Not Found', [('Content-Type', 'text/plain; charset=utf-8')])
+            return [b'404: Not Found']
+
+        content, etag, content_type = response
+        # no-cache: the browser keeps its copy but asks every time, and gets a 304 while the etag matches
+        headers = [('ETag', etag), ('Cache-Control', 'no-cache')]
+        if etag in [tag.strip().removeprefix('W/') for tag in environ.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+            start_response('304 Not Modified', headers)
+            return [b'']
+        start_response('200 OK', headers + [('Content-Type', content_type)])
+        return [b'' if environ.get('REQUEST_METHOD') == 'HEAD' else content]
 
-def cli_run():
-    """starts the dev server"""
 
 def cli_run():
     """starts the dev server"""
+
+def cli_run(memory=False):
+    """
+    starts the dev server. With memory=True pages are served from memory
+    instead of src_html, see MemoryDevSite
+    """
+    from livereload import Server
+
     try:
-        build()
-        server = Server()
+        if memory:
+            site = MemoryDevSite()
+            server = Server(site)
+            site.server = server
+        else:
+            server = Server()
+            site = DevSite(server)
+        site.full_build()
         print('Ctrl+C to stop the server')
-        server.watch('src_md/**/*.md', build, delay=1000)
-        server.watch('templates/layout_no_header.html', build, delay= 1000)
-        server.watch('static/**/*', build, delay= 1000)
-        server.watch('config.yaml', build, delay= 1000)
+        server.watch('src_md/**/*.md', site.on_md_change, delay=1000)
+        server.watch('templates/layout_no_header.html', site.on_layout_change, delay= 1000)
+        server.watch('static/**/*', site.on_static_change, delay= 1000)
+        server.watch('config.yaml', site.on_layout_change, delay= 1000)
             
 
-        server.serve(root='src_html', default_filename='index.html', port=6600)
+        # debug=False, or livereload makes tornado restart the server when vai itself changes
+        server.serve(root='src_html', default_filename='index.html', port=6600, debug=False)
     except OSError as e:
         if e.errno ==98:
             print("Error: port 6600 running. please kill it first before rerunning.")
@@ -846,21 +2476,48 @@ def main():
     subparsers = parser.add_subparsers(dest="command")
 
     subparsers.add_parser("init", help="Create 'docs' folder structure.")
-    subparsers.add_parser("run", help="Run the tool.")
+    run_parser = subparsers.add_parser("run", help="Run the tool.")
+    run_parser.add_argument('--memory', action='store_true', help="serve pages from memory, rendered when requested, instead of writing src_html")
 
     build_parser = subparsers.add_parser("build", help="minify code. After developing, use this and use the generated files in production")
     build_parser.add_argument('--github', action='store_true', help="builds specifically for github")
+    build_parser.add_argument('--profile', action='store_true', help="print the time spent in every stage of the build and the slowest pages")
+    build_parser.add_argument('--profile-output', metavar='FILE', help="write the profile to FILE as json in the Chrome trace format (chrome://tracing, ui.perfetto.dev). Implies --profile")
+    build_parser.add_argument(
+        '--index-pages', choices=INDEX_PAGE_MODES, default='copy',
+        help="what the section and root urls serve: a copy of their first page (default), a small redirect to it, or a copy with a canonical link to it",
+    )
+    build_parser.add_argument('--hash-assets', action='store_true', help="give static assets content hashed names, so they can be cached forever")
+    build_parser.add_argument(
+        '--dates', choices=PAGE_DATE_SOURCES, default='today',
+        help="the date of pages without one in their front matter: the day of the build (default), the last modification of the md file, or its last git commit. mtime and git keep unchanged pages byte for byte the same between builds",
+    )
+    build_parser.add_argument('--compress', action='store_true', help="also write gzip and brotli compressed copies (.gz, .br) of html, css, js and json files, for hosts that serve them as they are")
+    build_parser.add_argument('--client-navigation', action='store_true', help="open the pages of the site without reloading: links are prefetched and only the content and table of contents are swapped")
+    build_parser.add_argument('--sidebar-fragment', action='store_true', help="write the sidebar once to a shared file that pages load, instead of into every page")
+    build_parser.add_argument('-j', '--jobs', type=int, default=1, help="number of processes used to render pages. 0 uses one per CPU core")
+
+    diff_parser = subparsers.add_parser("diff", help="list the files that differ between two builds, from their deploy manifests")
+    diff_parser.add_argument('old', help="deploy_manifest.json of the deployed build, or its dist folder")
+    diff_parser.add_argument('new', nargs='?', default='dist', help="deploy_manifest.json of the new build, or its dist folder (default: dist)")
+    diff_parser.add_argument('--urls', action='store_true', help="print the urls the files are served at, e.g. to purge them from a CDN")
+    diff_parser.add_argument('--json', action='store_true', help="print the added, changed and removed files as json")
     
     args = parser.parse_args()
     if args.command == "init":
         cli_init()
     elif args.command == "run":
-        cli_run()
+        cli_run(memory=args.memory)
+    elif args.command == 'diff':
+        cli_diff(args.old, args.new, as_urls=args.urls, as_json=args.json)
     elif args.command == 'build':
-        if args.github:
-            cli_build(github=True)
-        else:
-            cli_build()
+        jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+        cli_build(
+            github=args.github, jobs=jobs, hash_assets=args.hash_assets,
+            profile=args.profile, profile_output=args.profile_output, index_pages=args.index_pages,
+            sidebar_fragment=args.sidebar_fragment, page_dates=args.dates, compress=args.compress,
+            client_navigation=args.client_navigation,
+        )
     else:
         parser.print_help()
 
@@ -0,0 +1,412 @@
+# vai/markdown_converter.py
+"""
+Everything that turns md into html: the Markdown extensions of vai and the shared converter.
+
+Importing markdown (and through codehilite, pygments) is one of the slowest parts of starting vai,
+so this module is only imported by the commands that render pages (see render_md_file in main.py).
+"""
+import markdown
+from markdown.extensions import Extension
+from markdown.treeprocessors import Treeprocessor
+from markdown.blockprocessors import BlockProcessor
+from markdown.extensions.codehilite import CodeHilite, CodeHiliteExtension, HiliteTreeprocessor
+from markdown.extensions.fenced_code import FencedBlockPreprocessor, FencedCodeExtension
+from xml.etree import ElementTree as etree
+from pathlib import Path
+import collections
+import html
+import json
+import re
+import types
+import pygments
+
+from vai.utils import generate_slug, hash_text
+from vai.profiler import build_profiler
+
+HIGHLIGHT_CACHE_VERSION = 1
+HIGHLIGHT_CACHE_MAX_ENTRIES = 4096
+
+
+class HeadingIdAdder(Treeprocessor):
+    """ Automatically add id attributes to HTML heading tags (<h1> to <h6>).
+        These IDs are used for creating anchor links (#-links).
+
+        While doing so it also records every heading of the page in headings_on_page
+        as {level, text, id, body_text}, with the text before the first heading in
+        intro_text_on_page. The TOC and the search index are built from these,
+        so the generated html never has to be parsed again.
+
+
+    Args:
+        Treeprocessor:  argument operate on the XML/ElementTree representation of the Markdown document 
+                        after it has been parsed but before it's serialized to HTML
+    """ 
+    RE_HTML_PLACEHOLDER = re.compile(r'\x02wzxhzdk:(\d+)\x03')
+    RE_TAG = re.compile(r'<[^>]*>')
+
+    def run(self, root: etree.Element):
+        self.used_slugs_on_page = set()
+        self.headings_on_page = []
+        self.intro_text_parts = []
+        self.current_text_parts = self.intro_text_parts
+        self.process_children(root)
+        self.intro_text_on_page = self.get_body_text(self.intro_text_parts)
+        for heading in self.headings_on_page:
+            heading["body_text"] = self.get_body_text(heading["body_text"])
+
+    def process_children(self, element):
+        """walks the tree in document order, giving every heading its id and collecting
+        the text that follows it (up to the next heading) for the search index"""
+        for child in element:
+            if child.tag in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6'):
+                self.add_heading(child)
+            else:
+                if child.text:
+                    self.current_text_parts.append(child.text)
+                self.process_children(child)
+            if child.tail:
+                self.current_text_parts.append(child.tail)
+
+    def add_heading(self, element):
+        full_heading_text = "".join(element.itertext()).strip()
+        if full_heading_text:
+            base_slug = generate_slug(full_heading_text)
+            final_slug = base_slug
+            counter = 1
+            while final_slug in self.used_slugs_on_page:
+                final_slug = f"{base_slug}-{counter}"
+                counter += 1
+            element.set('id', final_slug)
+            self.used_slugs_on_page.add(final_slug)
+            self.current_text_parts = []
+            self.headings_on_page.append({
+                "level": int(element.tag[1]),
+                "text": self.get_display_text(full_heading_text),
+                "id": final_slug,
+                "body_text": self.current_text_parts,
+            })
+
+    def get_body_text(self, text_parts):
+        """
+        Plain text of the body below a heading. Stashed html (code blocks, raw html) is left out,
+        only the prose is kept.
+        """
+        text = self.RE_HTML_PLACEHOLDER.sub(' ', ' '.join(text_parts))
+        if 'unescape' in self.md.treeprocessors:
+            text = self.md.treeprocessors['unescape'].unescape(text)
+        return ' '.join(html.unescape(text).split())
+
+    def get_display_text(self, heading_text):
+        """
+        The text of a heading at this stage still contains markdown's placeholders
+        (for raw html, entities and backslash escapes) and escaped inline code.
+        This turns it into the plain text a reader sees on the page.
+        Only the restored raw html loses its tags, a literal < or > in the heading stays.
+        """
+        raw_html_blocks = self.md.htmlStash.rawHtmlBlocks
+        def restore_raw_html(match):
+            index = int(match.group(1))
+            return self.RE_TAG.sub('', str(raw_html_blocks[index])) if index < len(raw_html_blocks) else ''
+        text = self.RE_HTML_PLACEHOLDER.sub(restore_raw_html, heading_text)
+        if 'unescape' in self.md.treeprocessors:
+            text = self.md.treeprocessors['unescape'].unescape(text)
+        return html.unescape(text).strip()
+
+class HeadingIdExtension(Extension):
+    """register the HeadingIdAdder treeprocessor with the Markdown parser.
+    """
+    def extendMarkdown(self, md):
+        md.treeprocessors.register(HeadingIdAdder(md), 'headingidadder', 15)
+        
+class AdmonitionProcessorCorrected(BlockProcessor):
+    """ parse custom github like alert blocks, which are special highlighted boxes for notes, warnings, tips, etc.
+    The syntax looks like:
+
+    :::note warning Custom Title
+    This is the content of the note.
+    It can span multiple lines.
+    :::
+    """
+    RE_START = re.compile(r'^\s*:::\s*([a-zA-Z0-9_-]+)(?:\s*(.*))?\s*$')
+    RE_END = re.compile(r'^\s*:::\s*$')
+
+    def test(self, parent, block):
+        return bool(self.RE_START.match(block.split('\n', 1)[0]))
+
+    def run(self, parent, blocks):
+        original_block = blocks.pop(0)
+        lines = original_block.split('\n')
+        first_line_match = self.RE_START.match(lines[0])
+        if not first_line_match:
+            blocks.insert(0, original_block)
+            return False
+
+        if first_line_match.group(2):
+            custom_title_str = first_line_match.group(2).strip()
+        else:
+            custom_title_str = ""
+
+
+        admon_type = first_line_match.group(1).lower()
+        if custom_title_str:
+            display_title = custom_title_str
+        elif admon_type == "details":
+            display_title = "details"
+        else:
+            display_title = admon_type.capitalize()
+                        
+        content_lines_raw = []
+        block_ended = False
+        remaining_lines_after_end_in_current_block = []
+
+        for i in range(1, len(lines)):
+            if self.RE_END.match(lines[i]):
+                block_ended = True
+                remaining_lines_after_end_in_current_block = lines[i+1:]
+                break
+            content_lines_raw.append(lines[i])
+        
+        if not block_ended:
+            while blocks:
+                next_block_chunk_from_parser = blocks.pop(0)
+                inner_lines_of_chunk = next_block_chunk_from_parser.split('\n')
+                processed_all_inner_lines = True
+                for j, line_in_chunk in enumerate(inner_lines_of_chunk):
+                    if self.RE_END.match(line_in_chunk):
+                        block_ended = True
+                        if j + 1 < len(inner_lines_of_chunk):
+                            blocks.insert(0, '\n'.join(inner_lines_of_chunk[j+1:]))
+                        processed_all_inner_lines = False
+                        break
+                    content_lines_raw.append(line_in_chunk)
+                if block_ended: break
+        
+        if not block_ended:
+            blocks.insert(0, original_block)
+            return False
+
+        parsed_content_for_md = '\n'.join(content_lines_raw)
+
+        if admon_type == "details":
+            el = etree.SubElement(parent, 'details')
+            el.set('class', f'admonition {admon_type}')
+            summary_el = etree.SubElement(el, 'summary')
+            summary_el.set('class', 'admonition-title')
+            summary_el.text = display_title
+            content_wrapper_el = etree.SubElement(el, 'div')
+        else:
+            el = etree.SubElement(parent, 'div')
+            el.set('class', f'admonition {admon_type}')
+            title_el = etree.SubElement(el, 'p')
+            title_el.set('class', 'admonition-title')
+            title_el.text = display_title
+            content_wrapper_el = etree.SubElement(el, 'div')
+        
+        if parsed_content_for_md.strip():
+            self.parser.parseBlocks(content_wrapper_el, [parsed_content_for_md])
+        
+        if remaining_lines_after_end_in_current_block:
+            blocks.insert(0, '\n'.join(remaining_lines_after_end_in_current_block))
+        return True
+
+class AdmonitionExtensionCorrected(Extension):
+    """register the AdmonitionProcessorCorrected block processor with the Markdown parser.
+    """
+    def extendMarkdown(self, md):
+        md.parser.blockprocessors.register(AdmonitionProcessorCorrected(md.parser), 'admonition_corrected', 105)
+
+class HighlightCache:
+    """
+    Least recently used cache of highlighted code blocks, {key: html}.
+    Docs repeat the same snippets across many pages (and builds), so running Pygments
+    once per distinct block saves most of the highlighting time.
+
+    At most max_entries blocks are kept, the least recently used ones are evicted first.
+    Entries added since the last take_new_entries() are tracked so that render workers
+    can send them back to the main process, which saves the cache (see build()).
+    dirty is set when an entry is added, save() does nothing while it is not.
+    """
+    def __init__(self, max_entries=HIGHLIGHT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.new_entries = {}
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        highlighted = self.entries.get(key)
+        if highlighted is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return highlighted
+
+    def put(self, key, highlighted):
+        self.new_entries[key] = highlighted
+        self.add(key, highlighted)
+
+    def add(self, key, highlighted):
+        self.dirty = True
+        self.entries[key] = highlighted
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def take_new_entries(self):
+        new_entries = self.new_entries
+        self.new_entries = {}
+        return new_entries
+
+    def merge(self, new_entries, hits, misses):
+        """adds the new entries and counts of a render worker"""
+        for key, highlighted in new_entries.items():
+            self.add(key, highlighted)
+        self.hits += hits
+        self.misses += misses
+
+    def clear(self):
+        """empties the cache and resets the counts"""
+        self.entries = collections.OrderedDict()
+        self.new_entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, cache_path):
+        """
+        Replaces the cache with the one saved by the previous build and resets the counts.
+        A missing or unreadable file, or one written for another version of Pygments, gives an empty cache.
+        """
+        self.clear()
+        self.dirty = False
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if (not isinstance(saved, dict) or saved.get('version') != HIGHLIGHT_CACHE_VERSION
+                or saved.get('pygments_version') != pygments.__version__):
+            return
+        for key, highlighted in saved.get('entries', []):
+            self.add(key, highlighted)
+        self.dirty = False
+
+    def save(self, cache_path):
+        """writes the cache to cache_path, unless nothing was added since it was loaded or last saved"""
+        if not self.dirty:
+            return
+        cache_path = Path(cache_path)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({
+                "version": HIGHLIGHT_CACHE_VERSION,
+                "pygments_version": pygments.__version__,
+                "entries": list(self.entries.items()),
+            }, ensure_ascii=False, indent=None))
+        self.dirty = False
+
+
+# one highlight cache per process, see CachedCodeHilite
+highlight_cache = HighlightCache()
+
+
+class CachedCodeHilite(CodeHilite):
+    """CodeHilite that looks the block up in highlight_cache before running Pygments.
+    The key covers everything hilite() depends on: the language, the code and the options.
+    """
+    def hilite(self, shebang=True):
+        cache_key = hash_text(json.dumps([
+            self.lang, self.src, shebang, self.guess_lang, self.use_pygments,
+            self.lang_prefix, self.pygments_formatter, self.options,
+        ], sort_keys=True, default=str))
+        highlighted = highlight_cache.get(cache_key)
+        if highlighted is None:
+            with build_profiler.stage('highlight code'):
+                try:
+                    highlighted = super().hilite(shebang)
+                except ImportError:
+                    # Pygments imports the lexer of a language the first time it is used.
+                    # Packaged builds only ship the lexers of common languages (see the nuitka options in main.py)
+                    print(f"Warning: no syntax highlighting available for '{self.lang}', showing it as plain text.")
+                    self.lang = 'text'
+                    highlighted = super().hilite(shebang)
+            highlight_cache.put(cache_key, highlighted)
+        return highlighted
+
+
+def with_cached_code_hilite(run):
+    """
+    Returns a copy of the run method of a fenced_code or codehilite processor that creates
+    a CachedCodeHilite wherever the original creates a CodeHilite. Both look CodeHilite up by
+    module level name, the copy gets its own globals so the markdown modules are left as they are.
+    """
+    run_globals = dict(run.__globals__, CodeHilite=CachedCodeHilite)
+    return types.FunctionType(run.__code__, run_globals, run.__name__, run.__defaults__, run.__closure__)
+
+
+class CachedFencedBlockPreprocessor(FencedBlockPreprocessor):
+    run = with_cached_code_hilite(FencedBlockPreprocessor.run)
+
+
+class CachedHiliteTreeprocessor(HiliteTreeprocessor):
+    run = with_cached_code_hilite(HiliteTreeprocessor.run)
+
+
+class CachedFencedCodeExtension(FencedCodeExtension):
+    """'fenced_code', highlighting through highlight_cache"""
+    def extendMarkdown(self, md):
+        md.registerExtension(self)
+        md.preprocessors.register(CachedFencedBlockPreprocessor(md, self.getConfigs()), 'fenced_code_block', 25)
+
+
+class CachedCodeHiliteExtension(CodeHiliteExtension):
+    """CodeHiliteExtension, highlighting through highlight_cache"""
+    def extendMarkdown(self, md):
+        hiliter = CachedHiliteTreeprocessor(md)
+        hiliter.config = self.getConfigs()
+        md.treeprocessors.register(hiliter, 'hilite', 30)
+        md.registerExtension(self)
+
+
+# one Markdown instance per process, see get_markdown_converter
+_markdown_converter = None
+
+
+def create_markdown_converter():
+    return markdown.Markdown(extensions=[
+        HeadingIdExtension(), 
+        AdmonitionExtensionCorrected(),
+        CachedFencedCodeExtension(),
+        CachedCodeHiliteExtension(css_class='codehilite', guess_lang=False, use_pygments=True),
+        'tables'
+    ])
+
+
+def get_markdown_converter():
+    """
+    Returns the Markdown converter of the current process, creating it on first use.
+    Setting up the parser and the extensions is costly, so it is done once
+    per process (or per render worker) instead of once per page.
+    """
+    global _markdown_converter
+    if _markdown_converter is None:
+        _markdown_converter = create_markdown_converter()
+    return _markdown_converter
+
+
+def convert_md_to_html(md_body_text):
+    """converts a md string to html. The shared converter is reset before every
+    page so nothing (e.g. stashed html, footnotes) leaks from one page to the next.
+    HeadingIdAdder keeps its own per page state.
+
+    Returns:
+        body_html: the converted html
+        headings: [{level, text, id, body_text}] for every heading of the page, in order
+        intro_text: plain text of the page before its first heading
+    """
+    md = get_markdown_converter()
+    md.reset()
+    body_html = md.convert(md_body_text)
+    heading_id_adder = md.treeprocessors['headingidadder']
+    return body_html, heading_id_adder.headings_on_page, heading_id_adder.intro_text_on_page
@@ -0,0 +1,279 @@
+// --- Search Worker (started by script.js) ---
+// Loads the sharded search index (see build_search_index in vai/main.py) and matches queries
+// off the main thread, so typing in the search box never waits for json parsing or matching.
+// script.js only renders the results it gets back.
+//
+// Messages from script.js:
+//     { type: 'init', indexUrl, sections }   sections: [{ title, url }] from the sidebar
+//     { type: 'search', id, query, limit }
+//     { type: 'cancel', id }                  drops every search older than id
+// Messages to script.js:
+//     { type: 'ready' } or { type: 'error', message }
+//     { type: 'results', id, results, total }  results is null for a dropped (stale) search
+
+let searchIndexUrl = null;
+let searchIndexMeta = null; // index.json of the sharded search index
+let searchShardNames = new Set();
+const searchShardRequests = {}; // shard name -> promise of {token: [entry ids]}
+const expandedSearchEntries = {};
+let searchSections = [];
+let latestSearchId = 0;
+
+async function fetchSearchIndex() {
+    try {
+        const response = await fetch(`${searchIndexUrl}index.json`);
+        if (!response.ok) {
+            self.postMessage({ type: 'error', message: `Failed to load search index: ${response.statusText}` });
+            return;
+        }
+        searchIndexMeta = await response.json();
+        searchShardNames = new Set(searchIndexMeta.shards);
+        self.postMessage({ type: 'ready' });
+    } catch (error) {
+        self.postMessage({ type: 'error', message: `Error fetching or parsing search index: ${error}` });
+    }
+}
+
+// Must tokenize the same way as tokenize_search_text in vai/main.py
+function tokenizeSearchText(text) {
+    return String(text).toLowerCase().match(/[\p{L}\p{N}_]+/gu) || [];
+}
+
+// Must match get_search_shard_name in vai/main.py
+function searchShardName(token) {
+    return Array.from(token).slice(0, searchIndexMeta.shard_prefix_length)
+        .map(c => /^[a-z0-9]$/.test(c) ? c : `_${c.codePointAt(0).toString(16)}_`)
+        .join('');
+}
+
+function searchShardNamesFor(queryToken) {
+    const shardName = searchShardName(queryToken);
+    if (Array.from(queryToken).length >= searchIndexMeta.shard_prefix_length) {
+        return searchShardNames.has(shardName) ? [shardName] : [];
+    }
+    // a token shorter than the shard prefix can continue in any shard starting with it
+    return searchIndexMeta.shards.filter(name => name.startsWith(shardName));
+}
+
+function loadSearchShard(shardName) {
+    if (!searchShardRequests[shardName]) {
+        searchShardRequests[shardName] = fetch(`${searchIndexUrl}${shardName}.json`)
+            .then(response => response.ok ? response.json() : {})
+            .catch(error => {
+                console.error('Error loading search shard:', shardName, error);
+                delete searchShardRequests[shardName];
+                return {};
+            });
+    }
+    return searchShardRequests[shardName];
+}
+
+// A query word that is only a prefix of a token (still being typed) scores a bit less than an exact match
+const SEARCH_PREFIX_MATCH_FACTOR = 0.8;
+
+// entry id -> relevance for the entries containing every word of the query (the words are matched
+// as prefixes). Only the postings of the matching tokens are visited, scores are BM25F from the build.
+// null if a newer search came in while the shards were loading.
+async function findMatchingEntries(lowerQuery, searchId) {
+    const queryTokens = tokenizeSearchText(lowerQuery);
+    if (queryTokens.length === 0) return new Map();
+
+    const shardsPerToken = await Promise.all(
+        queryTokens.map(queryToken => Promise.all(searchShardNamesFor(queryToken).map(loadSearchShard)))
+    );
+    if (searchId !== latestSearchId) return null;
+
+    let matchingEntries = null;
+    queryTokens.forEach((queryToken, index) => {
+        // best scoring token of the entry for this query word
+        const tokenScores = new Map();
+        shardsPerToken[index].forEach(shard => {
+            for (const token in shard) {
+                if (!token.startsWith(queryToken)) continue;
+                const factor = token === queryToken ? 1 : SEARCH_PREFIX_MATCH_FACTOR;
+                const postings = shard[token];
+                for (let i = 0; i < postings.length; i += 2) {
+                    const score = postings[i + 1] * factor;
+                    if (score > (tokenScores.get(postings[i]) || 0)) tokenScores.set(postings[i], score);
+                }
+            }
+        });
+        if (matchingEntries === null) {
+            matchingEntries = tokenScores;
+            return;
+        }
+        const combined = new Map();
+        matchingEntries.forEach((score, entryId) => {
+            if (tokenScores.has(entryId)) combined.set(entryId, score + tokenScores.get(entryId));
+        });
+        matchingEntries = combined;
+    });
+    return matchingEntries;
+}
+
+// rebuilds the full entry (titles, breadcrumbs, url) from the compact tables of index.json
+function expandSearchEntry(entryId) {
+    if (expandedSearchEntries[entryId]) return expandedSearchEntries[entryId];
+    const entry = searchIndexMeta.entries[entryId];
+    const [pageTitle, pageBreadcrumbs, pageUrl] = searchIndexMeta.pages[entry[0]];
+    let expanded;
+    if (entry.length === 1) {
+        expanded = { type: 'page', page_title: pageTitle, display_title: pageTitle, breadcrumbs: pageBreadcrumbs, url: pageUrl };
+    } else {
+        const [, headingText, headingLevel, anchor, parentEntryId] = entry;
+        const parentHeadings = [];
+        for (let parentId = parentEntryId; parentId !== -1; parentId = searchIndexMeta.entries[parentId][4]) {
+            parentHeadings.unshift(searchIndexMeta.entries[parentId][1]);
+        }
+        expanded = {
+            type: 'heading',
+            page_title: pageTitle,
+            heading_text: headingText,
+            heading_level: headingLevel,
+            display_title: `${pageTitle} » ${headingText}`,
+            breadcrumbs: [pageBreadcrumbs, ...parentHeadings, headingText].join(' » '),
+            url: `${pageUrl}#${anchor}`,
+        };
+    }
+    expandedSearchEntries[entryId] = expanded;
+    return expanded;
+}
+
+// the text of the index is plain text (a heading can be "List<int>"), it is escaped before it goes into innerHTML
+function escapeHtml(text) {
+    return String(text).replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;').replace(/"/g, '&quot;');
+}
+
+// escapes text and wraps the first match of the query in <mark>
+function highlightText(text, query) {
+    if (!text || !query || query.trim().length < 1) return escapeHtml(text || "");
+
+    const trimmedQuery = query.trim();
+    const originalText = String(text); // Work with original casing for output
+    const lowerText = originalText.toLowerCase();
+    const lowerQuery = trimmedQuery.toLowerCase();
+
+    if (lowerQuery.length === 0) return escapeHtml(originalText);
+
+    const startIndex = lowerText.indexOf(lowerQuery);
+
+    if (startIndex === -1) {
+        return escapeHtml(originalText);
+    }
+
+    let resultHTML = escapeHtml(originalText.substring(0, startIndex)) +
+                     "<mark>" + escapeHtml(originalText.substring(startIndex, startIndex + trimmedQuery.length)) + "</mark>" +
+                     escapeHtml(originalText.substring(startIndex + trimmedQuery.length));
+
+    return resultHTML;
+}
+
+function generateSimpleSnippet(fullText, lowerQuery, originalQuery, maxLength = 150) {
+    if (!fullText || !originalQuery) return "Preview not available.";
+    const S_fullText = String(fullText); // Ensure it's a string
+    const S_lowerQuery = String(lowerQuery || "").toLowerCase();
+
+    if (S_lowerQuery.length === 0) {
+         return highlightText(S_fullText.substring(0, maxLength) + (S_fullText.length > maxLength ? "..." : ""), originalQuery);
+    }
+
+    const lowerFullText = S_fullText.toLowerCase();
+    let matchStartIndex = lowerFullText.indexOf(S_lowerQuery);
+
+    if (matchStartIndex === -1) {
+        return highlightText(S_fullText.substring(0, maxLength) + (S_fullText.length > maxLength ? "..." : ""), originalQuery);
+    }
+
+    const queryActualLength = S_lowerQuery.length; // Use length of lowerQuery for calculations
+    const snippetRadius = Math.floor((maxLength - queryActualLength) / 2);
+    let snippetStart = Math.max(0, matchStartIndex - snippetRadius);
+    let snippetEnd = Math.min(S_fullText.length, matchStartIndex + queryActualLength + snippetRadius);
+
+    if (snippetStart > 0) {
+        const spaceBefore = lowerFullText.lastIndexOf(" ", snippetStart -1);
+        if (spaceBefore !== -1 && spaceBefore > snippetStart - 30) snippetStart = spaceBefore + 1;
+    }
+    if (snippetEnd < S_fullText.length) {
+        const spaceAfter = lowerFullText.indexOf(" ", snippetEnd);
+        if (spaceAfter !== -1 && spaceAfter < snippetEnd + 30) snippetEnd = spaceAfter;
+    }
+
+    let snippetText = S_fullText.substring(snippetStart, snippetEnd);
+    // Highlight using originalQuery to preserve its casing in the mark tag
+    let highlightedSnippet = highlightText(snippetText, originalQuery);
+
+    return (snippetStart > 0 ? "..." : "") + highlightedSnippet + (snippetEnd < S_fullText.length ? "..." : "");
+}
+
+// every result for the query, highest relevance first (sections always lead). The *Html
+// fields are escaped and ready for innerHTML, with the query highlighted. null if the search was dropped.
+async function collectSearchResults(trimmedQuery, searchId) {
+    const lowerQuery = trimmedQuery.toLowerCase();
+    let potentialResults = {};
+
+    if (lowerQuery.length > 0) {
+        searchSections.forEach(section => {
+            if (section.title.toLowerCase().startsWith(lowerQuery) && !potentialResults[section.url]) {
+                const breadcrumbs = `Section: ${section.title}`;
+                potentialResults[section.url] = {
+                    type: 'section',
+                    url: section.url,
+                    titleHtml: highlightText(`Go to section: ${section.title}`, trimmedQuery),
+                    breadcrumbs: breadcrumbs,
+                    breadcrumbsHtml: highlightText(breadcrumbs, trimmedQuery),
+                    snippetHtml: `Access all content within the '${escapeHtml(section.title)}' section.`,
+                    score: Infinity,
+                };
+            }
+        });
+    }
+
+    const matchingEntries = await findMatchingEntries(lowerQuery, searchId);
+    if (matchingEntries === null) return null;
+    matchingEntries.forEach((score, entryId) => {
+        const item = expandSearchEntry(entryId);
+        if (!potentialResults[item.url] || score > potentialResults[item.url].score) {
+            let snippetSource = item.display_title;
+            if (item.type === 'heading' && item.heading_text && String(item.heading_text).toLowerCase().includes(lowerQuery)) {
+                snippetSource = item.heading_text;
+            } else if (item.type === 'page' && item.page_title && String(item.page_title).toLowerCase().includes(lowerQuery)) {
+                snippetSource = item.page_title;
+            } else if (item.breadcrumbs && String(item.breadcrumbs).toLowerCase().includes(lowerQuery)) {
+                 snippetSource = item.breadcrumbs;
+            }
+
+            potentialResults[item.url] = {
+                type: item.type,
+                url: item.url,
+                titleHtml: highlightText(item.display_title, trimmedQuery),
+                breadcrumbs: item.breadcrumbs, // shown as text
+                snippetHtml: generateSimpleSnippet(snippetSource, lowerQuery, trimmedQuery),
+                score: score,
+            };
+        }
+    });
+
+    const allDisplayItems = Object.values(potentialResults);
+    allDisplayItems.sort((a, b) => b.score - a.score);
+    return allDisplayItems;
+}
+
+self.addEventListener('message', async (event) => {
+    const message = event.data;
+    if (message.type === 'init') {
+        searchIndexUrl = message.indexUrl;
+        searchSections = message.sections || [];
+        fetchSearchIndex();
+    } else if (message.type === 'cancel') {
+        latestSearchId = Math.max(latestSearchId, message.id);
+    } else if (message.type === 'search') {
+        latestSearchId = Math.max(latestSearchId, message.id);
+        const results = searchIndexMeta ? await collectSearchResults(message.query.trim(), message.id) : [];
+        self.postMessage({
+            type: 'results',
+            id: message.id,
+            results: results && results.slice(0, message.limit),
+            total: results ? results.length : 0,
+        });
+    }
+});
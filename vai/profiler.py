@@ -0,0 +1,130 @@
+"""
+Build profiler for vai build --profile.
+
+The stages of a build are wrapped in build_profiler.stage(name). While the profiler is
+disabled (every build without --profile) a stage does nothing but call the wrapped code.
+It lives in its own module so that vai.main (which may run as __main__) and
+vai.markdown_converter record into the same profiler.
+"""
+import contextlib
+import json
+import os
+import time
+
+
+class BuildProfiler:
+    """
+    Records the wall time of every stage of a build:
+
+        events: [name, start, duration, pid, page] in seconds of time.perf_counter.
+                page is the md file being rendered, for the stages of a page
+
+    Render workers of a parallel build (-j) record into their own profiler, their events are
+    sent back with every page and added here (see take_events/add_events). perf_counter is a
+    system wide clock, so the events of all processes share one timeline.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.start = None
+        self.events = []
+        self.current_page = None
+
+    def enable(self):
+        self.enabled = True
+        self.start = time.perf_counter()
+        self.events = []
+
+    @contextlib.contextmanager
+    def stage(self, name, page=None):
+        """times the code inside the with block as stage name. With page, the nested stages belong to that page"""
+        if not self.enabled:
+            yield
+            return
+        outer_page = self.current_page
+        if page is not None:
+            self.current_page = page
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.events.append([name, start, time.perf_counter() - start, os.getpid(), self.current_page])
+            self.current_page = outer_page
+
+    def take_events(self):
+        events = self.events
+        self.events = []
+        return events
+
+    def add_events(self, events):
+        self.events.extend(events)
+
+    def get_stage_summary(self):
+        """{stage: {calls, total, max}} in seconds, slowest first"""
+        stages = {}
+        for name, _, duration, _, _ in self.events:
+            stage = stages.setdefault(name, {"calls": 0, "total": 0.0, "max": 0.0})
+            stage["calls"] += 1
+            stage["total"] += duration
+            stage["max"] = max(stage["max"], duration)
+        return dict(sorted(stages.items(), key=lambda item: -item[1]["total"]))
+
+    def get_page_summary(self):
+        """{page: {stage: seconds}} with the whole page as "page", slowest first"""
+        pages = {}
+        for name, _, duration, _, page in self.events:
+            if page is not None:
+                page_stages = pages.setdefault(page, {})
+                page_stages[name] = page_stages.get(name, 0.0) + duration
+        return dict(sorted(pages.items(), key=lambda item: -item[1].get("page", 0.0)))
+
+    def print_summary(self, slowest_pages=10):
+        stages = self.get_stage_summary()
+        if not stages:
+            return
+        print("\nBuild profile (wall time, nested stages are part of the stage around them)")
+        print(f"{'stage':<24}{'calls':>8}{'total ms':>12}{'mean ms':>10}{'max ms':>10}")
+        for name, stage in stages.items():
+            print(
+                f"{name:<24}{stage['calls']:>8}{stage['total'] * 1000:>12.1f}"
+                f"{stage['total'] * 1000 / stage['calls']:>10.2f}{stage['max'] * 1000:>10.2f}"
+            )
+
+        pages = self.get_page_summary()
+        if not pages:
+            return
+        page_stages = [name for name in stages if name != "page" and any(name in page for page in pages.values())]
+        print(f"\nSlowest pages ({min(slowest_pages, len(pages))} of {len(pages)}, ms)")
+        print(f"{'total':>9}" + "".join(f"{name:>18}" for name in page_stages) + "  page")
+        for page, page_stage_times in list(pages.items())[:slowest_pages]:
+            print(
+                f"{page_stage_times.get('page', 0.0) * 1000:>9.1f}"
+                + "".join(f"{page_stage_times.get(name, 0.0) * 1000:>18.1f}" for name in page_stages)
+                + f"  {page}"
+            )
+
+    def write(self, output_path):
+        """
+        Writes the profile as json in the Chrome trace format, so it opens in chrome://tracing
+        or ui.perfetto.dev. The stage and page summaries are added as "stages" and "pages",
+        which trace viewers ignore.
+        """
+        trace_events = []
+        for name, start, duration, pid, page in self.events:
+            trace_event = {
+                "name": name, "cat": "build", "ph": "X", "pid": pid, "tid": pid,
+                "ts": round((start - self.start) * 1e6, 1), "dur": round(duration * 1e6, 1),
+            }
+            if page is not None:
+                trace_event["args"] = {"page": page}
+            trace_events.append(trace_event)
+        profile = {
+            "traceEvents": trace_events,
+            "displayTimeUnit": "ms",
+            "stages": self.get_stage_summary(),
+            "pages": self.get_page_summary(),
+        }
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(profile, ensure_ascii=False, indent=None))
+
+
+build_profiler = BuildProfiler()
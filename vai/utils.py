@@ -0,0 +1,28 @@
+"""
+Small text helpers shared by vai.main and vai.markdown_converter.
+
+They live in their own module so that vai.markdown_converter doesn't have to import
+vai.main (which may run as __main__, and imports vai.markdown_converter itself).
+"""
+import hashlib
+import re
+
+
+def generate_slug(text_to_slugify):
+    """
+    Converts text to URL-friendly text
+
+    Example:
+        My Awesome Title!" -> "my-awesome-title"
+    """
+    text = str(text_to_slugify).lower()
+    text = re.sub(r'[^\w\s-]', '', text)
+    text = re.sub(r'\s+', '-', text)
+    text = re.sub(r'-+', '-', text)
+    text = text.strip('-')
+    return text
+
+
+def hash_text(text):
+    """Returns a sha256 hex digest of a string. Used for the build manifest."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()